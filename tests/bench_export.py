@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+"""Benchmark for the streaming track writers
+
+Run directly: python tests/bench_export.py [hours]
+
+A synthetic flight sampled at 4 Hz is written with each writer in
+chunks of 10 minutes, as APIFlight.iter_track would deliver it. The
+elapsed time, throughput, and growth in peak memory are reported.
+"""
+
+import os
+import sys
+import time
+import datetime
+import decimal
+import math
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wiflight
+from wiflight.flight import APIFlightTrackPoint
+
+RATE = 4
+WINDOW = 600
+
+def synthetic_chunks(hours):
+    D = decimal.Decimal
+    for offset in xrange(0, int(hours * 3600), WINDOW):
+        chunk = []
+        for i in xrange(WINDOW * RATE):
+            t = offset + float(i) / RATE
+            chunk.append(APIFlightTrackPoint((
+                D('%.2f' % t), D('%.3f' % (300 + 50 * math.sin(t / 300))),
+                D('%.3f' % (400 + 50 * math.sin(t / 300))), D('1.0'),
+                D('55.5'), D('%.6f' % ((t / 100) % (2 * math.pi))),
+                D('%.8f' % (45 + 0.01 * math.sin(t / 100))),
+                D('%.8f' % (-73 + 0.01 * math.cos(t / 100))),
+                D('2400'), D('0.5'),
+            )))
+        yield chunk
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    start = datetime.datetime(2014, 1, 1)
+    writers = [
+        ('gpx', lambda f: wiflight.GPXWriter(f, start)),
+        ('kml', lambda f: wiflight.KMLWriter(f)),
+        ('kmz', lambda f: wiflight.KMZWriter(f)),
+        ('csv', lambda f: wiflight.CSVWriter(f)),
+        ('columnar', lambda f: wiflight.ColumnarWriter(f)),
+    ]
+    # Generating the points is not part of the measurement
+    chunks = list(synthetic_chunks(hours))
+    npoints = sum(len(c) for c in chunks)
+    print "%d points (%.1f h at %d Hz)" % (npoints, hours, RATE)
+    for name, make in writers:
+        with open(os.devnull, 'wb') as f:
+            rss0 = maxrss()
+            t0 = time.time()
+            writer = make(f)
+            for chunk in chunks:
+                writer.write(chunk)
+            writer.close()
+            elapsed = time.time() - t0
+        print "%-9s %7.2f s %9.0f points/s  peak RSS growth %d kB" % (
+            name, elapsed, npoints / elapsed, maxrss() - rss0
+        )
+
+if __name__ == '__main__':
+    main()
@@ -204,6 +204,28 @@ class MockClient(object):
                     />
                 </flight>
             """),
+            'a/flight/68/track?length=600': (0, "text/xml",
+                """<?xml version="1.0" encoding="UTF-8"?>
+                <flight length="1500.0" start="20131201T000000Z">
+                    <point alt="0.0" lat="45.0" lon="-73.0" t="0.0"/>
+                    <point alt="300.0" lat="45.0" lon="-73.0" t="300.0"/>
+                    <point alt="600.0" lat="45.0" lon="-73.0" t="600.0"/>
+                </flight>
+            """),
+            'a/flight/68/track?offset=600&length=600': (0, "text/xml",
+                """<?xml version="1.0" encoding="UTF-8"?>
+                <flight length="1500.0" start="20131201T000000Z">
+                    <point alt="600.0" lat="45.0" lon="-73.0" t="600.0"/>
+                    <point alt="900.0" lat="45.0" lon="-73.0" t="900.0"/>
+                </flight>
+            """),
+            'a/flight/68/track?offset=1200&length=600': (0, "text/xml",
+                """<?xml version="1.0" encoding="UTF-8"?>
+                <flight length="1500.0" start="20131201T000000Z">
+                    <point alt="1200.0" lat="45.0" lon="-73.0" t="1200.0"/>
+                    <point alt="1500.0" lat="45.0" lon="-73.0" t="1500.0"/>
+                </flight>
+            """),
             'a/crewdb/user%40example.com/fleet1': (0, "text/xml",
                 """<?xml version="1.0" encoding="UTF-8"?>
                 <user>
@@ -273,10 +295,12 @@ class MockClient(object):
             """),
         }
 
-    def request(self, url, method, data=None, content_type="text/xml", etag=AnyEtag):
+    def request(self, url, method, data=None, content_type="text/xml", etag=AnyEtag, if_none_match=None):
         if method == 'GET':
             if url in self.contents:
                 d = self.contents[url]
+                if if_none_match is not None and if_none_match == d[0]:
+                    raise wiflight.HTTPError(url, 304, 'Not modified')
                 return d[1], d[0], d[2]
             else:
                 raise wiflight.HTTPError(url, 404, 'Not found')
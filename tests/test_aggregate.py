@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import os
+import shutil
+import tempfile
+
+import server
+
+def _day_search(day, flights):
+    url = 'a/flight/?start=%sT000000Z&end=%sT000000Z&events=30..39%%2C..' % (
+        day.strftime('%Y%m%d'), (day + datetime.timedelta(days=1)).strftime('%Y%m%d')
+    )
+    body = ['<?xml version="1.0" encoding="UTF-8"?><list>']
+    for flight_id, start, tail, counts in flights:
+        body.append(
+            '<flight id="%d"><start>%s</start><aircraft id="1"><tail>%s</tail></aircraft>'
+            '<event_counts>%s</event_counts></flight>' % (
+                flight_id, start, tail,
+                ''.join('<count>%d</count>' % (c,) for c in counts)
+            )
+        )
+    body.append('</list>')
+    return url, (0, "text/xml", ''.join(body))
+
+class WiFlightEventCountAggregatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        for day, flights in [
+            (datetime.date(2014,6,1), [
+                (1, '20140601T100000Z', 'C-FFSK', [1, 4]),
+                (2, '20140601T230000Z', 'C-FFSL', [0, 2]),
+            ]),
+            (datetime.date(2014,6,2), [
+                # Started the previous day, already counted there
+                (2, '20140601T230000Z', 'C-FFSL', [0, 2]),
+                (3, '20140602T120000Z', 'C-FFSK', [2, 3]),
+            ]),
+        ]:
+            url, doc = _day_search(day, flights)
+            self.client.contents[url] = doc
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_event_counts(self):
+        url, doc = _day_search(datetime.date(2014,6,1), [])
+        s = wiflight.APIFlightSearch(
+            start=datetime.datetime(2014,6,1), end=datetime.datetime(2014,6,2),
+            events="30..39,.."
+        )
+        self.assertEqual(s.url, url)
+        s.load(self.client)
+        self.assertEqual([f.event_counts for f in s], [[1, 4], [0, 2]])
+        flight = wiflight.APIFlight(3189)
+        flight.load(self.client)
+        self.assertIsNone(flight.event_counts)
+
+    def test_aggregate(self):
+        agg = wiflight.EventCountAggregator(["30..39", ".."])
+        agg.run(
+            [self.client, self.client],
+            datetime.date(2014,6,1), datetime.date(2014,6,3)
+        )
+        h = agg.histogram(('aircraft', 'band'))
+        self.assertEqual(h, {
+            ('C-FFSK', '30..39'): 3, ('C-FFSK', '..'): 7,
+            ('C-FFSL', '30..39'): 0, ('C-FFSL', '..'): 2,
+        })
+        self.assertEqual(
+            agg.histogram(('day',)),
+            { (datetime.date(2014,6,1),): 7, (datetime.date(2014,6,2),): 5 }
+        )
+        self.assertEqual(agg.flight_totals(('aircraft',)), { ('C-FFSK',): 2, ('C-FFSL',): 1 })
+        with self.assertRaises(ValueError):
+            agg.histogram(('nope',))
+
+    def test_resume(self):
+        path = os.path.join(self.tmpdir, 'counts.json')
+        agg = wiflight.EventCountAggregator(["30..39", ".."], path=path)
+        agg.run(
+            [self.client], datetime.date(2014,6,1), datetime.date(2014,6,3),
+            now=datetime.datetime(2014,6,3,12,0,0)
+        )
+        # Only the first day is old enough to be settled
+        self.assertEqual(agg.days, set([datetime.date(2014,6,1)]))
+        del self.client.contents[_day_search(datetime.date(2014,6,1), [])[0]]
+        agg = wiflight.EventCountAggregator(["30..39", ".."], path=path)
+        self.assertEqual(agg.histogram(('band',)), { ('30..39',): 3, ('..',): 9 })
+        # The settled day is not fetched again; the other one is refetched
+        agg.run([self.client], datetime.date(2014,6,1), datetime.date(2014,6,3))
+        self.assertEqual(agg.histogram(('band',)), { ('30..39',): 3, ('..',): 9 })
+        with self.assertRaises(ValueError):
+            wiflight.EventCountAggregator(["40.."], path=path)
+
+if __name__ == '__main__':
+    unittest.main()
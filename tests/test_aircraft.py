@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 import unittest
+import cPickle as pickle
 import wiflight
 import decimal
 import re
@@ -90,5 +91,110 @@ class WiFlightAPIAircraftImageTestCase(unittest.TestCase):
             (0, "image/png", black_1x1)
         )
 
+class WiFlightAircraftRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self.client.contents['a/aircraft/tail/C-FFSK'] = \
+            self.client.contents['a/aircraft/5']
+
+    def test_get(self):
+        registry = wiflight.AircraftRegistry(self.client)
+        ac = registry.get(5)
+        self.assertEqual(ac.tail, 'C-FFSK')
+        self.assertIs(registry.get(5), ac)
+        self.assertIs(registry.get('c-ffsk'), ac)
+        self.assertEqual(registry.resolve('C-FFSK'), 5)
+        self.assertRaises(KeyError, registry.get, 999)
+        self.assertRaises(KeyError, registry.resolve, 'C-NONE')
+        self.assertEqual(len(registry), 1)
+
+    def test_read_only(self):
+        ac = wiflight.AircraftRegistry(self.client).get(5)
+        with self.assertRaises(AttributeError):
+            ac.tail = 'C-XXXX'
+        with self.assertRaises(AttributeError):
+            ac.load(self.client)
+        with self.assertRaises(AttributeError):
+            ac.save(self.client)
+        self.assertTrue(isinstance(ac.groups, frozenset))
+        with self.assertRaises(AttributeError):
+            ac.groups.add('g')
+        # Can still be used to set the aircraft of another object
+        r = wiflight.APIReservation('x')
+        r.aircraft = ac
+        self.assertEqual(r.aircraft.tail, 'C-FFSK')
+
+    def test_lookup_tail(self):
+        registry = wiflight.AircraftRegistry(self.client)
+        self.assertEqual(registry.get('C-FFSK').id, 5)
+        self.assertIs(registry.get(5), registry.get('C-FFSK'))
+
+    def test_without_client(self):
+        registry = wiflight.AircraftRegistry()
+        self.assertRaises(KeyError, registry.get, 5)
+        flight = wiflight.APIFlight(3189)
+        flight.load(self.client)
+        ac = registry.aircraft_of(flight)
+        self.assertEqual(ac.model, 'Cessna 172N')
+        self.assertIs(registry.get('C-FFSK'), ac)
+        registry.forget(5)
+        self.assertRaises(KeyError, registry.get, 'C-FFSK')
+
+    def test_iter_shared(self):
+        s = wiflight.APIAircraftSearch("filter words n&&d encoding")
+        s.load(self.client)
+        registry = wiflight.AircraftRegistry()
+        self.assertEqual([a.tail for a in registry.iter_shared(s)], ['C-FFSK', 'C-FFSL'])
+        search = wiflight.APIFlightSearch(kw="x")
+        search._set_response("text/xml", None, """<list>
+            <flight id="1"><aircraft id="5"><tail>C-FFSK</tail><model>C172</model></aircraft><headline>a</headline></flight>
+            <flight id="2"><aircraft id="5"><tail>C-FFSK</tail><model>C172</model></aircraft><headline>b</headline></flight>
+            <flight id="3"><headline>c</headline></flight>
+        </list>""")
+        registry = wiflight.AircraftRegistry()
+        flights = list(registry.iter_shared(search))
+        self.assertEqual([f.headline for f in flights], ['a', 'b', 'c'])
+        self.assertEqual(flights[0].body.findtext('aircraft/tail'), 'C-FFSK')
+        self.assertEqual(flights[0].body.findtext('aircraft/model'), None)
+        self.assertEqual([x.tag for x in flights[0].body], ['aircraft', 'headline'])
+        self.assertEqual(flights[0].aircraft.id, 5)
+        self.assertTrue(isinstance(flights[0], wiflight.APIFlight))
+        self.assertIs(flights[0].aircraft, flights[1].aircraft)
+        self.assertEqual(flights[0].aircraft.model, 'C172')
+        self.assertIs(registry.aircraft_of(flights[0]), registry.aircraft_of(flights[1]))
+        self.assertEqual(registry.aircraft_of(flights[1]).model, 'C172')
+        self.assertIs(registry.aircraft_of(flights[2]), None)
+        # The search itself is unchanged
+        self.assertEqual(search.body.findtext('flight/aircraft/model'), 'C172')
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(type(flights[0]), wiflight.APIFlight)
+        # Flights and their registry can be pickled together
+        copies = pickle.loads(pickle.dumps(flights, 2))
+        self.assertEqual([f.headline for f in copies], ['a', 'b', 'c'])
+        self.assertIs(copies[0].aircraft, copies[1].aircraft)
+        self.assertEqual(copies[0].aircraft.model, 'C172')
+        self.assertIsNot(copies[0].aircraft, flights[0].aircraft)
+        with self.assertRaises(AttributeError):
+            copies[0].aircraft.tail = 'C-XXXX'
+        self.assertEqual(len(copies[2].events), 0)
+
+    def test_attach(self):
+        registry = wiflight.AircraftRegistry(self.client)
+        flight = wiflight.APIFlight(3189)
+        flight.load(self.client)
+        registry.attach(flight)
+        self.assertIsNone(flight.body.findtext('aircraft/model'))
+        self.assertIs(flight.aircraft, registry.get(5))
+        self.assertIs(flight.aircraft, flight.aircraft)
+        self.assertEqual(flight.aircraft.model, 'Cessna 172N')
+        # Setting the aircraft keeps the object thin
+        r = wiflight.APIReservation('x')
+        registry.attach(r)
+        self.assertIsNone(r.aircraft)
+        r.aircraft = flight.aircraft
+        self.assertEqual(r.body.find('aircraft').get('id'), '5')
+        self.assertIsNone(r.body.findtext('aircraft/model'))
+        self.assertIs(r.aircraft, flight.aircraft)
+
 if __name__ == '__main__':
     unittest.main()
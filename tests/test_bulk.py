@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import cPickle as pickle
+
+from wiflight.bulk import decode_flight_search, decode_track
+
+import server
+
+class WiFlightBulkDecodeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+
+    def _flight_list(self, *urls):
+        # Make a search-like response out of individual flight documents
+        bodies = [
+            self.client.contents[u][2].split('?>', 1)[1] for u in urls
+        ]
+        return '<?xml version="1.0" encoding="UTF-8"?><list>%s</list>' % (''.join(bodies),)
+
+    def test_decode_flight_search(self):
+        body = self._flight_list('a/flight/3189/', 'a/flight/62/')
+        r = decode_flight_search(body)
+        self.assertEqual([s.id for s in r], [3189, 62])
+        s = r[0]
+        self.assertEqual(s.start, datetime.datetime(2010,6,26,23,36,33))
+        self.assertEqual(s.headline, 'local at SWF')
+        self.assertEqual(s.aircraft_id, 5)
+        self.assertEqual(s.aircraft_tail, 'C-FFSK')
+        self.assertEqual(s.engine_ontime, 7139.5)
+        self.assertEqual(s.gs_max, 61.218)
+        self.assertIsNone(r[1].start)
+        self.assertIsNone(r[1].aircraft_tail)
+
+    def test_decode_track(self):
+        index = decode_track(self.client.contents['a/flight/67/track'][2])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.nearest(0).rpm, 3053.0)
+
+    def test_pickle(self):
+        r = decode_flight_search(self._flight_list('a/flight/3189/'))
+        self.assertEqual(pickle.loads(pickle.dumps(r, 2)), r)
+        self.assertEqual(pickle.loads(pickle.dumps(r, 2))[0].id, 3189)
+        index = decode_track(self.client.contents['a/flight/67/track'][2])
+        self.assertEqual(list(pickle.loads(pickle.dumps(index, 2)).times), [900.0])
+
+    def test_parallel(self):
+        searches = [wiflight.APIFlightSearch(kw="123")] * 3
+        tracks = [wiflight.APIFlight(67).track()] * 2
+        with wiflight.ParallelDecoder(processes=2, backlog=1) as decoder:
+            r = list(decoder.load_searches(self.client, searches))
+            self.assertEqual([[s.headline for s in x] for x in r], [['1', '2']] * 3)
+            r = list(decoder.load_tracks(self.client, tracks))
+            self.assertEqual([len(x) for x in r], [1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
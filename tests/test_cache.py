@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+
+import server
+
+class CountingClient(server.MockClient):
+    def __init__(self):
+        server.MockClient.__init__(self)
+        self.requests = 0
+
+    def request(self, url, method, *args, **kwargs):
+        self.requests += 1
+        return server.MockClient.request(self, url, method, *args, **kwargs)
+
+class SharedCache(object):
+    """Same interface as memcache.Client"""
+    def __init__(self):
+        self.d = {}
+    def get(self, key):
+        return self.d.get(key)
+    def set(self, key, value, time=0):
+        self.d[key] = value
+    def delete(self, key):
+        self.d.pop(key, None)
+
+class WiFlightQueryKeyTestCase(unittest.TestCase):
+    def test_order(self):
+        a = wiflight.APIFlightSearch(kw="x", group=['a', 'b'], f=[2, 1], events=True)
+        b = wiflight.APIFlightSearch(events=True, f=[1, 2, 1], group=['b', 'a'], kw="x")
+        self.assertNotEqual(a.url, b.url)
+        self.assertEqual(wiflight.query_key(a), wiflight.query_key(b))
+        c = wiflight.APIFlightSearch(kw="y", group=['a', 'b'], f=[2, 1], events=True)
+        self.assertNotEqual(wiflight.query_key(a), wiflight.query_key(c))
+
+    def test_dates(self):
+        a = wiflight.APIFlightSearch(start=datetime.datetime(2014,2,1,0,0,0))
+        self.assertEqual(wiflight.query_key(a), 'a/flight/?start=20140201T000000Z')
+        for query_string in (
+            'start=2014-02-01', 'start=20140201T000000',
+            'start=2014-02-01T00:00:00Z', 'start=2014-01-31T19:00:00-05:00',
+            'start=20140201T053000%2B0530',
+        ):
+            b = wiflight.APIObject('a', 'flight', '', query_string=query_string)
+            self.assertEqual(wiflight.query_key(b), wiflight.query_key(a))
+        c = wiflight.APIObject('a', 'flight', '', query_string='start=yesterday')
+        self.assertEqual(wiflight.query_key(c), 'a/flight/?start=yesterday')
+
+    def test_no_query(self):
+        self.assertEqual(wiflight.query_key(wiflight.APIFlightSearch()), 'a/flight/')
+
+class WiFlightSearchCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = CountingClient()
+
+    def test_hit(self):
+        cache = wiflight.SearchCache()
+        s = wiflight.APIFlightSearch(kw="123")
+        self.assertFalse(cache.load(s, self.client))
+        s = wiflight.APIFlightSearch(kw="123")
+        self.assertTrue(cache.load(s, self.client))
+        self.assertEqual(self.client.requests, 1)
+        self.assertEqual([f.headline for f in s], ["1", "2"])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        s = wiflight.APIAircraftSearch("filter words n&&d encoding")
+        cache.load(s, self.client)
+        self.assertEqual(len(s), 2)
+        self.assertEqual(self.client.requests, 2)
+
+    def test_expiry(self):
+        cache = wiflight.SearchCache(ttl=-1)
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        self.assertEqual(self.client.requests, 2)
+
+    def test_max_entries(self):
+        cache = wiflight.SearchCache(max_entries=1)
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        cache.load(wiflight.APICrewDbSearch("example"), self.client)
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        self.assertEqual(self.client.requests, 3)
+
+    def test_invalidate(self):
+        cache = wiflight.SearchCache()
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        cache.invalidate(wiflight.APIFlightSearch(kw="123"))
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        cache.invalidate()
+        cache.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        self.assertEqual(self.client.requests, 3)
+
+    def test_shared(self):
+        shared = SharedCache()
+        cache1 = wiflight.SearchCache(shared=shared)
+        cache2 = wiflight.SearchCache(shared=shared)
+        cache1.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        s = wiflight.APIFlightSearch(kw="123")
+        self.assertTrue(cache2.load(s, self.client))
+        self.assertEqual(len(s), 2)
+        self.assertEqual(self.client.requests, 1)
+        cache1.invalidate()
+        cache3 = wiflight.SearchCache(shared=shared)
+        self.assertFalse(cache3.load(wiflight.APIFlightSearch(kw="123"), self.client))
+        cache1.invalidate(wiflight.APIFlightSearch(kw="123"))
+        self.assertFalse(cache1.load(wiflight.APIFlightSearch(kw="123"), self.client))
+        self.assertEqual(self.client.requests, 3)
+
+    def test_shared_expiry(self):
+        shared = SharedCache()
+        cache1 = wiflight.SearchCache(shared=shared)
+        cache1.load(wiflight.APIFlightSearch(kw="123"), self.client)
+        # Results stored long ago by another process have expired even
+        # if the shared cache still returns them
+        for k, v in shared.d.items():
+            if isinstance(v, tuple):
+                shared.d[k] = (v[0] - cache1.ttl - 1,) + v[1:]
+        cache2 = wiflight.SearchCache(shared=shared)
+        self.assertFalse(cache2.load(wiflight.APIFlightSearch(kw="123"), self.client))
+        self.assertEqual(self.client.requests, 2)
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import os
+import shutil
+import tempfile
+
+import server
+
+class WiFlightFlightCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self.catalog = wiflight.FlightCatalog()
+        for flight_id in (3189, 62, 63):
+            flight = wiflight.APIFlight(flight_id)
+            flight.load(self.client)
+            self.catalog.add(flight)
+
+    def _ids(self, **kwargs):
+        return [s.id for s in self.catalog.search(**kwargs)]
+
+    def test_get(self):
+        self.assertEqual(len(self.catalog), 3)
+        s = self.catalog.get(3189)
+        self.assertEqual(s.start, datetime.datetime(2010,6,26,23,36,33))
+        self.assertEqual(s.aircraft_tail, 'C-FFSK')
+        self.assertEqual(s.engine_ontime, 7139.5)
+        self.assertIsNone(self.catalog.get(1))
+
+    def test_keywords(self):
+        self.assertEqual(self._ids(kw="SWF"), [3189])
+        self.assertEqual(self._ids(kw="ffsk"), [3189, 63])
+        self.assertEqual(self._ids(kw="airspace R-5206"), [3189])
+        self.assertEqual(self._ids(kw="loc"), [3189])
+        self.assertEqual(self._ids(kw="nowhere"), [])
+
+    def test_attributes(self):
+        self.assertEqual(self._ids(group=['Demo flights']), [3189])
+        self.assertEqual(self._ids(group=['Demo flights', 'nope']), [])
+        self.assertEqual(self._ids(f=[62, 63]), [62, 63])
+        self.assertEqual(self._ids(missingaircraft=True), [62])
+        self.assertEqual(self._ids(
+            start=datetime.datetime(2010,6,27,1,0,0),
+            end=datetime.datetime(2010,6,27,2,0,0),
+        ), [3189])
+        self.assertEqual(self._ids(start=datetime.datetime(2010,6,27,2,0,0)), [])
+
+    def test_replace_and_remove(self):
+        flight = wiflight.APIFlight(63)
+        flight.load(self.client)
+        flight.headline = u'Cross-country to KTEB'
+        self.catalog.add(flight)
+        self.assertEqual(self._ids(kw="KTEB"), [63])
+        self.catalog.remove(63)
+        self.assertEqual(self._ids(kw="KTEB"), [])
+        self.assertEqual(len(self.catalog), 2)
+
+    def test_no_fts(self):
+        self.catalog.fts = False
+        self.assertEqual(self._ids(kw="ffsk"), [3189, 63])
+        self.assertEqual(self._ids(kw="airspace SWF"), [3189])
+        self.assertEqual(self._ids(kw="ffsk_"), [])
+
+    def test_operator_words(self):
+        self.assertEqual(self._ids(kw="SWF OR KTEB"), [])
+        self.assertEqual(self._ids(kw="NOT SWF"), [])
+        self.assertEqual(self._ids(kw='"SWF* NEAR'), [])
+        self.assertEqual(self._ids(kw='"SWF*'), [3189])
+
+    def test_many_ids(self):
+        self.assertEqual(self._ids(f=range(5000)), [3189, 62, 63])
+        self.assertEqual(self._ids(f=[62]), [62])
+
+    def test_fts_backfill(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'catalog.sqlite')
+            fts_available = wiflight.catalog._fts_available
+            wiflight.catalog._fts_available = lambda db: False
+            try:
+                catalog = wiflight.FlightCatalog(path)
+                flight = wiflight.APIFlight(3189)
+                flight.load(self.client)
+                catalog.add(flight)
+                catalog.close()
+            finally:
+                wiflight.catalog._fts_available = fts_available
+            catalog = wiflight.FlightCatalog(path)
+            self.assertTrue(catalog.fts)
+            self.assertEqual([s.id for s in catalog.search(kw="SWF")], [3189])
+            catalog.close()
+        finally:
+            shutil.rmtree(d)
+
+if __name__ == '__main__':
+    unittest.main()
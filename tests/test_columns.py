@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+
+try:
+    import numpy
+    import pandas
+except ImportError:
+    numpy = pandas = None
+
+import server
+
+@unittest.skipIf(pandas is None, "numpy and pandas are not installed")
+class WiFlightColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+
+    def _flight_search(self, *urls):
+        # Make a search-like response out of individual flight documents
+        bodies = [
+            self.client.contents[u][2].split('?>', 1)[1] for u in urls
+        ]
+        s = wiflight.APIFlightSearch()
+        s._set_response('text/xml', None,
+            '<?xml version="1.0" encoding="UTF-8"?><list>%s<flight/></list>' % (
+                ''.join(bodies),
+            )
+        )
+        return s
+
+    def test_flight_columns(self):
+        c = self._flight_search('a/flight/3189/', 'a/flight/62/').to_columns()
+        self.assertEqual(c.keys()[:5], ['id', 'start', 'headline', 'aircraft_id', 'aircraft_tail'])
+        self.assertEqual(list(c['id']), [3189, 62])
+        self.assertEqual(c['id'].dtype, numpy.int64)
+        self.assertEqual(c['start'][0], numpy.datetime64('2010-06-26T23:36:33'))
+        self.assertTrue(numpy.isnat(c['start'][1]))
+        self.assertEqual(list(c['headline']), [u'local at SWF', None])
+        self.assertEqual(c['aircraft_id'][0], 5.0)
+        self.assertTrue(numpy.isnan(c['aircraft_id'][1]))
+        self.assertEqual(c['aircraft_tail'][0], u'C-FFSK')
+        self.assertEqual(c['engine_ontime'].dtype, numpy.float64)
+        self.assertEqual(c['engine_ontime'][0], 7139.5)
+        self.assertEqual(c['gs_max'][0], 61.218)
+
+    def test_flight_dataframe(self):
+        df = self._flight_search('a/flight/3189/', 'a/flight/62/').to_dataframe(index='id')
+        self.assertEqual(list(df.index), [3189, 62])
+        self.assertEqual(
+            df.loc[3189, 'start'].to_pydatetime(),
+            datetime.datetime(2010,6,26,23,36,33)
+        )
+        self.assertEqual(df.loc[3189, 'engine_ontime'], 7139.5)
+
+    def test_empty(self):
+        c = wiflight.APIFlightSearch().to_columns()
+        self.assertEqual(len(c['id']), 0)
+        self.assertEqual(c['start'].dtype, numpy.dtype('datetime64[s]'))
+
+    def test_aircraft(self):
+        s = wiflight.APIAircraftSearch("filter words n&&d encoding")
+        s.load(self.client)
+        df = s.to_dataframe()
+        self.assertEqual(list(df['id']), [5, 6])
+        self.assertEqual(list(df['tail']), [u'C-FFSK', u'C-FFSL'])
+        self.assertEqual(list(df['cockpit_height']), [1.5, 1.6])
+        self.assertEqual(list(df['pressurized']), [False, False])
+
+    def test_crewdb(self):
+        s = wiflight.APICrewDbSearch("example")
+        s.load(self.client)
+        c = s.to_columns()
+        self.assertEqual(list(c['username']), [u'user@example.com'])
+        self.assertEqual(list(c['fleet']), [u'fleet1'])
+        self.assertEqual(list(c['useruuid']), [None])
+        self.assertEqual(list(c['signup_done']), [True])
+
+    def test_unsupported(self):
+        flight = wiflight.APIFlight(67)
+        track = wiflight.flight.APIFlightTrack(flight)
+        self.assertRaises(TypeError, track.to_columns)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -59,5 +59,93 @@ class WiFlightAPICrewDbTestCase(unittest.TestCase):
         first = iter(s).next()
         self.assertEqual(first.name, 'Kim Vandry')
 
+def _user(username, useruuid=None, phone='+1 514 907-0802', fleet='fleet1', name='Kim Vandry'):
+    return (
+        '<user><username>%s</username><email>%s</email><name>%s</name>'
+        '<phone>%s</phone><fleet>%s</fleet>%s</user>' % (
+            username, username, name, phone, fleet,
+            '' if useruuid is None else '<useruuid>%s</useruuid>' % (useruuid,)
+        )
+    )
+
+class WiFlightCrewDbReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self._set([
+            _user('a@example.com', 'uuid1'),
+            _user('b@example.com', 'uuid2', phone='514-555-0000'),
+            _user('c@example.com', fleet='fleet2'),
+        ])
+
+    def _set(self, users, etag=0):
+        self.client.contents['a/crewdb?q=example'] = (
+            etag, 'text/xml', '<crewdb_search>%s%s</crewdb_search>' % (
+                ''.join(users),
+                '<fleet dbdomain="fleet1-domain.example.com" name="fleet1"/>'
+            )
+        )
+
+    def test_lookup(self):
+        replica = wiflight.CrewDbReplica('fleet1', 'example')
+        self.assertEqual(
+            replica.refresh(self.client),
+            (['a@example.com', 'b@example.com'], [], [])
+        )
+        self.assertEqual(len(replica), 2)
+        self.assertIn('A@example.com', replica)
+        self.assertNotIn('c@example.com', replica)
+        self.assertEqual(replica.get('a@EXAMPLE.com').useruuid, 'uuid1')
+        self.assertEqual(replica.by_uuid('uuid2').username, 'b@example.com')
+        self.assertEqual(
+            [e.username for e in replica.by_email('B@example.com')], ['b@example.com']
+        )
+        self.assertEqual(
+            [e.username for e in replica.by_phone('(514) 555-0000')], ['b@example.com']
+        )
+        self.assertEqual(replica.by_phone('nothing'), [])
+        self.assertEqual(replica.fleet.temporary_username_domain, 'fleet1-domain.example.com')
+
+    def test_refresh(self):
+        replica = wiflight.CrewDbReplica('fleet1', 'example')
+        replica.refresh(self.client)
+        a = replica.get('a@example.com')
+        self.assertEqual(replica.refresh(self.client), ([], [], []))
+        self._set([
+            _user('a@example.com', 'uuid1'),
+            _user('b@example.com', 'uuid2', name='Changed'),
+            _user('d@example.com'),
+        ], etag=1)
+        self.assertEqual(
+            replica.refresh(self.client),
+            (['d@example.com'], ['b@example.com'], [])
+        )
+        self.assertIs(replica.get('a@example.com'), a)
+        self.assertEqual(replica.get('b@example.com').name, 'Changed')
+        self.assertEqual(replica.by_phone('514-555-0000'), [])
+        self._set([_user('d@example.com')], etag=2)
+        self.assertEqual(
+            replica.refresh(self.client),
+            ([], [], ['a@example.com', 'b@example.com'])
+        )
+        self.assertIs(replica.by_uuid('uuid1'), None)
+
+    def test_reservation(self):
+        replica = wiflight.CrewDbReplica('fleet1', 'example')
+        replica.refresh(self.client)
+        resv = wiflight.APIReservation('resv')
+        resv.crew_by_uuid.add('uuid2')
+        resv.crew.update(['a@example.com', 'x@example.com'])
+        entries = replica.crew_entries(resv)
+        self.assertEqual(entries['uuid2'].username, 'b@example.com')
+        self.assertEqual(entries['a@example.com'].useruuid, 'uuid1')
+        self.assertIs(entries['x@example.com'], None)
+        self.assertEqual(len(resv.crew_by_uuid), 1)
+        self.assertNotIn('uuid1', resv.crew_by_uuid)
+        self.assertEqual(replica.resolve_uuids(resv), ['x@example.com'])
+        self.assertItemsEqual(resv.crew_by_uuid, ['uuid1', 'uuid2'])
+        # The set read before is up to date
+        self.assertIn('uuid1', resv.crew_by_uuid)
+        self.assertEqual(len(resv.crew_by_uuid), 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import os
+import shutil
+import StringIO
+import tempfile
+import warnings
+
+import server
+
+CSV = """username,email,name,phone
+user@example.com,user@example.com,Kim Vandry,+1 514 907-0802
+Pilot1,pilot1@example.com,Pilot One,514-555-0001
+,Pilot2@Example.com,Pilot Two,
+older@example.com,,Changed Name,
+bad,not an email,,
+,,Nobody,
+"""
+
+class FailingClient(server.MockClient):
+    def __init__(self, fail):
+        server.MockClient.__init__(self)
+        self.fail = fail
+
+    def request(self, url, method, *args, **kwargs):
+        if method == 'PUT' and self.fail in url:
+            raise wiflight.HTTPError(url, 500, 'Internal error')
+        return server.MockClient.request(self, url, method, *args, **kwargs)
+
+class WiFlightCrewDbImporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _statuses(self, results):
+        return [(r.row_number, r.username, r.status) for r in results]
+
+    def test_import(self):
+        importer = wiflight.CrewDbImporter(
+            [self.client, self.client], 'fleet1', domain='Fleet1.example.com'
+        )
+        results = list(importer.import_csv(StringIO.StringIO(CSV)))
+        self.assertEqual(self._statuses(results), [
+            (1, 'user@example.com', 'unchanged'),
+            (2, 'pilot1@fleet1.example.com', 'created'),
+            (3, 'pilot2@example.com', 'created'),
+            (4, 'older@example.com', 'updated'),
+            (5, 'bad', 'invalid'),
+            (6, None, 'invalid'),
+        ])
+        self.assertEqual(results[4].error, "Invalid email u'not an email'")
+        u = wiflight.APICrewDbEntry('fleet1', 'pilot1@fleet1.example.com')
+        u.load(self.client)
+        self.assertEqual(u.email, 'pilot1@example.com')
+        self.assertEqual(u.name, 'Pilot One')
+        self.assertEqual(u.phone, '514-555-0001')
+        u = wiflight.APICrewDbEntry('fleet1', 'older@example.com')
+        u.load(self.client)
+        self.assertEqual(u.name, 'Changed Name')
+        self.assertEqual(u.email, 'older@example.com')
+        # Running again changes nothing
+        results = list(importer.import_csv(StringIO.StringIO(CSV)))
+        self.assertEqual(
+            [r.status for r in results],
+            ['unchanged'] * 4 + ['invalid'] * 2
+        )
+
+    def test_fleet_domain(self):
+        fleet = wiflight.crewdb.APIFleet('fleet1')
+        fleet.temporary_username_domain = 'fleet1-domain.example.com'
+        importer = wiflight.CrewDbImporter([self.client], fleet)
+        self.assertEqual(importer.normalize_username(' Bob '), 'bob@fleet1-domain.example.com')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            results = list(importer.run([{'username': 'x', 'colour': 'blue'}]))
+        self.assertEqual(results[0].username, 'x@fleet1-domain.example.com')
+        self.assertEqual(len(caught), 1)
+
+    def test_resume(self):
+        journal = os.path.join(self.dir, 'journal')
+        client = FailingClient('pilot2')
+        importer = wiflight.CrewDbImporter([client], 'fleet1', domain='fleet1.example.com', journal=journal)
+        results = list(importer.import_csv(StringIO.StringIO(CSV)))
+        self.assertEqual(
+            [r.status for r in results],
+            ['unchanged', 'created', 'failed', 'updated', 'invalid', 'invalid']
+        )
+        self.assertEqual(results[2].error.code, 500)
+        client.fail = 'nothing'
+        results = list(importer.import_csv(StringIO.StringIO(CSV)))
+        self.assertEqual(
+            [r.status for r in results],
+            ['done', 'done', 'created', 'done', 'invalid', 'invalid']
+        )
+
+    def test_unknown_columns(self):
+        importer = wiflight.CrewDbImporter([self.client], 'fleet1', domain='fleet1.example.com')
+        rows = 'Username,Notes,name\nPilot1,first,Pilot One\nPilot3,second,\n'
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            results = list(importer.import_csv(StringIO.StringIO(rows)))
+        self.assertEqual(
+            self._statuses(results),
+            [(1, 'pilot1@fleet1.example.com', 'created'),
+             (2, 'pilot3@fleet1.example.com', 'created')]
+        )
+        # Once for the header, not for every row
+        self.assertEqual(len(caught), 1)
+        self.assertIn('Notes', str(caught[0].message))
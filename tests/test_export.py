@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import decimal
+import math
+import os
+import zipfile
+import lxml.etree
+import cStringIO as StringIO
+
+from wiflight.export import read_columnar
+
+import server
+
+class WiFlightExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self.chunks = list(
+            wiflight.APIFlight(68).iter_track(self.client, chunks=True)
+        )
+        self.start = datetime.datetime(2013,12,1,0,0,0)
+
+    def _write(self, writer):
+        for chunk in self.chunks:
+            writer.write(chunk)
+        writer.close()
+
+    def test_gpx(self):
+        f = StringIO.StringIO()
+        self._write(wiflight.GPXWriter(f, self.start, name=u'Flight'))
+        doc = lxml.etree.fromstring(f.getvalue())
+        ns = { 'g': 'http://www.topografix.com/GPX/1/1' }
+        self.assertEqual(len(doc.xpath('//g:trkpt', namespaces=ns)), 6)
+        self.assertEqual(
+            doc.xpath('//g:trkpt[2]/g:time/text()', namespaces=ns),
+            ['2013-12-01T00:05:00Z']
+        )
+        self.assertEqual(doc.xpath('//g:trkpt[2]/g:ele/text()', namespaces=ns), ['300.0'])
+
+    def test_non_ascii_name(self):
+        for name in (u'Vol \xe0 Qu\xe9bec', 'Vol \xc3\xa0 Qu\xc3\xa9bec'):
+            f = StringIO.StringIO()
+            self._write(wiflight.GPXWriter(f, self.start, name=name))
+            doc = lxml.etree.fromstring(f.getvalue())
+            self.assertEqual(
+                doc.xpath('//g:name/text()', namespaces={ 'g': 'http://www.topografix.com/GPX/1/1' }),
+                [u'Vol \xe0 Qu\xe9bec']
+            )
+            f = StringIO.StringIO()
+            self._write(wiflight.KMLWriter(f, name=name))
+            doc = lxml.etree.fromstring(f.getvalue())
+            self.assertEqual(
+                doc.xpath('//k:name/text()', namespaces={ 'k': 'http://www.opengis.net/kml/2.2' }),
+                [u'Vol \xe0 Qu\xe9bec']
+            )
+
+    def test_kmz(self):
+        f = StringIO.StringIO()
+        self._write(wiflight.KMZWriter(f))
+        zf = zipfile.ZipFile(StringIO.StringIO(f.getvalue()))
+        doc = lxml.etree.fromstring(zf.read('doc.kml'))
+        coords = doc.xpath(
+            '//k:coordinates/text()',
+            namespaces={ 'k': 'http://www.opengis.net/kml/2.2' }
+        )[0].split()
+        self.assertEqual(len(coords), 6)
+        self.assertEqual(coords[0], '-73.0,45.0,0.0')
+
+    def test_kmz_error(self):
+        f = StringIO.StringIO()
+        with self.assertRaises(RuntimeError):
+            with wiflight.KMZWriter(f) as writer:
+                writer.write(self.chunks[0])
+                spool_path = writer.spool_path
+                raise RuntimeError()
+        self.assertEqual(f.getvalue(), '')
+        self.assertFalse(os.path.exists(spool_path))
+        # Same if the writer is just dropped
+        writer = wiflight.KMZWriter(f)
+        spool_path = writer.spool_path
+        del writer
+        self.assertFalse(os.path.exists(spool_path))
+        self.assertEqual(f.getvalue(), '')
+
+    def test_csv(self):
+        f = StringIO.StringIO()
+        self._write(wiflight.CSVWriter(f, channels=('t', 'alt', 'rpm')))
+        lines = f.getvalue().splitlines()
+        self.assertEqual(lines[0], 't,alt,rpm')
+        self.assertEqual(lines[2], '300.0,300.0,')
+        self.assertEqual(len(lines), 7)
+
+    def test_columnar(self):
+        f = StringIO.StringIO()
+        self._write(wiflight.ColumnarWriter(f))
+        f.seek(0)
+        blocks = list(read_columnar(f))
+        self.assertEqual([len(b['t']) for b in blocks], [3, 1, 2])
+        self.assertEqual(list(blocks[0]['alt']), [0.0, 300.0, 600.0])
+        self.assertTrue(math.isnan(blocks[0]['rpm'][0]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,27 @@ import wiflight
 import datetime
 import decimal
 import re
+import threading
+import time
+import urlparse
 
 import server
 
+class IdClient(object):
+    """Answers flight searches by ID, for flights with even IDs only"""
+    def __init__(self):
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def request(self, url, method, data=None, content_type="text/xml", etag=None):
+        with self.lock:
+            self.urls.append(url)
+        ids = [int(v) for k, v in urlparse.parse_qsl(url.split('?', 1)[1]) if k == 'f']
+        return "text/xml", 1, '<list>%s</list>' % (''.join(
+            '<flight id="%d"><headline>%d</headline></flight>' % (i, i)
+            for i in sorted(ids) if i % 2 == 0
+        ),)
+
 class WiFlightAPIFlightTestCase(unittest.TestCase):
     def setUp(self):
         self.client = server.MockClient()
@@ -84,6 +102,15 @@ class WiFlightAPIFlightTestCase(unittest.TestCase):
         self.assertItemsEqual(flight.groups, ['Demo flights', 'Featured flights', 'xxx'])
         flight.groups.remove('Demo flights')
         self.assertItemsEqual(flight.groups, ['Featured flights', 'xxx'])
+        groups = flight.groups
+        self.assertIs(flight.groups, groups)
+        self.assertIn('xxx', groups)
+        self.assertNotIn('Demo flights', groups)
+        groups.update(['a', 'xxx', 'b', 'a'])
+        self.assertEqual(len(groups), 4)
+        groups.difference_update(['xxx', 'a', 'missing'])
+        self.assertItemsEqual(flight.groups, ['Featured flights', 'b'])
+        self.assertEqual(len(flight.groups), 2)
 
     def test_flight_crew(self):
         flight = wiflight.APIFlight(62)
@@ -93,6 +120,8 @@ class WiFlightAPIFlightTestCase(unittest.TestCase):
         self.assertItemsEqual(flight.crew, ['foo', 'bar'])
         flight.crew.remove('foo')
         self.assertItemsEqual(flight.crew, ['bar'])
+        self.assertIn('bar', flight.crew)
+        self.assertEqual(len(flight.crew), 1)
         # Not possible to save modified crew to the server
 
     def test_change_aircraft(self, _matchre=re.compile(
@@ -141,11 +170,114 @@ class WiFlightAPIFlightSearchTestCase(unittest.TestCase):
         s.load(self.client)
         self.assertEqual(len(s), 2)
         self.assertEqual(iter(s).next().headline, "1")
+        self.assertEqual(s.missing, None)
+
+    def test_flight_search_ids(self):
+        client = IdClient()
+        s = wiflight.APIFlightSearch(f=[8, 3, 4, 2, 8])
+        s.load(client)
+        self.assertEqual(len(client.urls), 1)
+        self.assertEqual(s.etag, 1)
+        self.assertEqual([f.id for f in s], [8, 4, 2])
+        self.assertEqual(s.missing, [3])
+
+    def test_flight_search_ids_bad_flight(self):
+        s = wiflight.APIFlightSearch(f=[2, 1])
+        s._set_response('text/xml', None,
+            '<list><flight id="1"/><flight/><flight id="x"/><flight id="2"/></list>'
+        )
+        self.assertEqual([f and f.id for f in s], [None, None, 2, 1])
+        self.assertEqual(s.missing, [])
+
+    def test_flight_search_batches(self):
+        clients = [IdClient(), IdClient()]
+        ids = range(5000, 0, -1)
+        s = wiflight.APIFlightSearch(kw="x", f=ids, events=True)
+        s.load(clients[0], clients=clients)
+        urls = clients[0].urls + clients[1].urls
+        self.assertTrue(len(urls) > 2)
+        for url in urls:
+            self.assertTrue(len(url) <= s.max_url_length)
+            self.assertTrue(url.startswith('a/flight/?kw=x&f='))
+            self.assertTrue(url.endswith('&events=true'))
+        self.assertEqual(s.etag, None)
+        self.assertEqual([f.id for f in s], range(5000, 0, -2))
+        self.assertEqual(s.missing, range(4999, 0, -2))
+
+    def test_flight_search_records(self):
+        s = wiflight.APIFlightSearch(kw="123")
+        r = s.records(self.client)
+        self.assertEqual(len(r), 2)
+        self.assertTrue(isinstance(r[0], wiflight.FlightSummary))
+        self.assertEqual(r[0].headline, "1")
+        self.assertEqual(s.missing, None)
+        self.assertEqual(len(s), 0)
+
+    def test_flight_search_records_batches(self):
+        clients = [IdClient(), IdClient()]
+        s = wiflight.APIFlightSearch(f=range(5000, 0, -1))
+        r = s.records(clients[0], clients=clients)
+        self.assertTrue(len(clients[0].urls + clients[1].urls) > 2)
+        self.assertEqual([x.id for x in r], range(5000, 0, -2))
+        self.assertEqual(r[0].headline, '5000')
+        self.assertEqual(s.missing, range(4999, 0, -2))
 
 class WiFlightAPIFlightDetailsTestCase(unittest.TestCase):
     def setUp(self):
         self.client = server.MockClient()
 
+    def test_flight_events(self):
+        flight = wiflight.APIFlight(3189)
+        flight.load(self.client)
+        events = flight.events
+        self.assertIs(flight.events, events)
+        self.assertEqual(len(events), 4)
+        self.assertEqual([e.seq for e in events], [1, 2, 3, 4])
+        self.assertEqual(events.types, frozenset(['takeoff', 'airspace', 'landing']))
+        takeoff = events.by_type('takeoff')[0]
+        self.assertEqual(takeoff.start_time, datetime.datetime(2010,6,26,23,43,18))
+        self.assertEqual(takeoff.details['airport'], 'SWF')
+        self.assertTrue(takeoff.detected)
+        self.assertEqual(
+            [e.seq for e in events.with_severity(40, type='airspace')], [2, 3]
+        )
+        self.assertEqual([e.seq for e in events.with_severity(None, 39)], [1, 4])
+        self.assertEqual(
+            [e.seq for e in events.overlapping(
+                datetime.datetime(2010,6,27,1,26,28),
+                datetime.datetime(2010,6,27,1,40,0),
+            )], [3, 4]
+        )
+        flight.load(self.client)
+        self.assertIsNot(flight.events, events)
+
+    def test_flight_no_events(self):
+        flight = wiflight.APIFlight(62)
+        flight.load(self.client)
+        self.assertEqual(len(flight.events), 0)
+        self.assertEqual(flight.events.with_severity(0), [])
+
+    def test_flight_weather(self):
+        flight = wiflight.APIFlight(3189)
+        flight.load(self.client)
+        weather = flight.weather
+        self.assertIs(flight.weather, weather)
+        self.assertEqual(len(weather), 23)
+        # Only the distinct METARs are stored
+        self.assertEqual(len(weather.metars), 5)
+        obs = weather.at(2800.0)
+        self.assertEqual(obs.t, 2749.5)
+        self.assertTrue(obs.metar.startswith('KLGA 262351Z'))
+        self.assertIs(weather.at(2901.5).metar, obs.metar)
+        self.assertEqual(weather.at(900.0).metar, None)
+        self.assertEqual(weather.wind_at(900.0), (None, None))
+        self.assertEqual(weather.wind_at(0.0), (-4.83419648249, -1.75950362622))
+        self.assertIsNone(weather.at(-1.0))
+        east, north = weather.interpolate_wind([2280.25, 2514.875, 7000.0, 853.6])
+        self.assertAlmostEqual(east[1], (-0.446661701443 + 3.11865370407) / 2)
+        self.assertAlmostEqual(north[2], -1.75950362622)
+        self.assertNotEqual(east[3], east[3])
+
     def test_flight_track(self):
         t = wiflight.APIFlight(67).track()
         t.load(self.client)
@@ -170,5 +302,41 @@ class WiFlightAPIFlightDetailsTestCase(unittest.TestCase):
         )
         self.assertEqual(t.url, 'a/flight/67/track?offset=1.1&length=500')
 
+    def test_iter_track(self):
+        flight = wiflight.APIFlight(68)
+        points = list(flight.iter_track(self.client, window=600))
+        self.assertEqual([p.t for p in points], [0, 300, 600, 900, 1200, 1500])
+        chunks = list(flight.iter_track(self.client, window=600, chunks=True))
+        self.assertEqual([len(c) for c in chunks], [3, 1, 2])
+
+    def test_iter_track_early_exit(self):
+        flight = wiflight.APIFlight(68)
+        it = flight.iter_track(self.client, window=600, prefetch=1)
+        self.assertEqual(it.next().t, 0)
+        it.close()
+
+    def test_iter_track_close_waits(self):
+        # The session is not in use any more once the iterator is closed
+        busy = []
+        client = self.client
+        class SlowClient(object):
+            def request(self, *args, **kwargs):
+                busy.append(True)
+                try:
+                    time.sleep(0.05)
+                    return client.request(*args, **kwargs)
+                finally:
+                    busy.pop()
+        it = wiflight.APIFlight(68).iter_track(SlowClient(), window=600, prefetch=1)
+        self.assertEqual(it.next().t, 0)
+        it.close()
+        self.assertEqual(busy, [])
+
+    def test_iter_track_error(self):
+        flight = wiflight.APIFlight(69)
+        with self.assertRaises(wiflight.HTTPError) as cm:
+            list(flight.iter_track(self.client))
+        self.assertEqual(cm.exception.code, 404)
+
 if __name__ == '__main__':
     unittest.main()
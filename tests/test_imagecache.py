@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import os
+import shutil
+import tempfile
+
+import server
+
+class CountingClient(server.MockClient):
+    def __init__(self):
+        server.MockClient.__init__(self)
+        self.gets = []
+
+    def request(self, url, method, *args, **kwargs):
+        if method == 'GET':
+            self.gets.append((url, kwargs.get('if_none_match')))
+        return server.MockClient.request(self, url, method, *args, **kwargs)
+
+class WiFlightAircraftImageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = CountingClient()
+        self.png = self.client.contents['a/aircraft/65/image'][2]
+        self.client.contents['a/aircraft/5/image'] = (3, 'image/png', self.png)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_fetch(self):
+        cache = wiflight.AircraftImageCache(self.dir)
+        self.assertIs(cache.get(65), None)
+        image = cache.fetch(self.client, 65)
+        self.assertEqual(image.content_type, 'image/png')
+        self.assertEqual(image.size, len(self.png))
+        with image.open() as f:
+            self.assertEqual(f.read(), self.png)
+        with image.mmap() as m:
+            self.assertEqual(m[:], self.png)
+        # Revalidated, not downloaded again
+        again = cache.fetch(self.client, wiflight.APIAircraft(65))
+        self.assertEqual(again.path, image.path)
+        self.assertEqual(self.client.gets, [
+            ('a/aircraft/65/image', None), ('a/aircraft/65/image', 0)
+        ])
+        self.assertEqual(cache.get(65).path, image.path)
+
+    def test_changed(self):
+        cache = wiflight.AircraftImageCache(self.dir)
+        old = cache.fetch(self.client, 65)
+        self.client.contents['a/aircraft/65/image'] = (1, 'image/jpeg', 'JPEG data')
+        new = cache.fetch(self.client, 65)
+        self.assertNotEqual(new.path, old.path)
+        self.assertEqual(new.content_type, 'image/jpeg')
+        with new.open() as f:
+            self.assertEqual(f.read(), 'JPEG data')
+
+    def test_max_age(self):
+        cache = wiflight.AircraftImageCache(self.dir, max_age=3600)
+        cache.fetch(self.client, 65)
+        cache.fetch(self.client, 65)
+        self.assertEqual(len(self.client.gets), 1)
+
+    def test_shared(self):
+        cache = wiflight.AircraftImageCache(self.dir)
+        a = cache.fetch(self.client, 65)
+        b = cache.fetch(self.client, 5)
+        self.assertEqual(a.path, b.path)
+        self.assertEqual(cache.size, len(self.png))
+
+    def test_missing(self):
+        cache = wiflight.AircraftImageCache(self.dir)
+        self.assertIs(cache.fetch(self.client, 62), None)
+
+    def test_budget(self):
+        cache = wiflight.AircraftImageCache(self.dir, budget=len(self.png) + 5)
+        png = cache.fetch(self.client, 65)
+        self.client.contents['a/aircraft/5/image'] = (3, 'image/png', 'other')
+        cache.fetch(self.client, 5)
+        self.assertEqual(cache.size, len(self.png) + 5)
+        self.client.contents['a/aircraft/62/image'] = (3, 'image/png', 'third')
+        cache.fetch(self.client, 62)
+        # The least recently used image was removed
+        self.assertFalse(os.path.exists(png.path))
+        self.assertIs(cache.get(65), None)
+        self.assertEqual(cache.size, 10)
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import lxml.etree
+
+def _flight(flight_id, start, aircraft_id=None, engine=3600, master=3700, air=3000):
+    aircraft = ''
+    if aircraft_id is not None:
+        aircraft = '<aircraft id="%d"><tail>C-%04d</tail></aircraft>' % (
+            aircraft_id, aircraft_id
+        )
+    return (
+        '<flight id="%d"><start>%s</start><engine_ontime>%s</engine_ontime>'
+        '<master_ontime>%s</master_ontime><airtime>%s</airtime>%s</flight>' % (
+            flight_id, start, engine, master, air, aircraft
+        )
+    )
+
+def flight(*args, **kwargs):
+    return wiflight.APIFlight.from_xml(lxml.etree.fromstring(_flight(*args, **kwargs)))
+
+class ListClient(object):
+    def __init__(self, flights):
+        self.flights = flights
+        self.urls = []
+
+    def request(self, url, method, data=None, content_type="text/xml", etag=None):
+        self.urls.append(url)
+        return "text/xml", None, '<list>%s</list>' % (''.join(self.flights),)
+
+class WiFlightMaintenanceRollupTestCase(unittest.TestCase):
+    def test_totals(self):
+        rollup = wiflight.MaintenanceRollup()
+        self.assertTrue(rollup.add(flight(1, '20140101T100000Z', 5)))
+        self.assertTrue(rollup.add(flight(2, '20140101T140000Z', 5, engine=1800)))
+        self.assertTrue(rollup.add(flight(3, '20140103T100000Z', 5)))
+        self.assertTrue(rollup.add(flight(4, '20140103T100000Z', 6)))
+        self.assertEqual(rollup.totals(5), {
+            'flights': 3, 'engine_ontime': 9000.0,
+            'master_ontime': 11100.0, 'airtime': 9000.0,
+        })
+        self.assertEqual(rollup.hours_since(5, datetime.date(2014,1,2)), 1.0)
+        self.assertEqual(rollup.hours_since('C-0005', datetime.date(2014,1,1)), 2.5)
+        self.assertEqual(
+            rollup.totals(5, until=datetime.date(2014,1,2))['flights'], 2
+        )
+        self.assertEqual(rollup.daily(5), [
+            (datetime.date(2014,1,1), 2, 5400.0, 7400.0, 6000.0),
+            (datetime.date(2014,1,3), 1, 3600.0, 3700.0, 3000.0),
+        ])
+        self.assertRaises(KeyError, rollup.totals, 'C-NONE')
+        self.assertRaises(ValueError, rollup.hours_since, 5, None, 'gs_max')
+
+    def test_update(self):
+        rollup = wiflight.MaintenanceRollup()
+        rollup.add(flight(1, '20140101T100000Z', 5))
+        self.assertFalse(rollup.add(flight(1, '20140101T100000Z', 5)))
+        self.assertTrue(rollup.add(flight(1, '20140101T100000Z', 5, engine=7200)))
+        self.assertEqual(rollup.totals(5)['engine_ontime'], 7200.0)
+        # Reassigned to another aircraft
+        rollup.add(flight(1, '20140101T100000Z', 6, engine=7200))
+        self.assertEqual(rollup.totals(5)['flights'], 0)
+        self.assertEqual(rollup.daily(5), [])
+        self.assertEqual(rollup.totals(6)['engine_ontime'], 7200.0)
+        rollup.remove(1)
+        self.assertEqual(rollup.totals(6)['flights'], 0)
+
+    def test_unassigned(self):
+        rollup = wiflight.MaintenanceRollup()
+        rollup.add(flight(1, '20140101T100000Z'))
+        rollup.add(flight(2, '20140101T100000Z'))
+        rollup.add(flight(3, '20140101T100000Z', 5))
+        self.assertEqual(rollup.unassigned(), [1, 2])
+        self.assertEqual(rollup.totals(5)['flights'], 1)
+        client = ListClient([
+            _flight(1, '20140101T100000Z', 5), _flight(2, '20140101T100000Z')
+        ])
+        self.assertEqual(rollup.refresh_unassigned(client), 1)
+        self.assertEqual(client.urls, ['a/flight/?f=1&f=2'])
+        self.assertEqual(rollup.unassigned(), [2])
+        self.assertEqual(rollup.totals(5)['flights'], 2)
+
+    def test_sync_callback(self):
+        rollup = wiflight.MaintenanceRollup()
+        sync = wiflight.FlightSync(':memory:', initial_start=datetime.datetime(2014,1,1))
+        client = ListClient([
+            _flight(1, '20140101T100000Z', 5), _flight(2, '20140102T100000Z', 5)
+        ])
+        self.assertEqual(sync.poll(client, rollup.add), 2)
+        self.assertEqual(rollup.totals(5)['flights'], 2)
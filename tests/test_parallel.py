@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+import unittest
+import threading
+import time
+
+from wiflight.parallel import client_map
+
+class WiFlightClientMapTestCase(unittest.TestCase):
+    def test_order(self):
+        def work(client, item):
+            # Later items finish first
+            time.sleep(0.01 * (5 - item))
+            return client, item * 2
+        r = list(client_map(['a', 'b', 'c'], work, range(5)))
+        self.assertEqual([x[1] for x in r], [0, 2, 4, 6, 8])
+        self.assertEqual(set(x[0] for x in r), set(['a', 'b', 'c']))
+
+    def test_one_client_per_thread(self):
+        seen = {}
+        lock = threading.Lock()
+        def work(client, item):
+            with lock:
+                seen.setdefault(client, set()).add(threading.current_thread().ident)
+            return item
+        list(client_map(['a', 'b'], work, range(20)))
+        for threads in seen.values():
+            self.assertEqual(len(threads), 1)
+
+    def test_error(self):
+        def work(client, item):
+            if item == 3:
+                raise KeyError(item)
+            return item
+        it = client_map(['a', 'b'], work, range(10))
+        self.assertEqual([it.next() for i in range(3)], [0, 1, 2])
+        with self.assertRaises(KeyError):
+            it.next()
+
+    def test_lazy(self):
+        consumed = []
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+        it = client_map(['a'], lambda c, i: i, items(), lookahead=2)
+        it.next()
+        self.assertTrue(len(consumed) <= 3)
+        it.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+
+from wiflight.query import (
+    during, in_group, flight_ids, keywords, missing_aircraft, aircraft,
+    has_event, field
+)
+
+FLIGHTS = """<list>
+    <flight id="1">
+        <start>20140610T120000Z</start><length>3600</length><gs_max>70</gs_max>
+        <aircraft id="5"><tail>C-FFSK</tail></aircraft>
+        <headline>local</headline>
+        <events><event seq="1" type="airspace" severity="40"/></events>
+        <event_counts><count>1</count></event_counts>
+    </flight>
+    <flight id="2">
+        <start>20140611T120000Z</start><length>3600</length><gs_max>50</gs_max>
+        <aircraft id="5"><tail>C-FFSK</tail></aircraft>
+        <headline>local</headline>
+        <events><event seq="1" type="airspace" severity="40"/></events>
+        <event_counts><count>1</count></event_counts>
+    </flight>
+    <flight id="3">
+        <start>20140612T120000Z</start><length>3600</length><gs_max>80</gs_max>
+        <aircraft id="6"><tail>C-FFSL</tail></aircraft>
+        <headline>cross-country</headline>
+        <events><event seq="1" type="takeoff" severity="10"/></events>
+        <event_counts><count>0</count></event_counts>
+    </flight>
+    <flight id="4">
+        <start>20140613T120000Z</start><length>3600</length><gs_max>90</gs_max>
+        <headline>local C-FFSK</headline>
+        <events/>
+        <event_counts><count>0</count></event_counts>
+    </flight>
+</list>"""
+
+class FixedClient(object):
+    """Returns the same flights for any search"""
+    def __init__(self):
+        self.urls = []
+
+    def request(self, url, method, data=None, content_type="text/xml", etag=None):
+        self.urls.append(url)
+        return "text/xml", None, FLIGHTS
+
+class WiFlightQueryTestCase(unittest.TestCase):
+    def test_plan(self):
+        june = datetime.datetime(2014,6,1), datetime.datetime(2014,7,1)
+        q = wiflight.FlightQuery(
+            during(*june) & aircraft("C-FFSK") & (field('gs_max') > 60) &
+            has_event("airspace") & in_group("Training") &
+            during(datetime.datetime(2014,6,10), None) & keywords("local")
+        )
+        self.assertEqual(q.search_args, {
+            'kw': 'local C-FFSK airspace',
+            'start': datetime.datetime(2014,6,10),
+            'end': june[1],
+            'group': ['Training'],
+            'f': None,
+            'missingaircraft': False,
+            'events': True,
+        })
+        self.assertEqual(len(q.local), 5)
+        self.assertFalse(q.empty)
+
+    def test_plan_ids(self):
+        q = wiflight.FlightQuery(
+            flight_ids([1, 2, 3]) & flight_ids([3, 2, 7]) & aircraft("C-FFSK") &
+            missing_aircraft()
+        )
+        self.assertEqual(q.search_args['f'], [2, 3])
+        self.assertEqual(q.search_args['kw'], None)
+        self.assertEqual(q.search_args['missingaircraft'], True)
+        self.assertEqual(q.search_args['events'], None)
+        q = wiflight.FlightQuery(flight_ids([1]) & flight_ids([2]))
+        self.assertTrue(q.empty)
+        self.assertEqual(list(q.run([FixedClient()])), [])
+
+    def test_severity_counts(self):
+        q = wiflight.FlightQuery(
+            has_event(min_severity=30) & (field('gs_max') > 60)
+        )
+        self.assertEqual(q.search_args['events'], '30..')
+        client = FixedClient()
+        self.assertEqual([f.id for f in q.run([client])], [1])
+        self.assertEqual(client.urls, ['a/flight/?events=30..'])
+
+    def test_run(self):
+        q = wiflight.FlightQuery(
+            during(datetime.datetime(2014,6,1), datetime.datetime(2014,7,1)) &
+            aircraft("C-FFSK") & (field('gs_max') > 60) & has_event("airspace")
+        )
+        client = FixedClient()
+        self.assertEqual([f.id for f in q.run([client], slice_length=datetime.timedelta(days=30))], [1])
+        self.assertEqual(len(client.urls), 1)
+        self.assertTrue('kw=C-FFSK+airspace' in client.urls[0])
+
+    def test_during_checked_locally(self):
+        # FixedClient ignores the time bounds of the search
+        q = wiflight.FlightQuery(
+            during(datetime.datetime(2014,6,11,12,30), datetime.datetime(2014,6,12,12,0))
+        )
+        self.assertEqual([f.id for f in q.run([FixedClient()])], [2, 3])
+
+    def test_local_only(self):
+        q = wiflight.FlightQuery(
+            (aircraft("C-FFSL") | keywords("ffsk")) & ~has_event("airspace")
+        )
+        self.assertEqual(q.search_args['kw'], None)
+        self.assertEqual(q.search_args['events'], True)
+        self.assertEqual([f.id for f in q.run([FixedClient()])], [3, 4])
+        q = wiflight.FlightQuery(
+            during(datetime.datetime(2014,6,11,12,30), datetime.datetime(2014,6,12)) |
+            (field('gs_max') == 90)
+        )
+        self.assertEqual([f.id for f in q.run([FixedClient()])], [2, 4])
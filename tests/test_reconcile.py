@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+
+import server
+
+class RacingClient(server.MockClient):
+    """Modifies a reservation behind the reconciler's back once"""
+    def __init__(self, name):
+        server.MockClient.__init__(self)
+        self.race_url = 'a/reservation/' + name
+
+    def request(self, url, method, *args, **kwargs):
+        if url == self.race_url and method == 'PUT':
+            self.race_url = None
+            etag, content_type, body = self.contents[url]
+            self.contents[url] = etag + 1, content_type, body
+        return server.MockClient.request(self, url, method, *args, **kwargs)
+
+def _resv(name, hour=12, crew=('crew1', 'crew2'), tail='C-FFSK'):
+    resv = wiflight.APIReservation(name)
+    resv.start = datetime.datetime(2013,12,1,hour,0,0)
+    resv.end = datetime.datetime(2013,12,1,hour + 1,0,0)
+    resv.notify_profile = "placeholder"
+    resv.aircraft = wiflight.APIAircraft(tail)
+    for c in crew:
+        resv.crew.add(c)
+    return resv
+
+class WiFlightReservationReconcilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+
+    def test_matches(self):
+        existing = wiflight.APIReservation('resv1')
+        existing.load(self.client)
+        desired = _resv('resv1')
+        desired.domain = 'dom1'
+        self.assertTrue(wiflight.reconcile.reservation_matches(desired, existing))
+        desired.aircraft = wiflight.APIAircraft(5)
+        self.assertTrue(wiflight.reconcile.reservation_matches(desired, existing))
+        desired.crew_by_uuid.add('uuid3')
+        self.assertFalse(wiflight.reconcile.reservation_matches(desired, existing))
+        desired = _resv('resv1', tail='C-FFSL')
+        desired.domain = 'dom1'
+        self.assertFalse(wiflight.reconcile.reservation_matches(desired, existing))
+
+    def test_run(self):
+        self.client.contents['a/reservation/old'] = (
+            4, 'text/xml', '<reservation name="old" domain="dom1"/>'
+        )
+        self.client.contents['a/reservation/other'] = (
+            4, 'text/xml', '<reservation name="other" domain="dom2"/>'
+        )
+        reconciler = wiflight.ReservationReconciler(
+            [self.client, self.client], 'dom1'
+        )
+        report = reconciler.run(
+            [_resv('resv1'), _resv('resv2', hour=14), _resv('resv3', crew=['x'])],
+            existing_names=['old', 'other', 'gone', 'resv2']
+        )
+        self.assertEqual(report.unchanged, ['resv1', 'other', 'gone'])
+        self.assertEqual(report.created, ['resv2', 'resv3'])
+        self.assertEqual(report.deleted, ['old'])
+        self.assertEqual(report.updated, [])
+        self.assertEqual(report.failed, [])
+        self.assertEqual(report.requests, 9)
+        self.assertNotIn('a/reservation/old', self.client.contents)
+        self.assertIn('a/reservation/other', self.client.contents)
+        resv = wiflight.APIReservation('resv3')
+        resv.load(self.client)
+        self.assertEqual(resv.domain, 'dom1')
+        self.assertEqual(list(resv.crew), ['x'])
+
+        report = reconciler.run([_resv('resv1', hour=10), _resv('resv2', hour=14)])
+        self.assertEqual(report.updated, ['resv1'])
+        self.assertEqual(report.unchanged, ['resv2'])
+        resv = wiflight.APIReservation('resv1')
+        resv.load(self.client)
+        self.assertEqual(resv.start, datetime.datetime(2013,12,1,10,0,0))
+
+    def test_conflict(self):
+        client = RacingClient('resv1')
+        reconciler = wiflight.ReservationReconciler([client], 'dom1')
+        report = reconciler.run([_resv('resv1', hour=10)])
+        self.assertEqual(report.updated, ['resv1'])
+        self.assertEqual(report.conflicts, 1)
+        self.assertEqual(report.requests, 4)
+
+    def test_failures(self):
+        client = RacingClient('resv1')
+        reconciler = wiflight.ReservationReconciler([client], 'dom1', retries=0)
+        report = reconciler.run([_resv('resv1', hour=10), _resv('resv2')])
+        self.assertEqual(report.created, ['resv2'])
+        self.assertEqual(len(report.failed), 1)
+        self.assertEqual(report.failed[0][0], 'resv1')
+        self.assertEqual(report.failed[0][1].code, 412)
+        # The refused save of resv1 is counted
+        self.assertEqual(report.requests, 4)
+        with self.assertRaises(ValueError):
+            reconciler.run([_resv('a'), _resv('a')])
+        resv = _resv('b')
+        resv.domain = 'dom2'
+        with self.assertRaises(ValueError):
+            reconciler.run([resv])
+
+    def test_other_domain(self):
+        self.client.contents['a/reservation/other'] = (
+            4, 'text/xml', '<reservation name="other" domain="dom2"/>'
+        )
+        reconciler = wiflight.ReservationReconciler([self.client], 'dom1')
+        report = reconciler.run([_resv('other')])
+        self.assertEqual(report.updated, [])
+        self.assertEqual(len(report.failed), 1)
+        self.assertEqual(report.failed[0][0], 'other')
+        self.assertTrue(isinstance(report.failed[0][1], ValueError))
+        self.assertEqual(report.requests, 1)
+        resv = wiflight.APIReservation('other')
+        resv.load(self.client)
+        self.assertEqual(resv.domain, 'dom2')
+        self.assertEqual(resv.start, None)
@@ -49,6 +49,22 @@ class WiFlightAPIReservationTestCase(unittest.TestCase):
         resv.aircraft = wiflight.APIAircraft(6)
         self.assertEqual(resv.aircraft.url, 'a/aircraft/6')
 
+    def test_reservation_crew_bulk(self):
+        resv = wiflight.APIReservation('resv1')
+        resv.load(self.client)
+        crew = resv.crew
+        names = ['pax%d' % (i,) for i in range(1000)]
+        crew.update(names + ['crew1'])
+        self.assertEqual(len(crew), 1002)
+        self.assertIn('pax999', crew)
+        self.assertEqual(len(resv.crew), 1002)
+        self.assertEqual(len(resv.body.xpath('/reservation/crew/user')), 1002)
+        crew.difference_update(names[1:])
+        self.assertItemsEqual(resv.crew, ['crew1', 'crew2', 'pax0'])
+        # Users added by name have no UUID
+        self.assertItemsEqual(resv.crew_by_uuid, ['uuid1', 'uuid2'])
+        self.assertEqual(len(resv.crew_by_uuid), 2)
+
     def test_add_crew_to_new(self):
         resv = wiflight.APIReservation('placeholder')
         self.assertEqual(len(resv.crew), 0)
@@ -57,5 +73,40 @@ class WiFlightAPIReservationTestCase(unittest.TestCase):
         self.assertItemsEqual(resv.crew, ['another placeholder'])
         self.assertEqual(len(resv.crew), 1)
 
+    def test_crew_kept_with_body(self):
+        resv = wiflight.APIReservation('resv1')
+        resv.load(self.client)
+        crew = resv.crew
+        self.assertIs(resv.crew, crew)
+        self.assertIs(resv.crew_by_uuid, resv.crew_by_uuid)
+        self.assertEqual(len(crew), 2)
+        # Loading replaces the body and the set
+        resv.load(self.client)
+        self.assertIsNot(resv.crew, crew)
+        self.assertIs(resv.crew.doc, resv.body)
+        self.assertEqual(len(resv.crew), 2)
+
+    def test_crew_related_sets(self):
+        resv = wiflight.APIReservation('resv1')
+        resv.load(self.client)
+        by_uuid = resv.crew_by_uuid
+        self.assertEqual(len(by_uuid), 2)
+        resv.crew.remove('crew1')
+        self.assertEqual(len(by_uuid), 1)
+        self.assertItemsEqual(by_uuid, ['uuid2'])
+
+    def test_crew_many_containers(self):
+        resv = wiflight.APIReservation('placeholder')
+        resv.body.append(resv.body.makeelement('crew'))
+        for n, crew in enumerate(resv.body.findall('crew')):
+            crew.append(crew.makeelement('user', {'name': 'user%d' % (n,)}))
+        self.assertItemsEqual(resv.crew, ['user0', 'user1'])
+        self.assertIn('user1', resv.crew)
+        self.assertEqual(len(resv.crew), 2)
+        resv.crew.add('user2')
+        self.assertEqual(len(resv.body.find('crew')), 2)
+        resv.crew.remove('user1')
+        self.assertItemsEqual(resv.crew, ['user0', 'user2'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import random
+import lxml.etree
+
+BASE = datetime.datetime(2014,1,1)
+
+def _resv(name, start, end, tail='C-FFSK', domain='dom1'):
+    resv = wiflight.APIReservation(name)
+    resv.domain = domain
+    if start is not None:
+        resv.start = BASE + datetime.timedelta(hours=start)
+    if end is not None:
+        resv.end = BASE + datetime.timedelta(hours=end)
+    if tail is not None:
+        resv.aircraft = wiflight.APIAircraft(tail)
+    return resv
+
+def _flight(flight_id, start, length, tail='C-FFSK'):
+    return wiflight.APIFlight.from_xml(lxml.etree.fromstring(
+        '<flight id="%d"><start>%s</start><length>%d</length>'
+        '<aircraft id="5"><tail>%s</tail></aircraft></flight>' % (
+            flight_id, (BASE + datetime.timedelta(hours=start)).strftime('%Y%m%dT%H%M%SZ'),
+            length * 3600, tail
+        )
+    ))
+
+class WiFlightReservationIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = wiflight.ReservationIndex([
+            _resv('a', 0, 2),
+            _resv('b', 1, 4),
+            _resv('c', 5, 6),
+            _resv('d', 1, 3, tail='C-FFSL'),
+            _resv('e', 3, 5, domain='dom2'),
+            _resv('f', 10, None),
+        ])
+
+    def _names(self, reservations):
+        return [r.name for r in reservations]
+
+    def test_overlapping(self):
+        index = self.index
+        self.assertEqual(len(index), 6)
+        t = lambda h: BASE + datetime.timedelta(hours=h)
+        self.assertEqual(self._names(index.overlapping(t(1.5), t(2.5), 'c-ffsk')), ['a', 'b'])
+        self.assertEqual(self._names(index.overlapping(t(1.5), t(2.5))), ['a', 'b', 'd'])
+        self.assertEqual(self._names(index.at(t(4))), ['b', 'e'])
+        self.assertEqual(self._names(index.at(t(4), domain='dom1')), ['b'])
+        self.assertEqual(self._names(index.at(t(1000))), ['f'])
+        self.assertEqual(index.overlapping(t(7), t(8)), [])
+        self.assertEqual(index.overlapping(t(1), t(2), 'C-NONE'), [])
+
+    def test_update(self):
+        index = self.index
+        t = lambda h: BASE + datetime.timedelta(hours=h)
+        self.assertEqual(self._names(index.at(t(5.5))), ['c'])
+        index.add(_resv('c', 7, 8))
+        self.assertEqual(index.at(t(5.5)), [])
+        index.remove('b')
+        self.assertEqual(self._names(index.at(t(1.5))), ['a', 'd'])
+        self.assertIs(index.get('b'), None)
+        self.assertEqual(len(index), 5)
+
+    def test_join(self):
+        index = self.index
+        flights = [_flight(1, 1.5, 2), _flight(2, 0, 1, 'C-FFSL'), _flight(3, 20, 1, 'C-XXXX')]
+        joined = index.join(flights)
+        self.assertEqual(
+            [(f.id, self._names(r)) for f, r in joined],
+            [(1, ['b', 'a', 'e']), (2, ['d']), (3, [])]
+        )
+        self.assertEqual(self._names(index.for_flight(flights[0], domain='dom1')), ['b', 'a'])
+
+    def test_conflicts(self):
+        index = self.index
+        self.assertEqual(
+            [(a.name, b.name) for a, b in index.conflicts()], [('a', 'b')]
+        )
+        self.assertEqual(self._names(index.check(_resv('g', 3.5, 5.5))), ['b', 'c'])
+        self.assertEqual(self._names(index.check(_resv('b', 3.5, 5.5))), ['c'])
+
+    def test_modified_after_add(self):
+        index = self.index
+        c = index.get('c')
+        c.aircraft = wiflight.APIAircraft('C-FFSL')
+        c.start = BASE + datetime.timedelta(hours=20)
+        c.end = BASE + datetime.timedelta(hours=21)
+        # Still indexed as it was added
+        self.assertEqual(self._names(index.at(BASE + datetime.timedelta(hours=5.5), 'C-FFSK')), ['c'])
+        index.add(c)
+        self.assertEqual(self._names(index.at(BASE + datetime.timedelta(hours=5.5), 'C-FFSK')), [])
+        self.assertEqual(self._names(index.at(BASE + datetime.timedelta(hours=20.5), 'C-FFSL')), ['c'])
+        index.remove('c')
+        self.assertEqual(len(index), 5)
+        self.assertEqual(self._names(index.at(BASE + datetime.timedelta(hours=20.5), 'C-FFSL')), [])
+
+    def test_random(self):
+        rnd = random.Random(1)
+        reservations = []
+        for n in range(300):
+            s = rnd.uniform(0, 1000)
+            reservations.append(_resv('r%d' % n, s, s + rnd.uniform(0, 30)))
+        index = wiflight.ReservationIndex(reservations)
+        for n in range(50):
+            s = rnd.uniform(-20, 1020)
+            e = s + rnd.uniform(0, 50)
+            qs = BASE + datetime.timedelta(hours=s)
+            qe = BASE + datetime.timedelta(hours=e)
+            expected = sorted(
+                r.name for r in reservations if r.start <= qe and r.end >= qs
+            )
+            self.assertEqual(sorted(self._names(index.overlapping(qs, qe))), expected)
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import threading
+import urlparse
+
+from wiflight.object import _decode_iso8601, _encode_iso8601
+
+class RangeClient(object):
+    """Answers flight searches from a list of (id, start) pairs"""
+    def __init__(self, flights, limit=None):
+        self.flights = flights
+        self.limit = limit
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def request(self, url, method, data=None, content_type="text/xml", etag=None):
+        with self.lock:
+            self.urls.append(url)
+        q = dict(urlparse.parse_qsl(url.split('?', 1)[1]))
+        start = _decode_iso8601(q['start'])
+        end = _decode_iso8601(q['end'])
+        # Flights are returned if they overlap the range by up to an hour
+        matches = [
+            f for f in self.flights
+            if f[1] + datetime.timedelta(hours=1) > start and f[1] < end
+        ]
+        if self.limit is not None and len(matches) > self.limit:
+            raise wiflight.HTTPError(url, 413, "Too many results")
+        return "text/xml", None, '<list>%s</list>' % (''.join(
+            '<flight id="%d"><start>%s</start></flight>' % (i, _encode_iso8601(s))
+            for i, s in reversed(matches)
+        ),)
+
+class WiFlightSearchExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        base = datetime.datetime(2014,1,1)
+        # A quiet month with a busy day in the middle
+        self.flights = [
+            (i, base + datetime.timedelta(days=i)) for i in range(30)
+        ] + [
+            (100 + i, base + datetime.timedelta(days=15, minutes=10 * i + 5))
+            for i in range(60)
+        ]
+        self.start = base
+        self.end = base + datetime.timedelta(days=30)
+
+    def _expected(self):
+        return [f[0] for f in sorted(self.flights, key=lambda f: f[1])]
+
+    def test_run(self):
+        client = RangeClient(self.flights)
+        executor = wiflight.FlightSearchExecutor(
+            [client, client, client], max_results=20, target_results=8
+        )
+        r = [f.id for f in executor.run(self.start, self.end)]
+        self.assertEqual(r, self._expected())
+        self.assertTrue(executor.splits > 0)
+        # Sparse slices grew longer than the initial day
+        self.assertTrue(executor.searches < 30 + 2 * executor.splits)
+
+    def test_server_refusal(self):
+        client = RangeClient(self.flights, limit=10)
+        executor = wiflight.FlightSearchExecutor([client, client], max_results=1000)
+        r = [f.id for f in executor.run(self.start, self.end)]
+        self.assertEqual(r, self._expected())
+
+    def test_unsplittable(self):
+        client = RangeClient(self.flights, limit=0)
+        executor = wiflight.FlightSearchExecutor(
+            [client], min_slice=datetime.timedelta(days=1)
+        )
+        with self.assertRaises(wiflight.HTTPError):
+            list(executor.run(self.start, self.end))
+
+    def test_server_error(self):
+        class FailingClient(RangeClient):
+            failures = 0
+            def request(self, url, *args, **kwargs):
+                if self.failures:
+                    self.failures -= 1
+                    with self.lock:
+                        self.urls.append(url)
+                    raise wiflight.HTTPError(url, 503, "Service unavailable")
+                return RangeClient.request(self, url, *args, **kwargs)
+        client = FailingClient(self.flights)
+        executor = wiflight.FlightSearchExecutor([client], max_results=1000)
+        # Errors are retried at the same slice length
+        client.failures = 2
+        r = [f.id for f in executor.run(self.start, self.start + datetime.timedelta(days=1))]
+        self.assertEqual(r, [0])
+        self.assertEqual(len(set(client.urls)), 1)
+        self.assertEqual(executor.splits, 0)
+        # Then raised, not split
+        client.failures = 3
+        client.urls = []
+        with self.assertRaises(wiflight.HTTPError) as cm:
+            list(executor.run(self.start, self.start + datetime.timedelta(days=1)))
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(len(client.urls), 3)
+        self.assertEqual(executor.splits, 0)
+
+    def test_bad_args(self):
+        with self.assertRaises(TypeError):
+            wiflight.FlightSearchExecutor([None], start=self.start)
+
+if __name__ == '__main__':
+    unittest.main()
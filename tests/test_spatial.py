@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import cPickle as pickle
+
+from wiflight.flight import APIFlightTrackPoint
+
+def _point(t, lat, lon, agl):
+    return APIFlightTrackPoint((t, agl, agl, None, None, None, lat, lon, None, None))
+
+class WiFlightTrackSpatialIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = wiflight.TrackSpatialIndex(cell_size=0.1, window=10)
+        self.start1 = datetime.datetime(2014,6,1,12,0,0)
+        self.start2 = datetime.datetime(2014,7,1,12,0,0)
+        # Flight 1 flies east at low level along latitude 45.05
+        self.index.add_track(1, self.start1, [
+            _point(t, 45.05, -73.5 + t * 0.001, 100.0) for t in range(0, 500, 5)
+        ])
+        # Flight 2 flies north at high level along longitude -73.25
+        self.index.add_track(2, self.start2, [
+            _point(t, 44.8 + t * 0.001, -73.25, 1000.0) for t in range(0, 500, 5)
+        ])
+
+    def test_box(self):
+        hits = self.index.query_box(45.0, -73.3, 45.1, -73.2)
+        self.assertItemsEqual(hits.keys(), [1, 2])
+        ranges = hits[1]
+        self.assertEqual(len(ranges), 1)
+        self.assertTrue(ranges[0][0] <= self.start1 + datetime.timedelta(seconds=200))
+        self.assertTrue(ranges[0][1] >= self.start1 + datetime.timedelta(seconds=300))
+        self.assertTrue(ranges[0][1] <= self.start1 + datetime.timedelta(seconds=310))
+
+    def test_filters(self):
+        hits = self.index.query_box(45.0, -73.3, 45.1, -73.2, max_agl=152.4)
+        self.assertEqual(hits.keys(), [1])
+        hits = self.index.query_box(
+            45.0, -73.3, 45.1, -73.2, start=datetime.datetime(2014,6,15)
+        )
+        self.assertEqual(hits.keys(), [2])
+        self.assertEqual(self.index.query_box(46.0, -73.3, 46.1, -73.2), {})
+
+    def test_polygon(self):
+        # Triangle that contains flight 2's path but not flight 1's
+        hits = self.index.query_polygon([
+            (45.1, -73.26), (45.3, -73.26), (45.3, -73.24)
+        ])
+        self.assertEqual(hits.keys(), [2])
+        with self.assertRaises(ValueError):
+            self.index.query_polygon([(0, 0), (1, 1)])
+
+    def test_whole_world(self):
+        hits = self.index.query_box(-90.0, -180.0, 90.0, 180.0)
+        self.assertItemsEqual(hits.keys(), [1, 2])
+        # Only occupied cells are visited, not the whole grid
+        candidates = list(self.index._candidates(-90.0, 90.0, -180.0, 180.0))
+        self.assertTrue(len(candidates) < 10 * len(self.index))
+
+    def test_antimeridian(self):
+        index = wiflight.TrackSpatialIndex(cell_size=0.1, window=10)
+        # Flies west across the antimeridian
+        index.add_track(3, self.start1, [
+            _point(t, -17.0, 179.9 + t * 0.01 - (360.0 if 179.9 + t * 0.01 > 180.0 else 0.0), 1000.0)
+            for t in range(0, 30)
+        ])
+        # The windows crossing the antimeridian are split, not widened
+        # to the whole range of longitudes
+        self.assertTrue(len(index.cells) < 20)
+        self.assertEqual(index.query_box(-17.1, 179.0, -16.9, -179.0).keys(), [3])
+        self.assertEqual(index.query_box(-17.1, -179.9, -16.9, -179.7).keys(), [3])
+        self.assertEqual(index.query_box(-17.1, 179.95, -16.9, 180.0).keys(), [3])
+        self.assertEqual(index.query_box(-17.1, 0.0, -16.9, 10.0), {})
+        self.assertEqual(index.query_box(-17.1, -179.0, -16.9, 179.0), {})
+
+    def test_remove_and_pickle(self):
+        index = pickle.loads(pickle.dumps(self.index, 2))
+        self.assertEqual(index.flight_ids, set([1, 2]))
+        index.remove_flight(1)
+        self.assertEqual(index.flight_ids, set([2]))
+        hits = index.query_box(45.0, -73.3, 45.1, -73.2)
+        self.assertEqual(hits.keys(), [2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import datetime
+import os
+import shutil
+import tempfile
+
+import server
+
+def _search(flights, etag='"1"'):
+    return (etag, "text/xml", '<?xml version="1.0" encoding="UTF-8"?><list>%s</list>' % (
+        ''.join(
+            '<flight id="%d"><start>%s</start><headline>%s</headline></flight>' % f
+            for f in flights
+        ),
+    ))
+
+class WiFlightFlightSyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sync.sqlite')
+        self.reported = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _callback(self, flight, is_new):
+        self.reported.append((flight.id, is_new))
+
+    def test_poll(self):
+        sync = wiflight.FlightSync(
+            self.path, overlap=datetime.timedelta(hours=6),
+            initial_start=datetime.datetime(2014,6,1)
+        )
+        self.client.contents['a/flight/?start=20140601T000000Z'] = _search([
+            (2, '20140601T120000Z', 'b'), (1, '20140601T100000Z', 'a'),
+        ])
+        self.assertEqual(sync.poll(self.client, self._callback), 2)
+        self.assertEqual(self.reported, [(1, True), (2, True)])
+        self.assertEqual(sync.watermark, datetime.datetime(2014,6,1,12,0,0))
+        sync.close()
+
+        # A new process picks up where the previous one left off
+        sync = wiflight.FlightSync(self.path, overlap=datetime.timedelta(hours=6))
+        self.reported = []
+        self.client.contents['a/flight/?start=20140601T060000Z'] = _search([
+            (1, '20140601T100000Z', 'a'), (2, '20140601T120000Z', 'changed'),
+            (3, '20140601T110000Z', 'late upload'),
+        ])
+        self.assertEqual(sync.poll(self.client, self._callback), 2)
+        self.assertEqual(self.reported, [(3, True), (2, False)])
+        # Nothing new
+        self.reported = []
+        self.assertEqual(sync.poll(self.client, self._callback), 0)
+        self.assertEqual(self.reported, [])
+
+    def test_quiet_poll(self):
+        sync = wiflight.FlightSync(
+            self.path, overlap=datetime.timedelta(hours=6),
+            initial_start=datetime.datetime(2014,6,1)
+        )
+        requests = []
+        client = self.client
+        class CountingClient(object):
+            def request(self, url, method, **kwargs):
+                requests.append(kwargs.get('if_none_match'))
+                return client.request(url, method, **kwargs)
+        counting = CountingClient()
+        self.client.contents['a/flight/?start=20140601T000000Z'] = _search([
+            (1, '20140601T010000Z', 'a'),
+        ])
+        self.assertEqual(sync.poll(counting, self._callback), 1)
+        # The watermark did not move the start of the search
+        url = 'a/flight/?start=20140531T190000Z'
+        self.client.contents[url] = _search([(1, '20140601T010000Z', 'a')])
+        self.assertEqual(sync.poll(counting, self._callback), 0)
+        # Same search again: answered with 304
+        self.assertEqual(sync.poll(counting, self._callback), 0)
+        self.assertEqual(requests, [None, None, '"1"'])
+        # A late upload changes the result and its ETag
+        self.client.contents[url] = _search([
+            (1, '20140601T010000Z', 'a'), (2, '20140601T003000Z', 'late'),
+        ], etag='"2"')
+        self.assertEqual(sync.poll(counting, self._callback), 1)
+        self.assertEqual(self.reported, [(1, True), (2, True)])
+        self.assertEqual(requests[-1], '"1"')
+
+    def test_callback_failure(self):
+        sync = wiflight.FlightSync(
+            self.path, initial_start=datetime.datetime(2014,6,1)
+        )
+        self.client.contents['a/flight/?start=20140601T000000Z'] = _search([
+            (1, '20140601T100000Z', 'a'),
+        ])
+        def fail(flight, is_new):
+            raise RuntimeError("downstream unavailable")
+        with self.assertRaises(RuntimeError):
+            sync.poll(self.client, fail)
+        self.assertIsNone(sync.watermark)
+        self.assertEqual(sync.poll(self.client, self._callback), 1)
+
+    def test_load_flights(self):
+        sync = wiflight.FlightSync(
+            self.path, initial_start=datetime.datetime(2010,6,26), load_flights=True
+        )
+        self.client.contents['a/flight/?start=20100626T000000Z'] = _search([
+            (3189, '20100626T233633Z', 'local at SWF'),
+        ])
+        flights = []
+        sync.poll(self.client, lambda f, n: flights.append(f))
+        self.assertEqual(flights[0].engine_ontime, 7139.5)
+        self.assertEqual(sync.known(3189)[1], '0')
+
+if __name__ == '__main__':
+    unittest.main()
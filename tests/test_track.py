@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+import unittest
+import wiflight
+import math
+
+from wiflight.flight import APIFlightTrackPoint
+
+import server
+
+def _point(t, head=0.0, lat=45.0, lon=-73.0, alt=100.0, agl=None):
+    return APIFlightTrackPoint((t, agl, alt, None, 50.0, head, lat, lon, 2400, 0.0))
+
+class WiFlightTrackIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.MockClient()
+
+    def test_from_track(self):
+        t = wiflight.APIFlight(67).track()
+        t.load(self.client)
+        index = wiflight.TrackIndex(t)
+        self.assertEqual(len(index), 1)
+        p = index.nearest(0)
+        self.assertEqual(p.t, 900.0)
+        self.assertAlmostEqual(p.lat, 50.8325239364)
+        self.assertEqual(p.rpm, 3053.0)
+
+    def test_load(self):
+        index = wiflight.TrackIndex.load(self.client, wiflight.APIFlight(68))
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.at(450).alt, 450.0)
+
+    def test_nearest(self):
+        index = wiflight.TrackIndex(_point(t) for t in (0, 1, 2, 4, 8))
+        self.assertEqual(index.nearest_index(-5), 0)
+        self.assertEqual(index.nearest_index(2.9), 2)
+        self.assertEqual(index.nearest_index(3.1), 3)
+        self.assertEqual(index.nearest_index(100), 4)
+        self.assertIsNone(wiflight.TrackIndex().nearest(1))
+
+    def test_out_of_order(self):
+        index = wiflight.TrackIndex(_point(t, alt=t) for t in (3, 1, 2))
+        self.assertEqual(list(index.times), [1, 2, 3])
+        self.assertEqual(list(index.columns['alt']), [1, 2, 3])
+
+    def test_interpolate(self):
+        index = wiflight.TrackIndex([
+            _point(0, alt=100.0), _point(10, alt=200.0), _point(20, alt=100.0)
+        ])
+        r = index.interpolate('alt', [5, 15, 10, -1, 25, 2.5])
+        self.assertEqual(list(r[:3]), [150.0, 150.0, 200.0])
+        self.assertTrue(math.isnan(r[3]))
+        self.assertTrue(math.isnan(r[4]))
+        self.assertEqual(r[5], 125.0)
+        # Missing values do not propagate into neighbouring intervals
+        r = index.interpolate('agl', [5])
+        self.assertTrue(math.isnan(r[0]))
+        self.assertIsNone(index.at(5).agl)
+
+    def test_head_wraparound(self):
+        index = wiflight.TrackIndex([
+            _point(0, head=2 * math.pi - 0.1), _point(2, head=0.1)
+        ])
+        r = index.interpolate('head', [1, 0.5, 1.5])
+        self.assertAlmostEqual(r[0] % (2 * math.pi), 0.0)
+        self.assertAlmostEqual(r[1], 2 * math.pi - 0.05)
+        self.assertAlmostEqual(r[2], 0.05)
+
+    def test_interpolate_numpy(self):
+        numpy = wiflight.track._numpy()
+        if numpy is None:
+            self.skipTest("numpy is not installed")
+        index = wiflight.TrackIndex([
+            _point(t, head=(t * 0.7) % (2 * math.pi), alt=t * t,
+                   agl=None if t % 7 == 3 else t)
+            for t in (0, 1, 2, 2, 3.5, 5, 8, 13, 21)
+        ])
+        times = [21, -1, 0, 0.5, 2, 2.5, 4, 3.5, 12.9, 22, float('nan'), 1]
+        for c in ('alt', 'agl', 'head'):
+            expected = wiflight.track._interpolate(
+                index.columns['t'], index.columns[c], times, c == 'head'
+            )
+            got = wiflight.track._interpolate_numpy(
+                numpy, index.columns['t'], index.columns[c], times, c == 'head'
+            )
+            self.assertEqual(len(got), len(times))
+            for g, e in zip(got, expected):
+                if math.isnan(e):
+                    self.assertTrue(math.isnan(g))
+                else:
+                    self.assertAlmostEqual(g, e)
+        self.assertEqual(len(wiflight.TrackIndex().interpolate('alt', [1, 2])), 2)
+
+    def test_resample(self):
+        index = wiflight.TrackIndex([
+            _point(0.25, alt=0.0), _point(3.75, alt=350.0)
+        ])
+        r = index.resample(1.0)
+        self.assertEqual(list(r.times), [1.0, 2.0, 3.0])
+        for got, expected in zip(r.columns['alt'], [75.0, 175.0, 275.0]):
+            self.assertAlmostEqual(got, expected)
+        r = index.resample(2.0, start=0.25)
+        self.assertEqual(len(r), 8)
+
+class WiFlightTrackSimplifyTestCase(unittest.TestCase):
+    def _leg(self):
+        # A straight leg north, a 90 degree turn, then a climb east
+        points = [_point(t, lat=45.0 + t * 1e-4) for t in range(50)]
+        lat = points[-1].lat
+        points += [_point(50 + t, lat=lat, lon=-73.0 + t * 1e-4) for t in range(50)]
+        points += [
+            _point(100 + t, lat=lat, lon=-73.0 + (50 + t) * 1e-4, alt=100.0 + 10.0 * t)
+            for t in range(50)
+        ]
+        return points
+
+    def test_tolerance(self):
+        points = self._leg()
+        r = wiflight.track.simplify(points, tolerance=5.0)
+        self.assertEqual([p.t for p in r], [0, 49, 100, 149])
+
+    def test_missing_altitude(self):
+        # Gaps in altitude on a level straight leg are not climbs
+        points = [
+            _point(t, lat=45.0 + t * 1e-4, alt=None if t % 3 else 1000.0)
+            for t in range(30)
+        ]
+        points[0] = _point(0, lat=45.0, alt=None)
+        r = wiflight.track.simplify(points, tolerance=5.0)
+        self.assertEqual([p.t for p in r], [0, 29])
+
+    def test_max_points(self):
+        points = self._leg()
+        r = wiflight.track.simplify(points, max_points=3)
+        self.assertEqual(len(r), 3)
+        self.assertEqual(r[0].t, 0)
+        self.assertEqual(r[-1].t, 149)
+        with self.assertRaises(ValueError):
+            wiflight.track.simplify(points)
+
+    def test_streaming(self):
+        points = self._leg()
+        simplifier = wiflight.track.TrackSimplifier(5.0)
+        out = []
+        for i in range(0, len(points), 20):
+            out.extend(simplifier.feed(points[i:i + 20]))
+        out.extend(simplifier.flush())
+        self.assertEqual([p.t for p in out], [0, 49, 100, 149])
+
+    def test_streaming_straight_leg(self):
+        points = [_point(t, lat=45.0 + t * 1e-4) for t in range(5000)]
+        simplify_indices = wiflight.track._simplify_indices
+        processed = []
+        def counting(xyz, tolerance, max_points):
+            processed.append(len(xyz))
+            return simplify_indices(xyz, tolerance, max_points)
+        wiflight.track._simplify_indices = counting
+        try:
+            simplifier = wiflight.track.TrackSimplifier(5.0)
+            out = []
+            for i in range(0, len(points), 10):
+                out.extend(simplifier.feed(points[i:i + 10]))
+            out.extend(simplifier.flush())
+        finally:
+            wiflight.track._simplify_indices = simplify_indices
+        self.assertEqual([p.t for p in out], [0, 4999])
+        # Each point is simplified a bounded number of times
+        self.assertTrue(sum(processed) < 3 * len(points))
+
+if __name__ == '__main__':
+    unittest.main()
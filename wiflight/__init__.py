@@ -3,6 +3,21 @@
 from wiflight.client import APISession, HTTPError
 from wiflight.object import APIObject
 from wiflight.flight import APIFlight, APIFlightSearch
-from wiflight.aircraft import APIAircraft, APIAircraftSearch
+from wiflight.aircraft import APIAircraft, APIAircraftSearch, AircraftRegistry
 from wiflight.reservation import APIReservation
-from wiflight.crewdb import APICrewDbEntry, APICrewDbSearch, APICrewDbAnyFleet
+from wiflight.crewdb import APICrewDbEntry, APICrewDbSearch, APICrewDbAnyFleet, CrewDbReplica
+from wiflight.track import TrackIndex
+from wiflight.export import GPXWriter, KMLWriter, KMZWriter, CSVWriter, ColumnarWriter
+from wiflight.spatial import TrackSpatialIndex
+from wiflight.bulk import ParallelDecoder, FlightSummary
+from wiflight.aggregate import EventCountAggregator
+from wiflight.sync import FlightSync
+from wiflight.search import FlightSearchExecutor
+from wiflight.catalog import FlightCatalog
+from wiflight.cache import SearchCache, query_key
+from wiflight.query import FlightQuery
+from wiflight.imagecache import AircraftImageCache
+from wiflight.maintenance import MaintenanceRollup
+from wiflight.reconcile import ReservationReconciler
+from wiflight.schedule import ReservationIndex
+from wiflight.crewimport import CrewDbImporter
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+
+"""Fleet-wide aggregation of flight event counts
+
+APIFlightSearch can return, for each flight, the number of events in
+each of several ranges of severity. EventCountAggregator runs such
+searches one day at a time across a long period, possibly on several
+sessions concurrently, and accumulates the counts per aircraft, day
+and severity band. The accumulated counts can be saved to a file so
+that later runs only need to fetch days that were not done yet.
+"""
+
+from wiflight.flight import APIFlightSearch
+from wiflight.parallel import client_map
+import datetime
+import json
+import os
+
+class EventCountAggregator(object):
+    """Accumulate event counts by aircraft, day and severity band
+
+    Example:
+
+    agg = wiflight.EventCountAggregator(["30..39", "40.."], path="counts.json")
+    agg.run([session1, session2], datetime.date(2014,1,1), datetime.date(2015,1,1))
+    per_aircraft = agg.histogram(('aircraft', 'band'))
+    high_severity_c_ffsk = per_aircraft.get(('C-FFSK', '40..'), 0)
+
+    Flights are attributed to the UTC day on which they start. Flights
+    without an aircraft are counted under the aircraft None.
+    """
+
+    def __init__(self, ranges, path=None, kw=None, group=()):
+        """:param ranges: sequence of severity range strings, as
+        understood by the events parameter of APIFlightSearch (e.g.
+        "30..39" or ".."). Each range is a band of the histogram.
+        :param path: if given, file in which accumulated counts are
+        kept between runs. It is loaded now if it exists.
+        :param kw: optional keywords restricting the searched flights
+        :param group: optional group names restricting the searched flights
+        """
+        self.ranges = [str(r) for r in ranges]
+        if not self.ranges:
+            raise ValueError("At least one severity range is required")
+        self.path = path
+        self.kw = kw
+        self.group = list(group)
+        self.days = set()
+        self.counts = {}
+        self.flights = {}
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            state = json.load(f)
+        if state['ranges'] != self.ranges or state.get('kw') != self.kw or \
+                state.get('group', []) != self.group:
+            raise ValueError(
+                "%s was accumulated with different search parameters" % (self.path,)
+            )
+        self.days = set(
+            datetime.datetime.strptime(d, '%Y-%m-%d').date() for d in state['days']
+        )
+        for tail, day, nflights, counts in state['rows']:
+            key = tail, datetime.datetime.strptime(day, '%Y-%m-%d').date()
+            self.flights[key] = nflights
+            self.counts[key] = counts
+
+    def save(self):
+        """Write accumulated counts to the file given at construction
+
+        The file is replaced atomically.
+        """
+        if self.path is None:
+            raise ValueError("No path to save to")
+        state = {
+            'ranges': self.ranges,
+            'kw': self.kw,
+            'group': self.group,
+            'days': sorted(d.isoformat() for d in self.days),
+            'rows': [
+                [tail, day.isoformat(), self.flights[(tail, day)], counts]
+                for (tail, day), counts in sorted(self.counts.iteritems())
+            ],
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            json.dump(state, f)
+        os.rename(tmp, self.path)
+
+    def _fetch_day(self, client, day):
+        start = datetime.datetime.combine(day, datetime.time())
+        search = APIFlightSearch(
+            kw=self.kw, start=start, end=start + datetime.timedelta(days=1),
+            events=','.join(self.ranges), group=self.group
+        )
+        search.load(client)
+        out = []
+        for flight in search:
+            flight_start = flight.start
+            if flight_start is not None and flight_start.date() != day:
+                # Will be (or was) counted on the day it started
+                continue
+            counts = flight.event_counts or []
+            tail = flight.body.findtext('aircraft/tail')
+            out.append((tail, counts))
+        return day, out
+
+    def run(self, clients, start, end, settle=datetime.timedelta(days=1), now=None):
+        """Fetch and accumulate all days in [start, end) not done yet
+
+        :param clients: sequence of sessions, used concurrently (see
+        wiflight.parallel.client_map)
+        :param start: first day (datetime.date)
+        :param end: day after the last day (datetime.date)
+        :param settle: flights are uploaded some time after they end,
+        so a day is only recorded as done once it ended at least this
+        long ago. More recent days are counted but fetched again (after
+        discarding their counts) on the next run.
+        :param now: current UTC time, for testing
+
+        If a path was given, the counts are saved after each day.
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        days = []
+        day = start
+        while day < end:
+            if day not in self.days:
+                days.append(day)
+            day += datetime.timedelta(days=1)
+        for day, flights in client_map(clients, self._fetch_day, days):
+            for key in [k for k in self.counts if k[1] == day]:
+                del self.counts[key]
+                del self.flights[key]
+            for tail, counts in flights:
+                key = tail, day
+                total = self.counts.get(key)
+                if total is None:
+                    total = self.counts[key] = [0] * len(self.ranges)
+                    self.flights[key] = 0
+                self.flights[key] += 1
+                for i, c in enumerate(counts[:len(total)]):
+                    total[i] += c
+            day_end = datetime.datetime.combine(day, datetime.time()) + \
+                datetime.timedelta(days=1)
+            if day_end + settle <= now:
+                self.days.add(day)
+            if self.path is not None:
+                self.save()
+
+    def histogram(self, by=('aircraft', 'day', 'band')):
+        """Event counts summed over the dimensions not listed in by
+
+        :param by: sequence of dimension names among 'aircraft', 'day'
+        and 'band'
+
+        Returns a dictionary mapping tuples of values of the dimensions
+        in by (in the same order) to event counts.
+        """
+        for d in by:
+            if d not in ('aircraft', 'day', 'band'):
+                raise ValueError("Unknown dimension %r" % (d,))
+        out = {}
+        for (tail, day), counts in self.counts.iteritems():
+            for band, c in zip(self.ranges, counts):
+                values = { 'aircraft': tail, 'day': day, 'band': band }
+                key = tuple(values[d] for d in by)
+                out[key] = out.get(key, 0) + c
+        return out
+
+    def flight_totals(self, by=('aircraft', 'day')):
+        """Numbers of flights, summed like histogram (without 'band')"""
+        for d in by:
+            if d not in ('aircraft', 'day'):
+                raise ValueError("Unknown dimension %r" % (d,))
+        out = {}
+        for (tail, day), n in self.flights.iteritems():
+            values = { 'aircraft': tail, 'day': day }
+            key = tuple(values[d] for d in by)
+            out[key] = out.get(key, 0) + n
+        return out
@@ -1,7 +1,10 @@
 #!/usr/bin/python
 
 from wiflight.object import APIObject, APIListObject
+from wiflight.client import HTTPError
+import lxml.etree
 from copy import deepcopy
+import threading
 import urllib
 
 class APIAircraft(APIObject):
@@ -78,6 +81,256 @@ APIAircraft._add_simple_bool_property(
 )
 del k, v
 
+def _read_only(*args, **kwargs):
+    raise AttributeError(
+        "Shared aircraft are read-only; load an APIAircraft to modify it"
+    )
+
+class _SharedAircraft(APIAircraft):
+    """APIAircraft handed out by AircraftRegistry, which must not change
+
+    Setting or deleting attributes and properties, load, save and
+    delete raise AttributeError, and groups is a frozenset. This is
+    only a shallow protection: the body is shared by every holder of
+    the aircraft and must not be modified directly.
+    """
+    __slots__ = ('_frozen',)
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            _read_only()
+        APIAircraft.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if getattr(self, '_frozen', False):
+            _read_only()
+        APIAircraft.__delattr__(self, name)
+
+    load = save = save_noguard = delete = delete_noguard = _read_only
+
+    @property
+    def groups(self):
+        """Frozen set of group names which the aircraft is a member of"""
+        return frozenset(APIAircraft.groups.fget(self))
+
+class AircraftRegistry(object):
+    """Read-only aircraft shared by all the objects of a session
+
+    Every flight and reservation embeds a complete <aircraft>, and each
+    access to their aircraft property makes a new copy of it. The
+    registry keeps a single read-only APIAircraft per aircraft ID
+    instead, and remembers which ID each tail number belongs to.
+    Flights and reservations attached to a registry (by attach or
+    iter_shared) keep only the ID and tail number of their aircraft,
+    and their aircraft property returns the shared aircraft without
+    copying it.
+
+    Example:
+
+    registry = wiflight.AircraftRegistry(client)
+    search.load(client)
+    for flight in registry.iter_shared(search):
+        print flight.aircraft.tail, flight.aircraft.model
+    ffsk = registry.get("C-FFSK")
+
+    Shared aircraft raise AttributeError when modified through their
+    properties or methods, but their XML body is shared and must not be
+    modified directly. To change an aircraft, load it as a new
+    APIAircraft. After an aircraft is changed, forget it so that it is
+    loaded again.
+    """
+
+    def __init__(self, client=None):
+        """:param client: session used to load aircraft which have not
+        been seen yet. Without one, get only returns aircraft which were
+        seen in loaded objects."""
+        self.client = client
+        self._by_id = {}
+        self._ids_by_tail = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The session is not pickled
+        return self._by_id, self._ids_by_tail
+
+    def __setstate__(self, state):
+        self._by_id, self._ids_by_tail = state
+        self.client = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _add(self, aircraft_id, body):
+        """Register an aircraft; body is not copied"""
+        with self._lock:
+            ac = self._by_id.get(aircraft_id)
+            if ac is None:
+                ac = _SharedAircraft(aircraft_id)
+                ac.body = body
+                ac._frozen = True
+                self._by_id[aircraft_id] = ac
+            tail = ac.body.findtext('tail')
+            if tail:
+                self._ids_by_tail[tail.upper()] = aircraft_id
+            return ac
+
+    def intern(self, xml):
+        """Return the shared APIAircraft for an <aircraft> element
+
+        The element is only copied the first time its aircraft is seen.
+        Returns None if the element does not identify an aircraft that
+        the registry knows or can look up.
+        """
+        aircraft_id = xml.get('id')
+        if aircraft_id is None:
+            tail = xml.get('tail') or xml.findtext('tail')
+            if tail is None:
+                return None
+            try:
+                return self.get(tail)
+            except KeyError:
+                return None
+        try:
+            aircraft_id = int(aircraft_id)
+        except ValueError:
+            return None
+        ac = self._by_id.get(aircraft_id)
+        if ac is not None:
+            return ac
+        return self._add(aircraft_id, deepcopy(xml))
+
+    def resolve(self, tail):
+        """Return the ID of the aircraft with this tail number
+
+        The aircraft is loaded from the server the first time if it was
+        not seen before. KeyError is raised if it cannot be found.
+        """
+        aircraft_id = self._ids_by_tail.get(tail.upper())
+        if aircraft_id is not None:
+            return aircraft_id
+        if self.client is None:
+            raise KeyError(tail)
+        ac = APIAircraft(tail)
+        try:
+            ac.load(self.client)
+        except HTTPError, e:
+            if e.code == 404:
+                raise KeyError(tail)
+            raise
+        return self._add(ac.id, ac.body).id
+
+    def get(self, aircraft_id):
+        """Return the shared APIAircraft for an ID or a tail number
+
+        KeyError is raised if it cannot be found.
+        """
+        if isinstance(aircraft_id, basestring):
+            aircraft_id = self.resolve(aircraft_id)
+        ac = self._by_id.get(aircraft_id)
+        if ac is not None:
+            return ac
+        if self.client is None:
+            raise KeyError(aircraft_id)
+        ac = APIAircraft(aircraft_id)
+        try:
+            ac.load(self.client)
+        except HTTPError, e:
+            if e.code == 404:
+                raise KeyError(aircraft_id)
+            raise
+        return self._add(aircraft_id, ac.body)
+
+    def aircraft_of(self, obj):
+        """Shared aircraft of a flight or reservation, or None"""
+        xml = obj.body.find('aircraft')
+        if xml is None:
+            return None
+        return self.intern(xml)
+
+    def attach(self, obj):
+        """Make a flight or reservation use the shared aircraft
+
+        The <aircraft> of obj is replaced by one with only the ID and
+        tail number, and its aircraft property returns the shared
+        aircraft from then on. Setting its aircraft registers the new
+        aircraft if it was not seen before.
+        """
+        xml = obj.body.find('aircraft')
+        if xml is not None:
+            thin = self._thin(self.intern(xml), xml)
+            thin.tail = xml.tail
+            xml.getparent().replace(xml, thin)
+        obj._registry = self
+
+    @staticmethod
+    def _thin(ac, xml):
+        """<aircraft> element with only the ID and tail number"""
+        thin = lxml.etree.Element('aircraft')
+        if ac is not None:
+            thin.set('id', str(ac.id))
+            tail = ac.tail
+        else:
+            for k, v in xml.attrib.iteritems():
+                thin.set(k, v)
+            tail = xml.findtext('tail')
+        if tail is not None:
+            lxml.etree.SubElement(thin, 'tail').text = tail
+        return thin
+
+    def iter_shared(self, list_obj):
+        """Iterate over a loaded search like iter(list_obj), registering
+        the aircraft of each object
+
+        The objects returned are attached to the registry (see attach):
+        they keep only the ID and tail number of their aircraft instead
+        of a complete copy. The search itself is not modified, so it
+        still holds complete copies until it is released.
+        """
+        for sub in list_obj.body:
+            constructor = list_obj._list_contents_map.get(sub.tag, None)
+            if constructor is None:
+                continue
+            xml = sub.find('aircraft')
+            if xml is None:
+                yield constructor.from_xml(sub)
+                continue
+            ac = self.intern(xml)
+            # Copy the object with a thin aircraft, without modifying
+            # the search, which may be used by other threads
+            item = lxml.etree.Element(sub.tag, dict(sub.attrib))
+            item.text = sub.text
+            for child in sub:
+                if child is xml:
+                    thin = self._thin(ac, xml)
+                    thin.tail = xml.tail
+                    item.append(thin)
+                else:
+                    item.append(deepcopy(child))
+            # Identify the object from the attributes alone if possible,
+            # to avoid copying the item again
+            o = constructor.from_xml(lxml.etree.Element(sub.tag, dict(sub.attrib)))
+            if o is None:
+                o = constructor.from_xml(item)
+            else:
+                o.body = item
+            if o is not None and isinstance(o, WithAircraftMixIn):
+                o._registry = self
+            yield o
+
+    def forget(self, aircraft_id=None):
+        """Forget one aircraft (by ID), or all of them"""
+        with self._lock:
+            if aircraft_id is None:
+                self._by_id.clear()
+                self._ids_by_tail.clear()
+                return
+            ac = self._by_id.pop(aircraft_id, None)
+            if ac is not None:
+                for tail, i in self._ids_by_tail.items():
+                    if i == aircraft_id:
+                        del self._ids_by_tail[tail]
+
 class WithAircraftMixIn(object):
     """For objects that have an attached aircraft"""
     __slots__ = ()
@@ -97,7 +350,14 @@ class WithAircraftMixIn(object):
 
         When these objects are returned by the server, however, all of the
         aircraft's attrributes will be filled in.
+
+        Each access returns a new copy of the aircraft, unless the object
+        is attached to an AircraftRegistry, in which case the shared,
+        read-only aircraft is returned.
         """
+        registry = getattr(self, '_registry', None)
+        if registry is not None:
+            return registry.aircraft_of(self)
         aclist = self.body.xpath("/" + self._toptag + "/aircraft")
         if not aclist:
             return None
@@ -108,6 +368,11 @@ class WithAircraftMixIn(object):
     def aircraft(self, value):
         if not isinstance(value, APIAircraft):
             raise ValueError("aircraft must be set to APIAircraft object")
+        registry = getattr(self, '_registry', None)
+        if registry is None:
+            new = deepcopy(value.body)
+        else:
+            new = registry._thin(registry.intern(value.body), value.body)
         aclist = self.body.xpath("/" + self._toptag + "/aircraft")
         if aclist:
             tag = aclist[0]
@@ -115,10 +380,10 @@ class WithAircraftMixIn(object):
             position = toptag.index(tag)
             for x in aclist:
                 x.getparent().remove(x)
-            toptag.insert(position, deepcopy(value.body))
+            toptag.insert(position, new)
         else:
             toptag = self.body.xpath("/" + self._toptag)[0]
-            toptag.append(deepcopy(value.body))
+            toptag.append(new)
 
     @aircraft.deleter
     def aircraft(self):
@@ -138,10 +403,21 @@ class APIAircraftSearch(APIListObject):
         pass
 
     This type of object can only be loaded, not saved or deleted.
+    After load, to_columns and to_dataframe return the aircraft
+    properties as numpy arrays or a pandas DataFrame.
     """
     __slots__ = ()
     _toptag = 'list'
     _list_contents_map = { 'aircraft': APIAircraft }
+    _columns = ('aircraft', [
+        ('id', 'int', '@id'),
+        ('tail', 'text', 'tail'),
+        ('model', 'text', 'model'),
+        ('model_url', 'text', 'model_url'),
+        ('cockpit_height', 'float', 'cockpit_height'),
+        ('prop_blades', 'float', 'prop_blades'),
+        ('pressurized', 'bool', 'pressurized'),
+    ])
 
     def __init__(self, query):
         """Search for aircraft by keyword on the server.
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+"""Parallel decoding of large responses for bulk ingestion
+
+Building APIFlight objects from a large search response, or points
+from many track responses, is limited by a single CPU. The functions
+in this module decode raw response bodies straight into compact,
+picklable records, and ParallelDecoder runs them in a pool of worker
+processes so that decoding scales with the number of cores.
+"""
+
+from wiflight.object import _decode_iso8601
+from wiflight.flight import _summary_properties
+from wiflight.track import CHANNELS, TrackIndex
+import lxml.etree
+import collections
+import io
+import multiprocessing
+
+def FlightSummary():
+    attributes = [
+        ('id', 'The flight\'s integer identifier'),
+        ('start', 'Start of flight in UTC'),
+        ('headline', 'Short text string that describes the flight'),
+        ('aircraft_id', 'Integer identifier of the flight\'s aircraft'),
+        ('aircraft_tail', 'Tail number of the flight\'s aircraft'),
+    ] + [(k, v + " (float)") for k, v in _summary_properties]
+    d = { '__slots__': () }
+    def _tuple_accessor(idx, doc):
+        return property(lambda self: self[idx], doc=doc)
+    for n, tpa in enumerate(attributes):
+        d[tpa[0]] = _tuple_accessor(n, tpa[1])
+    d['_fields'] = tuple(x[0] for x in attributes)
+    d['__doc__'] = """Read-only summary of a flight
+
+    This holds the identification and numeric summary fields of an
+    APIFlight, without its XML document. Numeric fields are floats.
+    """
+    return type('FlightSummary', (tuple,), d)
+FlightSummary = FlightSummary()
+
+_float_fields = frozenset(k for k, v in _summary_properties)
+_field_positions = dict((k, n) for n, k in enumerate(FlightSummary._fields))
+
+def decode_flight(xml):
+    """Decode a <flight> element into a FlightSummary
+
+    Returns None if the flight has no valid identifier.
+    """
+    try:
+        flight_id = int(xml.get('id'))
+    except (ValueError, TypeError):
+        return None
+    values = [None] * len(_field_positions)
+    values[0] = flight_id
+    for child in xml:
+        tag = child.tag
+        text = child.text
+        if tag in _float_fields:
+            if text is not None:
+                values[_field_positions[tag]] = float(text)
+        elif tag == 'start':
+            if text is not None:
+                values[1] = _decode_iso8601(text)
+        elif tag == 'headline':
+            values[2] = text
+        elif tag == 'aircraft':
+            aircraft_id = child.get('id')
+            if aircraft_id is not None:
+                values[3] = int(aircraft_id)
+            values[4] = child.findtext('tail')
+    return FlightSummary(values)
+
+def iter_elements(body, tag):
+    """Incrementally parse a response body and yield elements with a tag
+
+    Each element is cleared once the consumer moves on to the next one,
+    so that memory use stays bounded no matter how large the body is.
+    Elements must not be kept after the iteration has moved past them.
+    """
+    for event, elem in lxml.etree.iterparse(io.BytesIO(body), events=('end',), tag=tag):
+        yield elem
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+def decode_flight_search(body):
+    """Decode an APIFlightSearch response body into a list of FlightSummary"""
+    out = []
+    for elem in iter_elements(body, 'flight'):
+        if elem.getparent() is None:
+            # Only <flight> elements inside the <list> are flights
+            continue
+        summary = decode_flight(elem)
+        if summary is not None:
+            out.append(summary)
+    return out
+
+def decode_track(body):
+    """Decode an APIFlightTrack response body into a TrackIndex"""
+    index = TrackIndex()
+    columns = [(c, index.columns[c]) for c in CHANNELS]
+    nan = float('nan')
+    for elem in iter_elements(body, 'point'):
+        if elem.get('t') is None:
+            continue
+        for name, col in columns:
+            v = elem.get(name)
+            col.append(nan if v is None else float(v))
+    times = index.columns['t']
+    if any(times[i] > times[i + 1] for i in xrange(len(times) - 1)):
+        index._sort()
+    return index
+
+class ParallelDecoder(object):
+    """Pool of worker processes that decode response bodies
+
+    Example:
+
+    with wiflight.ParallelDecoder() as decoder:
+        searches = [
+            wiflight.APIFlightSearch(start=day, end=day + one_day, events=True)
+            for day in days
+        ]
+        for summaries in decoder.load_searches(client, searches):
+            for summary in summaries:
+                pass
+
+    Downloads happen in the calling thread while earlier responses are
+    being decoded by the workers. Results are returned in the same order
+    as the requests.
+    """
+
+    def __init__(self, processes=None, backlog=None):
+        """:param processes: number of worker processes; defaults to
+        the number of CPUs
+        :param backlog: maximum number of responses waiting to be
+        decoded or collected; defaults to twice the number of processes
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(processes)
+        if backlog is None:
+            backlog = 2 * processes
+        self.backlog = max(backlog, 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def close(self):
+        """Wait for outstanding work and stop the worker processes"""
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """Stop the worker processes immediately"""
+        self.pool.terminate()
+        self.pool.join()
+
+    def decode(self, func, bodies):
+        """Apply a decoding function to response bodies in the workers
+
+        :param func: a module-level function (so that it can be sent
+        to the workers) such as decode_flight_search or decode_track
+        :param bodies: iterable of response bodies. It is consumed
+        lazily, no more than backlog bodies ahead of the results.
+
+        Returns an iterator over the results, in order.
+        """
+        pending = collections.deque()
+        for body in bodies:
+            pending.append(self.pool.apply_async(func, (body,)))
+            if len(pending) >= self.backlog:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def load_searches(self, client, searches):
+        """Download flight searches and decode them into lists of FlightSummary
+
+        :param searches: iterable of APIFlightSearch
+        """
+        return self.decode(decode_flight_search, (
+            client.request(s.url, "GET")[2] for s in searches
+        ))
+
+    def load_tracks(self, client, tracks):
+        """Download flight tracks and decode them into TrackIndex objects
+
+        :param tracks: iterable of APIFlightTrack (see APIFlight.track)
+        """
+        return self.decode(decode_track, (
+            client.request(t.url, "GET")[2] for t in tracks
+        ))
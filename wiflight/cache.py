@@ -0,0 +1,206 @@
+#!/usr/bin/python
+
+"""Caching of search results
+
+Searches built by different code paths often differ only in the order
+of their parameters (for example group=['a', 'b'] and group=['b', 'a'])
+and produce different URLs for the same results. query_key gives such
+equivalent searches the same key, and SearchCache uses it to answer
+repeated searches (APIFlightSearch, APIAircraftSearch, APICrewDbSearch
+or any other object that is only loaded) from memory for a limited
+time, optionally backed by a cache shared between processes.
+"""
+
+from wiflight.object import _encode_iso8601
+import lxml.etree
+import collections
+import datetime
+import hashlib
+import re
+import threading
+import time
+import urllib
+import urlparse
+
+# Parameters whose values are dates
+_DATE_PARAMS = frozenset(('start', 'end'))
+
+# Forms of dates accepted in query strings. A date alone means
+# midnight at the beginning of that day.
+_DATE_FORMATS = (
+    '%Y%m%dT%H%M%SZ', '%Y%m%dT%H%M%S', '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S', '%Y%m%d', '%Y-%m-%d',
+)
+_OFFSET_RE = re.compile(r'^(.*T.*)([+-])(\d\d):?(\d\d)$')
+
+def _canonical_date(v):
+    """Parse a date parameter into a naive UTC datetime, or None"""
+    offset = datetime.timedelta(0)
+    m = _OFFSET_RE.match(v)
+    if m is not None:
+        v = m.group(1)
+        offset = datetime.timedelta(hours=int(m.group(3)), minutes=int(m.group(4)))
+        if m.group(2) == '-':
+            offset = -offset
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(v, fmt) - offset
+        except ValueError:
+            pass
+    return None
+
+def _canonical_param(k, v):
+    if k in _DATE_PARAMS:
+        d = _canonical_date(v)
+        if d is None:
+            return k, v
+        return k, _encode_iso8601(d)
+    if k == 'f':
+        try:
+            return k, str(int(v))
+        except ValueError:
+            return k, v
+    return k, v
+
+def query_key(obj):
+    """Normalized key of the URL of an API object
+
+    Parameters are sorted, repeated identical parameters are dropped,
+    and flight IDs and dates are written in a single canonical form
+    (dates with a UTC offset are converted to UTC, and a date alone
+    means midnight), so that equivalent searches have the same key.
+
+    Example:
+
+    a = wiflight.APIFlightSearch(group=['a', 'b'], f=[2, 1])
+    b = wiflight.APIFlightSearch(f=[1, 2], group=['b', 'a'])
+    assert wiflight.query_key(a) == wiflight.query_key(b)
+    """
+    if obj.query_string is None:
+        return obj.url
+    path = obj.url.split('?', 1)[0]
+    params = set(
+        _canonical_param(k, v)
+        for k, v in urlparse.parse_qsl(obj.query_string, keep_blank_values=True)
+    )
+    return path + '?' + urllib.urlencode(sorted(params))
+
+class SearchCache(object):
+    """Time-limited cache of search results
+
+    Example:
+
+    cache = wiflight.SearchCache(ttl=60)
+    search = wiflight.APIFlightSearch(kw="lowlevel", start=..., end=...)
+    cache.load(search, client)
+    for flight in search:
+        pass
+    # after saving a flight, searches may return something else
+    cache.invalidate()
+
+    Results are kept in memory, in least recently used order, for ttl
+    seconds. If shared is given, it is a cache shared with other
+    processes which has the get(key), set(key, value, ttl) and
+    delete(key) methods of memcache.Client; results missing from memory
+    are looked up there and stored there.
+
+    Cached results are the parsed results of the search, so a cached
+    search which loaded its results in several requests (see
+    APIFlightSearch.load) is answered without any request at all.
+
+    invalidate() without arguments forgets everything, including in the
+    shared cache. Other processes stop using what they have in memory
+    only when it expires, so ttl bounds how long they can see stale
+    results after an invalidation.
+    """
+
+    def __init__(self, ttl=300, max_entries=1000, shared=None, prefix='wiflight:'):
+        """:param ttl: lifetime of cached results, in seconds
+        :param max_entries: number of results kept in memory
+        :param shared: optional shared cache (see above)
+        :param prefix: prefix of the keys in the shared cache
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _generation(self):
+        generation = self.shared.get(self.prefix + 'generation')
+        if generation is None:
+            return 0
+        return generation
+
+    def _shared_key(self, key):
+        return '%s%s:%s' % (
+            self.prefix, self._generation(), hashlib.sha1(key).hexdigest()
+        )
+
+    def _get(self, key, now):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self._entries[key] = entry
+                return entry[1]
+        if self.shared is not None:
+            entry = self.shared.get(self._shared_key(key))
+            # The entry keeps the expiry time set when it was stored
+            if entry is not None and entry[0] > now:
+                self._put(key, entry)
+                return entry[1]
+        return None
+
+    def _put(self, key, entry):
+        """Keep entry, a tuple (expiry time, value), in memory"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self, obj, client, **kwargs):
+        """Load obj from the cache, or from the server if needed
+
+        :param obj: search (or other API object) to load
+        :param client: session used if the results are not cached
+        :param kwargs: other arguments of obj.load
+
+        Returns True if the results came from the cache.
+        """
+        key = query_key(obj)
+        now = time.time()
+        value = self._get(key, now)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            obj._set_response(*value)
+            return True
+        with self._lock:
+            self.misses += 1
+        obj.load(client, **kwargs)
+        body = obj.body
+        if obj.content_type == 'text/xml':
+            body = lxml.etree.tostring(body)
+        entry = now + self.ttl, (obj.content_type, obj.etag, body)
+        self._put(key, entry)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), entry, self.ttl)
+        return False
+
+    def invalidate(self, obj=None):
+        """Forget the cached results of obj, or all cached results"""
+        if obj is None:
+            with self._lock:
+                self._entries.clear()
+            if self.shared is not None:
+                self.shared.set(self.prefix + 'generation', self._generation() + 1, 0)
+            return
+        key = query_key(obj)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
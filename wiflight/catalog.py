@@ -0,0 +1,229 @@
+#!/usr/bin/python
+
+"""Local catalog of flights for offline searching
+
+FlightCatalog keeps the searchable attributes of flights in an SQLite
+database with a full-text index, so that searches with the same
+parameters as APIFlightSearch (kw, start, end, group, f,
+missingaircraft) can be answered locally without a round trip to the
+server. The catalog is populated from loaded flights or search results,
+and can be kept up to date by passing its add method as a FlightSync
+callback.
+"""
+
+from wiflight.object import _encode_iso8601, _decode_iso8601
+from wiflight.flight import _summary_properties, flight_keywords
+from wiflight.bulk import FlightSummary
+import datetime
+import re
+import sqlite3
+
+_summary_columns = [k for k, v in _summary_properties]
+
+def _fts_available(db):
+    try:
+        db.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts4(x)")
+    except sqlite3.OperationalError:
+        return False
+    db.execute("DROP TABLE temp.fts_probe")
+    return True
+
+class FlightCatalog(object):
+    """SQLite-backed catalog of flights
+
+    Example:
+
+    catalog = wiflight.FlightCatalog("catalog.sqlite")
+    search = wiflight.APIFlightSearch(start=..., end=..., events=True)
+    search.load(client)
+    catalog.add_many(search)
+    for summary in catalog.search(kw="lowlevel SWF", group=['Training']):
+        print summary.id, summary.headline
+
+    Flights should be added with their events (from a flight loaded
+    individually or a search with events=True) so that keyword searches
+    can match event types and airports.
+    """
+
+    def __init__(self, path=':memory:'):
+        """:param path: SQLite database file (created if needed)"""
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = unicode
+        columns = ''.join(', %s REAL' % (c,) for c in _summary_columns)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "id INTEGER PRIMARY KEY, start TEXT, end TEXT, headline TEXT, "
+                "aircraft_id INTEGER, tail TEXT, keywords TEXT%s)" % (columns,)
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS flights_start ON flights (start)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS groups ("
+                "flight_id INTEGER, group_name TEXT, PRIMARY KEY (group_name, flight_id))"
+            )
+            self.fts = _fts_available(self.db)
+            if self.fts and self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'flights_fts'"
+            ).fetchone() is None:
+                self.db.execute(
+                    "CREATE VIRTUAL TABLE flights_fts USING fts4(keywords)"
+                )
+                # The catalog may have been filled without FTS
+                self.db.execute(
+                    "INSERT INTO flights_fts (docid, keywords) "
+                    "SELECT id, keywords FROM flights"
+                )
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM flights").fetchone()[0]
+
+    def add(self, flight, is_new=None):
+        """Add or replace a flight (an APIFlight) in the catalog
+
+        The signature allows this method to be used directly as the
+        callback of FlightSync.poll.
+        """
+        flight_id = flight.id
+        start = flight.start
+        length = flight.length
+        end = None
+        if start is not None:
+            end = start
+            if length is not None:
+                end = start + datetime.timedelta(seconds=float(length))
+        aircraft = flight.body.find('aircraft')
+        aircraft_id = tail = None
+        if aircraft is not None:
+            if aircraft.get('id') is not None:
+                aircraft_id = int(aircraft.get('id'))
+            tail = aircraft.findtext('tail')
+        keywords = flight_keywords(flight)
+        values = [
+            flight_id,
+            None if start is None else _encode_iso8601(start),
+            None if end is None else _encode_iso8601(end),
+            flight.headline, aircraft_id, tail, keywords,
+        ] + [
+            None if v is None else float(v)
+            for v in (getattr(flight, c) for c in _summary_columns)
+        ]
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO flights VALUES (%s)" % (
+                    ', '.join('?' * len(values)),
+                ), values
+            )
+            self.db.execute("DELETE FROM groups WHERE flight_id = ?", (flight_id,))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO groups (flight_id, group_name) VALUES (?, ?)",
+                ((flight_id, g) for g in flight.groups)
+            )
+            if self.fts:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO flights_fts (docid, keywords) VALUES (?, ?)",
+                    (flight_id, keywords)
+                )
+
+    def add_many(self, flights):
+        """Add many flights, for example a loaded APIFlightSearch"""
+        for flight in flights:
+            if flight is not None:
+                self.add(flight)
+
+    def remove(self, flight_id):
+        """Remove a flight from the catalog"""
+        with self.db:
+            self.db.execute("DELETE FROM flights WHERE id = ?", (flight_id,))
+            self.db.execute("DELETE FROM groups WHERE flight_id = ?", (flight_id,))
+            if self.fts:
+                self.db.execute("DELETE FROM flights_fts WHERE docid = ?", (flight_id,))
+
+    def _row_to_summary(self, row):
+        flight_id, start, headline, aircraft_id, tail = row[:5]
+        return FlightSummary([
+            flight_id,
+            None if start is None else _decode_iso8601(start),
+            headline, aircraft_id, tail,
+        ] + list(row[5:]))
+
+    def get(self, flight_id):
+        """Return the FlightSummary of a catalogued flight, or None"""
+        row = self.db.execute(
+            "SELECT id, start, headline, aircraft_id, tail%s FROM flights WHERE id = ?" % (
+                ''.join(', ' + c for c in _summary_columns),
+            ), (flight_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_summary(row)
+
+    def search(self, kw=None, start=None, end=None, group=[], f=[], missingaircraft=False):
+        """Search the catalog
+
+        Parameters have the same meaning as for APIFlightSearch. Every
+        word of kw must match the beginning of a word of the headline,
+        the aircraft tail number, or the type, airport or airspace of
+        an event. Flights overlapping the interval [start, end] match.
+
+        Returns a list of FlightSummary sorted by start time.
+        """
+        where = []
+        args = []
+        if kw:
+            words = re.findall(r'\w+', kw, re.UNICODE)
+            if self.fts:
+                if words:
+                    where.append(
+                        "id IN (SELECT docid FROM flights_fts WHERE keywords MATCH ?)"
+                    )
+                    # Each word is quoted so that words such as OR,
+                    # NOT or NEAR are not taken as operators
+                    args.append(' '.join(
+                        '"%s*"' % (w.replace('"', '""'),) for w in words
+                    ))
+            else:
+                for w in words:
+                    where.append("(' ' || keywords) LIKE ? ESCAPE '\\'")
+                    args.append('%% %s%%' % (re.sub(r'([\\%_])', r'\\\1', w),))
+        if start is not None:
+            where.append("end >= ?")
+            args.append(_encode_iso8601(start))
+        if end is not None:
+            where.append("start <= ?")
+            args.append(_encode_iso8601(end))
+        for g in group:
+            where.append(
+                "id IN (SELECT flight_id FROM groups WHERE group_name = ?)"
+            )
+            args.append(g)
+        f = [int(x) for x in f]
+        if f:
+            # A temporary table, as there can be more IDs than SQLite
+            # allows parameters in a statement
+            where.append("id IN (SELECT id FROM temp.search_ids)")
+        if missingaircraft:
+            where.append("aircraft_id IS NULL AND tail IS NULL")
+        sql = "SELECT id, start, headline, aircraft_id, tail%s FROM flights" % (
+            ''.join(', ' + c for c in _summary_columns),
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start IS NULL, start, id"
+        with self.db:
+            if f:
+                self.db.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS search_ids (id INTEGER PRIMARY KEY)"
+                )
+                self.db.execute("DELETE FROM temp.search_ids")
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO temp.search_ids VALUES (?)",
+                    ((x,) for x in f)
+                )
+            try:
+                return [self._row_to_summary(row) for row in self.db.execute(sql, args)]
+            finally:
+                if f:
+                    self.db.execute("DELETE FROM temp.search_ids")
@@ -45,18 +45,26 @@ class APISession(object):
         is performed. An example of this would be to set a proxy server
         or cURL hostname resolution options."""
 
-    def request(self, url, method, data=None, content_type="text/xml", etag=AnyEtag):
+    def request(
+        self, url, method, data=None, content_type="text/xml", etag=AnyEtag,
+        if_none_match=None
+    ):
         """Make an HTTP request to the API.
 
         Supported methods are GET, PUT, DELETE, POST, and MOVE.
         :param data: is only used for PUT and POST.
         :param content_type: is only used for PUT.
         :param etag: is only used for PUT and DELETE.
+        :param if_none_match: is only used for GET.
 
         If etag is supplied, it must match the existing document
         before it can be modified. To force the existing document
         to not exist yet, use None.
 
+        If if_none_match is supplied and is the current ETag of the
+        document, HTTPError is raised with code 304 (Not Modified)
+        instead of returning the document again.
+
         Returns a tuple (content_type, etag, body_string)
         """
         req = self.curl_handle
@@ -83,6 +91,8 @@ class APISession(object):
                 out_header.append('If-None-Match: *')
             else:
                 out_header.append('If-Match: %s' % (etag,))
+        if if_none_match is not None:
+            out_header.append('If-None-Match: %s' % (if_none_match,))
         req.setopt(pycurl.HTTPHEADER, out_header)
         req.setopt(pycurl.SSL_VERIFYPEER, 1)
         self.extra_setup()
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+
+"""Columnar export of search results
+
+Going through APIFlight (or APIAircraft, APICrewDbEntry) properties one
+by one to fill a table evaluates an XPath expression and builds a
+Decimal or datetime object per field per row. The functions in this
+module instead make one pass over the elements of a loaded search,
+collecting the raw text of every field, and then convert each column
+at once into a numpy array: float64 for numeric fields (NaN if
+missing), datetime64 for times (NaT if missing), bool for flags and
+object arrays of strings for text.
+
+numpy, and pandas for to_dataframe, are only imported when these
+functions are used.
+"""
+
+import collections
+
+def _getter(path):
+    """Return a function of an item element giving the text at path
+
+    path is "@attr", "child", "child/@attr" or "child/grandchild".
+    """
+    parts = path.split('/')
+    if len(parts) == 1:
+        if path.startswith('@'):
+            attr = path[1:]
+            return lambda elem: elem.get(attr)
+        return lambda elem: elem.findtext(path)
+    child, rest = parts
+    if rest.startswith('@'):
+        attr = rest[1:]
+        def get(elem):
+            sub = elem.find(child)
+            if sub is None:
+                return None
+            return sub.get(attr)
+        return get
+    return lambda elem: elem.findtext(path)
+
+def _floats(numpy, texts):
+    return numpy.array(
+        ['nan' if t is None else t for t in texts], dtype=str
+    ).astype(numpy.float64)
+
+def _ints(numpy, texts):
+    return numpy.array(texts, dtype=str).astype(numpy.int64)
+
+def _datetimes(numpy, texts):
+    """Convert "YYYYMMDDTHHMMSSZ" strings into datetime64[s]"""
+    n = len(texts)
+    raw = numpy.array(['' if t is None else t for t in texts], dtype='S16')
+    chars = raw.view('S1').reshape(n, 16)
+    # Rearrange into "YYYY-MM-DDTHH:MM:SS", which numpy parses
+    iso = numpy.empty((n, 19), dtype='S1')
+    for dst, src in ((0, 0), (5, 4), (8, 6), (11, 9), (14, 11), (17, 13)):
+        width = 4 if dst == 0 else 2
+        iso[:, dst:dst + width] = chars[:, src:src + width]
+    iso[:, 4] = iso[:, 7] = '-'
+    iso[:, 10] = 'T'
+    iso[:, 13] = iso[:, 16] = ':'
+    iso = iso.view('S19').reshape(n)
+    iso[raw == ''] = 'NaT'
+    return iso.astype('datetime64[s]')
+
+def _texts(numpy, texts):
+    out = numpy.empty(len(texts), dtype=object)
+    out[:] = [None if t is None else unicode(t) for t in texts]
+    return out
+
+def _bools(numpy, values):
+    return numpy.array(values, dtype=bool)
+
+_converters = {
+    'float': _floats,
+    'int': _ints,
+    'datetime': _datetimes,
+    'text': _texts,
+    'bool': _bools,
+}
+
+def to_columns(body, tag, columns):
+    """Decode the items of a list document into numpy arrays
+
+    :param body: etree of the list
+    :param tag: tag of the items (other children are ignored)
+    :param columns: sequence of (name, kind, path) where kind is one of
+    'int', 'float', 'datetime', 'text' or 'bool' and path locates the
+    field's text in an item (see _getter); for 'bool', the field is
+    True if path exists. Items missing an 'int' field are skipped.
+
+    Returns an OrderedDict of arrays by column name, in the order of
+    columns.
+    """
+    import numpy
+    getters = []
+    for name, kind, path in columns:
+        if kind == 'bool':
+            getters.append(lambda elem, path=path: elem.find(path) is not None)
+        else:
+            getters.append(_getter(path))
+    required = [n for n, c in enumerate(columns) if c[1] == 'int']
+    values = [[] for c in columns]
+    for elem in body:
+        if elem.tag != tag:
+            continue
+        row = [get(elem) for get in getters]
+        if any(row[n] is None for n in required):
+            continue
+        for col, v in zip(values, row):
+            col.append(v)
+    return collections.OrderedDict(
+        (name, _converters[kind](numpy, col))
+        for (name, kind, path), col in zip(columns, values)
+    )
+
+def to_dataframe(body, tag, columns, index=None):
+    """Same as to_columns, but return a pandas DataFrame
+
+    :param index: if not None, name of the column used as index
+    """
+    import pandas
+    data = to_columns(body, tag, columns)
+    df = pandas.DataFrame(data, columns=list(data))
+    if index is not None:
+        df = df.set_index(index)
+    return df
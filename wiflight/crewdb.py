@@ -14,7 +14,12 @@ application on top of Wi-Flight.
 """
 
 from wiflight.object import APIObject, APIListObject
+from wiflight.client import HTTPError
 from copy import deepcopy
+import lxml.etree
+import hashlib
+import re
+import threading
 import urllib
 
 class APICrewDbEntry(APIObject):
@@ -86,6 +91,13 @@ APICrewDbEntry._add_simple_bool_property(
     'signup_done', "True if this user has completed a Wi-Flight signup"
 )
 
+# Columns of CrewDb searches (see APIListObject.to_columns)
+_crewdb_columns = [
+    (k, 'text', k) for k in (
+        'username', 'fleet', 'email', 'name', 'phone', 'dbdomain', 'useruuid'
+    )
+] + [('signup_done', 'bool', 'signup_done')]
+
 class APIFleet(APIObject):
     """Represents a fleet
 
@@ -155,10 +167,13 @@ class APICrewDbSearch(APIListObject):
     application on top of Wi-Flight.
 
     This type of object can only be loaded, not saved or deleted.
+    After load, to_columns and to_dataframe return the properties of
+    the entries (not the fleets) as numpy arrays or a pandas DataFrame.
     """
     __slots__ = ()
     _toptag = 'crewdb_search'
     _list_contents_map = { 'fleet': APIFleet, 'user': APICrewDbEntry }
+    _columns = ('user', _crewdb_columns)
 
     def __init__(self, query):
         """Search for CrewDb entries by keyword on the server.
@@ -177,8 +192,186 @@ class APICrewDbAnyFleet(APIListObject):
     __slots__ = ()
     _toptag = 'list'
     _list_contents_map = { 'user': APICrewDbEntry }
+    _columns = ('user', _crewdb_columns)
 
     def __init__(self, username):
         """Search for CrewDb entries by username on the server.
         """
         APIObject.__init__(self, 'a', 'crewdb', username)
+
+def _normalize_phone(phone):
+    return re.sub(r'[^0-9]', '', phone)
+
+class CrewDbReplica(object):
+    """Local copy of the CrewDb entries of a fleet
+
+    Example:
+
+    replica = wiflight.CrewDbReplica("fleet1", "example.com")
+    replica.refresh(client)
+    entry = replica.get("user@example.com")
+    for member, entry in replica.crew_entries(reservation).iteritems():
+        pass
+
+    The replica is filled from a CrewDb search with the given query,
+    which should match all the entries of interest. Each refresh
+    repeats the search conditionally on its ETag, so that it costs
+    little when nothing changed. Lookups by username, email, UUID and
+    phone number are done locally. Usernames and emails are compared
+    without regard to case, and phone numbers by their digits only.
+
+    Entries returned by the replica are shared and should not be
+    modified; load a new APICrewDbEntry to make changes.
+    """
+
+    def __init__(self, fleetname, query):
+        """:param fleetname: fleet whose entries are kept; entries of
+        other fleets returned by the search are ignored
+        :param query: CrewDb search string (see APICrewDbSearch)
+        """
+        self.fleetname = fleetname
+        self.query = query
+        self.etag = None
+        self.fleet = None
+        self._digests = {}
+        self._by_username = {}
+        self._by_email = {}
+        self._by_uuid = {}
+        self._by_phone = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_username)
+
+    def __iter__(self):
+        return self._by_username.itervalues()
+
+    def __contains__(self, username):
+        return username.lower() in self._by_username
+
+    def refresh(self, client):
+        """Bring the replica up to date with the server
+
+        Returns (added, changed, removed): lists of the usernames of
+        the entries which were added, changed and removed.
+        """
+        search = APICrewDbSearch(self.query)
+        try:
+            content_type, etag, body = client.request(
+                search.url, "GET", if_none_match=self.etag
+            )
+        except HTTPError, e:
+            if e.code == 304 and self.etag is not None:
+                return [], [], []
+            raise
+        search._set_response(content_type, etag, body)
+        digests = {}
+        entries = {}
+        fleet = None
+        for item in search:
+            if isinstance(item, APIFleet):
+                if item.name == self.fleetname:
+                    fleet = item
+            elif item is not None and item.fleet == self.fleetname:
+                key = item.username.lower()
+                entries[key] = item
+                digests[key] = hashlib.sha1(
+                    lxml.etree.tostring(item.body, method='c14n')
+                ).hexdigest()
+        with self._lock:
+            old = self._digests
+            added = sorted(entries[k].username for k in digests if k not in old)
+            changed = sorted(
+                entries[k].username for k in digests if k in old and old[k] != digests[k]
+            )
+            removed = sorted(
+                self._by_username[k].username for k in old if k not in digests
+            )
+            # Unchanged entries keep their identity
+            for k in digests:
+                if k in old and old[k] == digests[k]:
+                    entries[k] = self._by_username[k]
+            self._index(entries)
+            self._digests = digests
+            self.etag = etag
+            if fleet is not None:
+                self.fleet = fleet
+        return added, changed, removed
+
+    def _index(self, entries):
+        by_email = {}
+        by_uuid = {}
+        by_phone = {}
+        for key, entry in entries.iteritems():
+            email = entry.email
+            if email:
+                by_email.setdefault(email.lower(), []).append(entry)
+            useruuid = entry.useruuid
+            if useruuid:
+                by_uuid[useruuid] = entry
+            phone = entry.phone
+            if phone and _normalize_phone(phone):
+                by_phone.setdefault(_normalize_phone(phone), []).append(entry)
+        self._by_username = entries
+        self._by_email = by_email
+        self._by_uuid = by_uuid
+        self._by_phone = by_phone
+
+    def get(self, username):
+        """Entry with this username, or None"""
+        return self._by_username.get(username.lower())
+
+    def by_email(self, email):
+        """List of entries with this email address"""
+        return list(self._by_email.get(email.lower(), ()))
+
+    def by_uuid(self, useruuid):
+        """Entry of the Wi-Flight user with this UUID, or None"""
+        return self._by_uuid.get(useruuid)
+
+    def by_phone(self, phone):
+        """List of entries with this phone number"""
+        return list(self._by_phone.get(_normalize_phone(phone), ()))
+
+    def crew_entries(self, reservation):
+        """Entries of the crew members of a reservation
+
+        Crew members are looked up by UUID if they have one, and
+        otherwise by username. Returns a dictionary mapping each crew
+        member's UUID (or name, if it has no UUID) to its entry, or to
+        None if it is not in the replica.
+        """
+        out = {}
+        for user in reservation.body.xpath("/reservation/crew/user"):
+            useruuid = user.get('uuid')
+            name = user.get('name')
+            entry = None
+            if useruuid is not None:
+                entry = self.by_uuid(useruuid)
+            if entry is None and name is not None:
+                entry = self.get(name)
+            key = useruuid if useruuid is not None else name
+            if key is not None:
+                out[key] = entry
+        return out
+
+    def resolve_uuids(self, reservation):
+        """Add the UUID of crew members known only by username
+
+        Returns the list of names which could not be resolved.
+        """
+        unresolved = []
+        changed = False
+        for user in reservation.body.xpath("/reservation/crew/user"):
+            name = user.get('name')
+            if user.get('uuid') is not None or name is None:
+                continue
+            entry = self.get(name)
+            if entry is None or not entry.useruuid:
+                unresolved.append(name)
+            else:
+                user.set('uuid', entry.useruuid)
+                changed = True
+        if changed:
+            reservation._reindex_member_sets()
+        return unresolved
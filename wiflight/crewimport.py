@@ -0,0 +1,254 @@
+#!/usr/bin/python
+
+"""Bulk import of CrewDb entries
+
+CrewDbImporter creates or updates the CrewDb entries of a fleet from a
+CSV file or any iterable of rows. Rows are read as they are needed,
+checked, and written concurrently on several sessions, only when the
+entry does not already have the same contents. Progress can be kept in
+a journal file so that an interrupted import can be started again
+without repeating the rows that were already done.
+"""
+
+from wiflight.client import HTTPError
+from wiflight.crewdb import APICrewDbEntry, APIFleet
+from wiflight.parallel import client_map
+import csv
+import hashlib
+import json
+import os
+import re
+import warnings
+
+# Columns which are copied to the entries
+_FIELDS = ('email', 'name', 'phone')
+
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_PHONE_RE = re.compile(r'^\+?[0-9 ().-]*[0-9][0-9 ().-]*$')
+
+class ImportResult(object):
+    """Outcome of the import of one row
+
+    status is one of 'created', 'updated', 'unchanged', 'invalid',
+    'failed' or 'done' (already imported by a previous run according
+    to the journal). error is a message for invalid rows or the
+    exception for failed rows.
+    """
+    __slots__ = ('row_number', 'username', 'status', 'error')
+
+    def __init__(self, row_number, username, status, error=None):
+        self.row_number = row_number
+        self.username = username
+        self.status = status
+        self.error = error
+
+    def __repr__(self):
+        return '<ImportResult %d %s %s%s>' % (
+            self.row_number, self.username, self.status,
+            '' if self.error is None else ' %s' % (self.error,)
+        )
+
+class CrewDbImporter(object):
+    """Create or update the CrewDb entries of a fleet in bulk
+
+    Example:
+
+    importer = wiflight.CrewDbImporter(
+        [session1, session2], "fleet1", journal="import.journal"
+    )
+    with open("crew.csv", "rb") as f:
+        for result in importer.import_csv(f):
+            if result.status in ('invalid', 'failed'):
+                print result.row_number, result.username, result.error
+
+    Each row has the columns username, email, name and phone; all are
+    optional except that a row needs a username or an email. Other
+    columns are ignored, with a warning. Usernames
+    are made lower case, and a username without "@" gets "@" and the
+    fleet's domain appended. Without a username, the email address is
+    used as the username.
+    """
+
+    def __init__(self, clients, fleet, domain=None, journal=None, lookahead=2, retries=2):
+        """:param clients: sequence of sessions, used concurrently (see
+        wiflight.parallel.client_map)
+        :param fleet: fleet name, or a loaded APIFleet
+        :param domain: domain appended to usernames without "@".
+        Defaults to the fleet's temporary_username_domain, which
+        requires loading the fleet if only its name is given.
+        :param journal: if given, file in which imported rows are
+        recorded, so that a later run skips them
+        :param lookahead: number of rows per session in progress at
+        any time
+        :param retries: number of times a write refused because the
+        entry changed in the meantime (HTTP 412) is retried
+        """
+        self.clients = list(clients)
+        if isinstance(fleet, APIFleet):
+            self.fleetname = fleet.name
+        else:
+            self.fleetname = fleet
+        if domain is None:
+            if not isinstance(fleet, APIFleet):
+                fleet = APIFleet(fleet)
+                fleet.load(self.clients[0])
+            domain = fleet.temporary_username_domain
+        self.domain = domain
+        self.journal = journal
+        self.lookahead = lookahead
+        self.retries = retries
+
+    def normalize_username(self, username):
+        username = username.strip().lower()
+        if '@' not in username and self.domain:
+            username = '%s@%s' % (username, self.domain.lower())
+        return username
+
+    def _prepare(self, row):
+        """Return (username, fields) for a row, or raise ValueError"""
+        values = {}
+        for k, v in row.iteritems():
+            if k is None:
+                raise ValueError("Too many columns")
+            k = k.strip().lower()
+            if isinstance(v, str):
+                v = v.decode('utf-8')
+            v = (v or u'').strip()
+            if k != 'username' and k not in _FIELDS:
+                continue
+            if v:
+                values[k] = v
+        username = values.pop('username', None) or values.get('email')
+        if not username:
+            raise ValueError("A username or an email is required")
+        username = self.normalize_username(username)
+        if '@' not in username:
+            raise ValueError("Username %r has no domain" % (username,))
+        email = values.get('email')
+        if email is not None:
+            if not _EMAIL_RE.match(email):
+                raise ValueError("Invalid email %r" % (email,))
+            values['email'] = email.lower()
+        phone = values.get('phone')
+        if phone is not None and not _PHONE_RE.match(phone):
+            raise ValueError("Invalid phone number %r" % (phone,))
+        return username, values
+
+    @staticmethod
+    def _digest(username, values):
+        return hashlib.sha1(json.dumps(
+            [username, sorted(values.iteritems())]
+        )).hexdigest()
+
+    def _load_journal(self):
+        done = set()
+        if self.journal is not None and os.path.exists(self.journal):
+            with open(self.journal, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        done.add(line)
+        return done
+
+    def _upsert(self, client, item):
+        row_number, username, values = item
+        try:
+            attempt = 0
+            while True:
+                entry = APICrewDbEntry(self.fleetname, username)
+                try:
+                    entry.load(client)
+                    exists = True
+                except HTTPError, e:
+                    if e.code != 404:
+                        raise
+                    exists = False
+                    entry.etag = None
+                if exists and all(
+                    getattr(entry, k) == values.get(k) for k in _FIELDS if k in values
+                ):
+                    return ImportResult(row_number, username, 'unchanged')
+                for k, v in values.iteritems():
+                    setattr(entry, k, v)
+                try:
+                    entry.save(client)
+                except HTTPError, e:
+                    if e.code != 412 or attempt >= self.retries:
+                        raise
+                    attempt += 1
+                    continue
+                return ImportResult(
+                    row_number, username, 'updated' if exists else 'created'
+                )
+        except Exception, e:
+            return ImportResult(row_number, username, 'failed', e)
+
+    def _work(self, client, item):
+        if isinstance(item, ImportResult):
+            return item
+        return self._upsert(client, item)
+
+    def _check_columns(self, row, checked):
+        """Warn once about each column of row which is not imported"""
+        for k in row:
+            if k in checked:
+                continue
+            checked.add(k)
+            if k is not None and k.strip().lower() != 'username' and \
+                    k.strip().lower() not in _FIELDS:
+                warnings.warn("Ignoring unknown column %r" % (k,))
+
+    def _items(self, rows, done):
+        checked = set()
+        for row_number, row in enumerate(rows, 1):
+            self._check_columns(row, checked)
+            try:
+                username, values = self._prepare(row)
+            except ValueError, e:
+                yield ImportResult(
+                    row_number, row.get('username') or row.get('email') or None,
+                    'invalid', str(e)
+                )
+                continue
+            if self._digest(username, values) in done:
+                yield ImportResult(row_number, username, 'done')
+                continue
+            yield row_number, username, values
+
+    def run(self, rows):
+        """Import rows (dictionaries of column values)
+
+        Returns an iterator over ImportResult, one per row in order.
+        Rows are read and imported as the iterator is consumed.
+        """
+        done = self._load_journal()
+        values = {}
+        def items():
+            for item in self._items(rows, done):
+                if not isinstance(item, ImportResult):
+                    values[item[0]] = item[2]
+                yield item
+        journal = None
+        if self.journal is not None:
+            journal = open(self.journal, 'ab')
+        try:
+            for result in client_map(
+                self.clients, self._work, items(), lookahead=self.lookahead
+            ):
+                v = values.pop(result.row_number, None)
+                if journal is not None and v is not None and \
+                        result.status in ('created', 'updated', 'unchanged'):
+                    journal.write(self._digest(result.username, v) + '\n')
+                    journal.flush()
+                yield result
+        finally:
+            if journal is not None:
+                journal.close()
+
+    def import_csv(self, fileobj, **csv_args):
+        """Import rows from a CSV file with a header line
+
+        :param csv_args: passed on to csv.DictReader (for example
+        delimiter)
+        """
+        return self.run(csv.DictReader(fileobj, **csv_args))
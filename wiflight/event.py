@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+"""Events found by the analysis of a flight
+
+Flight documents contain an <events> list of everything the server's
+analysis detected, such as takeoffs, landings and airspace incursions.
+FlightEvents decodes that list once and indexes it so that typical
+questions are answered without scanning the XML again.
+"""
+
+from wiflight.object import _decode_iso8601
+import bisect
+
+def APIFlightEvent():
+    attributes = [
+        ('seq', 'Sequence number of the event within the flight'),
+        ('type', 'Type of event, such as "takeoff" or "airspace"'),
+        ('severity', 'Integer severity of the event'),
+        ('start_time', 'Start of event in UTC'),
+        ('end_time', 'End of event in UTC'),
+        ('detected', 'True if the event was detected by the analysis'),
+        ('details', 'Dictionary of type-specific details (e.g. airport, runway)'),
+    ]
+    d = { '__slots__': () }
+    def _tuple_accessor(idx, doc):
+        return property(lambda self: self[idx], doc=doc)
+    for n, tpa in enumerate(attributes):
+        d[tpa[0]] = _tuple_accessor(n, tpa[1])
+    d['_fields'] = tuple(x[0] for x in attributes)
+    def from_xml(cls, xml):
+        def _get_int(name):
+            v = xml.get(name)
+            if v is None:
+                return None
+            try:
+                return int(v)
+            except ValueError:
+                return None
+        def _get_date(name):
+            v = xml.get(name)
+            if v is None:
+                return None
+            return _decode_iso8601(v)
+        details = {}
+        for child in xml:
+            if len(child) == 0 and child.text is not None:
+                details[child.tag] = child.text
+        return cls((
+            _get_int('seq'), xml.get('type'), _get_int('severity'),
+            _get_date('start_time'), _get_date('end_time'),
+            xml.get('detected') == '1', details
+        ))
+    d['from_xml'] = classmethod(from_xml)
+    return type('APIFlightEvent', (tuple,), d)
+APIFlightEvent = APIFlightEvent()
+
+def _start_key(event):
+    return (event.start_time is None, event.start_time, event.seq)
+
+class FlightEvents(object):
+    """Read-only, indexed collection of the events of a flight
+
+    Iterating yields APIFlightEvent tuples sorted by start time.
+    Lookups by type, severity and time run on indexes built when the
+    collection is created.
+
+    Example:
+
+    flight.load(client)
+    for event in flight.events.with_severity(40, type='airspace'):
+        pass
+    """
+    __slots__ = ('_events', '_starts', '_max_duration', '_by_type', '_severities', '_by_severity')
+
+    def __init__(self, events):
+        """:param events: iterable of APIFlightEvent"""
+        events = sorted(events, key=_start_key)
+        self._events = tuple(events)
+        timed = [e for e in events if e.start_time is not None]
+        self._starts = [e.start_time for e in timed]
+        max_duration = None
+        for e in timed:
+            if e.end_time is not None:
+                d = e.end_time - e.start_time
+                if max_duration is None or d > max_duration:
+                    max_duration = d
+        self._max_duration = max_duration
+        by_type = {}
+        for e in events:
+            by_type.setdefault(e.type, []).append(e)
+        self._by_type = dict((k, tuple(v)) for k, v in by_type.iteritems())
+        by_severity = sorted(
+            (e for e in events if e.severity is not None),
+            key=lambda e: e.severity
+        )
+        self._severities = [e.severity for e in by_severity]
+        self._by_severity = tuple(by_severity)
+
+    @classmethod
+    def from_xml(cls, xml):
+        """Build the collection from an <events> element (or None)"""
+        if xml is None:
+            return cls(())
+        return cls(APIFlightEvent.from_xml(x) for x in xml if x.tag == 'event')
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __getitem__(self, idx):
+        return self._events[idx]
+
+    def __repr__(self):
+        return 'FlightEvents(%r)' % (list(self._events),)
+
+    @property
+    def types(self):
+        """Set of the types of events present"""
+        return frozenset(self._by_type)
+
+    def by_type(self, event_type):
+        """Tuple of events of a given type, sorted by start time"""
+        return self._by_type.get(event_type, ())
+
+    def with_severity(self, min_severity=None, max_severity=None, type=None):
+        """Events with a severity in a range (bounds inclusive)
+
+        :param type: if given, only return events of this type
+
+        Returns a list sorted by start time.
+        """
+        if min_severity is None:
+            lo = 0
+        else:
+            lo = bisect.bisect_left(self._severities, min_severity)
+        if max_severity is None:
+            hi = len(self._severities)
+        else:
+            hi = bisect.bisect_right(self._severities, max_severity)
+        out = [
+            e for e in self._by_severity[lo:hi]
+            if type is None or e.type == type
+        ]
+        out.sort(key=_start_key)
+        return out
+
+    def overlapping(self, start, end, type=None):
+        """Events whose time span overlaps [start, end] (UTC datetimes)
+
+        Events without an end time are treated as instantaneous.
+        Events without a start time are never returned.
+        :param type: if given, only return events of this type
+
+        Returns a list sorted by start time.
+        """
+        starts = self._starts
+        hi = bisect.bisect_right(starts, end)
+        if self._max_duration is None:
+            lo = bisect.bisect_left(starts, start)
+        else:
+            lo = bisect.bisect_left(starts, start - self._max_duration)
+        out = []
+        for e in self._events[lo:hi]:
+            if (e.end_time or e.start_time) < start:
+                continue
+            if type is not None and e.type != type:
+                continue
+            out.append(e)
+        return out
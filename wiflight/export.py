@@ -0,0 +1,315 @@
+#!/usr/bin/python
+
+"""Streaming writers for flight track data
+
+Each writer is given a file object and then fed chunks of track points
+(APIFlightTrackPoint or anything that is a sequence in the same order)
+as they become available, for example straight from
+APIFlight.iter_track(client, chunks=True). Output is written to the
+file object as it is produced, so memory use does not depend on the
+length of the flight.
+
+Example:
+
+flight = wiflight.APIFlight(12345)
+flight.load(client)
+with open("flight.gpx", "wb") as f:
+    with wiflight.GPXWriter(f, flight.start) as writer:
+        for chunk in flight.iter_track(client, chunks=True):
+            writer.write(chunk)
+"""
+
+from wiflight.track import CHANNELS
+from xml.sax.saxutils import escape
+import array
+import csv
+import datetime
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+
+def _fmt(v):
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+def _fmt_time(start, t):
+    d = start + datetime.timedelta(seconds=float(t))
+    if d.microsecond:
+        return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (
+            d.year, d.month, d.day, d.hour, d.minute, d.second,
+            d.microsecond // 1000
+        )
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ" % (
+        d.year, d.month, d.day, d.hour, d.minute, d.second
+    )
+
+def _xml_text(s):
+    """Escape text for XML output in UTF-8 (byte strings must be UTF-8)"""
+    if isinstance(s, str):
+        s = s.decode('utf-8')
+    return escape(s).encode('utf-8')
+
+class _TrackWriter(object):
+    """Common behaviour of all track writers
+
+    Subclasses implement write(points), which writes a chunk of track
+    points.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.closed = False
+        self._header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _header(self):
+        pass
+
+    def _footer(self):
+        pass
+
+    def close(self):
+        """Finish the output. The file object itself is not closed."""
+        if not self.closed:
+            self.closed = True
+            self._footer()
+
+    def abort(self):
+        """Stop without finishing the output
+
+        This is what leaving a with block by an exception does, so that
+        an incomplete track does not end up looking complete.
+        """
+        self.closed = True
+
+class GPXWriter(_TrackWriter):
+    """Write a track as a GPX 1.1 document"""
+
+    def __init__(self, fileobj, start, name=None):
+        """:param start: start of the flight in UTC (APIFlight.start),
+        used to convert track timestamps to absolute times
+        :param name: optional track name
+        """
+        self.start = start
+        self.name = name
+        _TrackWriter.__init__(self, fileobj)
+
+    def _header(self):
+        w = self.fileobj.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="wiflight">\n'
+          '<trk>\n')
+        if self.name is not None:
+            w('<name>%s</name>\n' % (_xml_text(self.name),))
+        w('<trkseg>\n')
+
+    def write(self, points):
+        start = self.start
+        out = []
+        for p in points:
+            t, lat, lon, alt = p[0], p[6], p[7], p[2]
+            if lat is None or lon is None:
+                continue
+            out.append('<trkpt lat="%s" lon="%s">' % (_fmt(lat), _fmt(lon)))
+            if alt is not None:
+                out.append('<ele>%s</ele>' % (_fmt(alt),))
+            if t is not None:
+                out.append('<time>%s</time>' % (_fmt_time(start, t),))
+            out.append('</trkpt>\n')
+        self.fileobj.write(''.join(out))
+
+    def _footer(self):
+        self.fileobj.write('</trkseg>\n</trk>\n</gpx>\n')
+
+class KMLWriter(_TrackWriter):
+    """Write a track as a KML document containing a single path"""
+
+    def __init__(self, fileobj, name=None, altitude_mode='absolute'):
+        """:param name: optional name of the placemark
+        :param altitude_mode: KML altitudeMode of the path. Track
+        altitudes are MSL so the default is 'absolute'.
+        """
+        self.name = name
+        self.altitude_mode = altitude_mode
+        _TrackWriter.__init__(self, fileobj)
+
+    def _header(self):
+        w = self.fileobj.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+          '<Document>\n<Placemark>\n')
+        if self.name is not None:
+            w('<name>%s</name>\n' % (_xml_text(self.name),))
+        w('<LineString>\n<altitudeMode>%s</altitudeMode>\n<coordinates>\n' % (
+            escape(self.altitude_mode),
+        ))
+
+    def write(self, points):
+        out = []
+        for p in points:
+            lat, lon, alt = p[6], p[7], p[2]
+            if lat is None or lon is None:
+                continue
+            if alt is None:
+                out.append('%s,%s\n' % (_fmt(lon), _fmt(lat)))
+            else:
+                out.append('%s,%s,%s\n' % (_fmt(lon), _fmt(lat), _fmt(alt)))
+        self.fileobj.write(''.join(out))
+
+    def _footer(self):
+        self.fileobj.write('</coordinates>\n</LineString>\n</Placemark>\n</Document>\n</kml>\n')
+
+class KMZWriter(KMLWriter):
+    """Write a track as a KMZ (zipped KML) archive
+
+    The zip format needs to know the size of each member before it is
+    written, so the KML document is spooled to a temporary file and
+    compressed into the archive when the writer is closed. Nothing is
+    written to the archive if the writer is aborted.
+    """
+
+    def __init__(self, fileobj, name=None, altitude_mode='absolute'):
+        self.archive = fileobj
+        fd, self.spool_path = tempfile.mkstemp(suffix='.kml')
+        KMLWriter.__init__(self, os.fdopen(fd, 'wb'), name, altitude_mode)
+
+    def close(self):
+        if self.closed:
+            return
+        KMLWriter.close(self)
+        self.fileobj.close()
+        try:
+            zf = zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED)
+            try:
+                zf.write(self.spool_path, 'doc.kml')
+            finally:
+                zf.close()
+        finally:
+            os.unlink(self.spool_path)
+
+    def abort(self):
+        if self.closed:
+            return
+        KMLWriter.abort(self)
+        self.fileobj.close()
+        os.unlink(self.spool_path)
+
+    def __del__(self):
+        # Do not leave the spool file behind if close is never called
+        if not getattr(self, 'closed', True):
+            self.abort()
+
+class CSVWriter(_TrackWriter):
+    """Write a track as CSV with one column per channel
+
+    Values are written exactly as the server sent them.
+    """
+
+    def __init__(self, fileobj, channels=CHANNELS):
+        """:param channels: names of the channels to write, in order"""
+        self.channels = tuple(channels)
+        self._idx = [CHANNELS.index(c) for c in self.channels]
+        self.writer = csv.writer(fileobj)
+        _TrackWriter.__init__(self, fileobj)
+
+    def _header(self):
+        self.writer.writerow(self.channels)
+
+    def write(self, points):
+        idx = self._idx
+        self.writer.writerows(
+            ['' if p[i] is None else _fmt(p[i]) for i in idx]
+            for p in points
+        )
+
+# Binary columnar format:
+#
+# header: "WFTRKC1\n", uint16 number of channels, then for each channel
+#         uint8 length of name followed by the name
+# blocks: uint32 number of points, then for each channel that many
+#         IEEE 754 doubles. Missing values are NaN.
+# end:    a block of 0 points
+#
+# All integers and doubles are little-endian.
+_COLUMNAR_MAGIC = 'WFTRKC1\n'
+_NAN = float('nan')
+
+class ColumnarWriter(_TrackWriter):
+    """Write a track in a compact binary columnar format
+
+    Each chunk passed to write becomes one block. Use read_columnar
+    to read the file back.
+    """
+
+    def __init__(self, fileobj, channels=CHANNELS):
+        """:param channels: names of the channels to write, in order"""
+        self.channels = tuple(channels)
+        self._idx = [CHANNELS.index(c) for c in self.channels]
+        _TrackWriter.__init__(self, fileobj)
+
+    def _header(self):
+        w = self.fileobj.write
+        w(_COLUMNAR_MAGIC)
+        w(struct.pack('<H', len(self.channels)))
+        for c in self.channels:
+            w(struct.pack('<B', len(c)) + c)
+
+    def write(self, points):
+        if not isinstance(points, (list, tuple)):
+            points = list(points)
+        if not points:
+            return
+        w = self.fileobj.write
+        w(struct.pack('<I', len(points)))
+        for i in self._idx:
+            col = array.array('d', (
+                _NAN if p[i] is None else float(p[i]) for p in points
+            ))
+            if sys.byteorder != 'little':
+                col.byteswap()
+            w(col.tostring())
+
+    def _footer(self):
+        self.fileobj.write(struct.pack('<I', 0))
+
+def read_columnar(fileobj):
+    """Read a file written by ColumnarWriter
+
+    Yields one dictionary per block mapping channel names to arrays
+    of floats.
+    """
+    if fileobj.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar track file")
+    count, = struct.unpack('<H', fileobj.read(2))
+    channels = []
+    for i in xrange(count):
+        namelen, = struct.unpack('<B', fileobj.read(1))
+        channels.append(fileobj.read(namelen))
+    while True:
+        header = fileobj.read(4)
+        if len(header) < 4:
+            raise ValueError("Truncated columnar track file")
+        npoints, = struct.unpack('<I', header)
+        if npoints == 0:
+            return
+        block = {}
+        for c in channels:
+            col = array.array('d')
+            col.fromstring(fileobj.read(8 * npoints))
+            if len(col) != npoints:
+                raise ValueError("Truncated columnar track file")
+            if sys.byteorder != 'little':
+                col.byteswap()
+            block[c] = col
+        yield block
@@ -1,35 +1,23 @@
 #!/usr/bin/python
 
-from wiflight.object import APIObject, APIListObject, _encode_iso8601
+from wiflight.object import APIObject, APIListObject, _IndexedMemberSet, _encode_iso8601
 from wiflight.aircraft import WithAircraftMixIn
+from wiflight.event import FlightEvents
+from wiflight.weather import WeatherTimeline
+from wiflight.parallel import client_map
 import lxml.etree
 from copy import deepcopy
 import urllib
 import decimal
+import re
+import threading
+import sys
+import Queue
 
-class _FlightCrewSet(object):
-    __slots__ = ('doc',)
-
-    def __init__(self, doc):
-        self.doc = doc
-
-    def __iter__(self):
-        return iter(self.doc.xpath("/flight/crew/user/@name"))
-
-    def __repr__(self):
-        return repr(set(self))
-
-    def add(self, username):
-        if username not in self:
-            toptag = self.doc.xpath("/flight/crew")[0]
-            tag = lxml.etree.Element('user')
-            tag.set('name', username)
-            toptag.append(tag)
-
-    def remove(self, username):
-        for tag in self.doc.xpath("/flight/crew/user"):
-            if tag.get('name') == username:
-                tag.getparent().remove(tag)
+class _FlightCrewSet(_IndexedMemberSet):
+    __slots__ = ()
+    _tag = 'user'
+    _attrname = 'name'
 
 class APIFlight(APIObject, WithAircraftMixIn):
     """Represents a Wi-Flight flight.
@@ -41,12 +29,15 @@ class APIFlight(APIObject, WithAircraftMixIn):
     data and is read-only. Although this class permits modifications
     to all fields, the server will not accept them if they are saved.
     """
-    __slots__ = ()
+    __slots__ = ('_events', '_weather', '_registry')
     _toptag = 'flight'
+    _derived_slots = APIObject._derived_slots + ('_events', '_weather')
 
     def __init__(self, flight_id):
         APIObject.__init__(self, 'a', 'flight', str(flight_id), '')
         self.body.set('id', str(flight_id))
+        self._events = None
+        self._weather = None
 
     @classmethod
     def from_xml(cls, xml):
@@ -80,7 +71,7 @@ class APIFlight(APIObject, WithAircraftMixIn):
         appear on flights if they appear in the crew list of any
         reservation that matches the flight.
         """
-        return _FlightCrewSet(self.body)
+        return self._member_set(_FlightCrewSet, "/flight/crew")
 
     def track(self, offset=0, length=None):
         """Return an object for querying the time-series flight data
@@ -94,30 +85,187 @@ class APIFlight(APIObject, WithAircraftMixIn):
         """
         return APIFlightTrack(self, offset, length)
 
-    # events and weather not implemented yet!
+    def iter_track(self, client, window=600, prefetch=2, chunks=False):
+        """Iterate over the whole flight track
+
+        :param client: session used to download the track. It is used
+        from a background thread, so it should not be used for anything
+        else until iteration is finished. Closing the iterator early
+        (for instance by breaking out of a for loop over it) waits for
+        the download in progress, if any, to finish.
+        :param window: length in seconds of each track query. The server
+        does not accept more than 10 minutes.
+        :param prefetch: number of windows to download ahead of the
+        window currently being consumed
+        :param chunks: if True, yield one list of points per window
+        instead of individual points
+
+        Windows are downloaded in a background thread while the caller
+        processes earlier ones, so at most prefetch + 2 windows are held
+        in memory at any time (the queued windows, the one being consumed
+        and the one being downloaded). Errors from the server are raised from
+        the iterator.
+        """
+        q = Queue.Queue(maxsize=max(prefetch, 1))
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._fetch_track_windows, args=(client, window, q, stop)
+        )
+        thread.daemon = True
+        thread.start()
+        last_t = None
+        try:
+            while True:
+                kind, value = q.get()
+                if kind == 'error':
+                    raise value[0], value[1], value[2]
+                if kind == 'end':
+                    return
+                points = []
+                for p in value:
+                    # Windows may overlap by one point at their boundaries
+                    if last_t is not None and p.t is not None and p.t <= last_t:
+                        continue
+                    points.append(p)
+                    if p.t is not None:
+                        last_t = p.t
+                if chunks:
+                    if points:
+                        yield points
+                else:
+                    for p in points:
+                        yield p
+        finally:
+            stop.set()
+            thread.join()
+
+    def _fetch_track_windows(self, client, window, q, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+        try:
+            offset = 0
+            length = self.length
+            while not stop.is_set():
+                track = self.track(offset, window)
+                track.load(client)
+                if length is None:
+                    length = track.length
+                if not put(('track', track)):
+                    return
+                offset += window
+                if length is None:
+                    if not len(track):
+                        break
+                elif offset >= length:
+                    break
+            put(('end', None))
+        except Exception:
+            put(('error', sys.exc_info()))
+
+    @property
+    def events(self):
+        """Events found by the analysis of this flight, as FlightEvents
+
+        Events are only present on flights loaded individually or
+        returned by a search with events=True. The collection is built
+        on first access and kept until the object is loaded again.
+        Events are read-only.
+        """
+        cached = self._events
+        if cached is None or cached[0] is not self.body:
+            events = FlightEvents.from_xml(self.body.find('events'))
+            self._events = cached = (self.body, events)
+        return cached[1]
+
+    @property
+    def event_counts(self):
+        """Numbers of events counted by severity range
+
+        Flights returned by APIFlightSearch with an events range string
+        such as "30..39,.." carry an <event_counts> tag. This is a list
+        of integers, one per range, in the order the ranges were given
+        in the search, or None if the flight has no event counts.
+        """
+        tag = self.body.find('event_counts')
+        if tag is None:
+            return None
+        if len(tag):
+            counts = []
+            for x in tag:
+                v = x.get('count')
+                if v is None:
+                    v = x.text
+                counts.append(int(v))
+            return counts
+        return [int(x) for x in (tag.text or '').replace(',', ' ').split()]
+
+    @property
+    def weather(self):
+        """Weather along this flight, as a WeatherTimeline
+
+        Like events, the timeline is built on first access and kept
+        until the object is loaded again. It is read-only.
+        """
+        cached = self._weather
+        if cached is None or cached[0] is not self.body:
+            weather = WeatherTimeline.from_xml(self.body)
+            self._weather = cached = (self.body, weather)
+        return cached[1]
 
 APIFlight._add_simple_date_property('start', 'Start of flight in UTC')
-for k, v in {
-    'length': "Length of flight in seconds",
-    'master_ontime': "Total amount of time in seconds that power was on",
-    'engine_ontime': "Total amount of time in seconds that the engine was on",
-    'airtime': "Total amount of time in seconds that aircraft was in the air",
-    'alt_min': "Lowest MSL altitude in metres achieved throughout the flight",
-    'alt_max': "Highest MSL altitude in metres achieved throughout the flight",
-    'agl_min': "Lowest AGL altitude in metres achieved throughout the flight",
-    'agl_max': "Highest AGL altitude in metres achieved throughout the flight",
-    'groundlevel_min': "Lowest height of ground in metres throughout the flight",
-    'groundlevel_max': "Highest height of ground in metres throughout the flight",
-    'gs_max': "Highest ground speed in m/s throughout the flight",
-    'vs_min': "Lowest vertical speed in m/s throughout the flight",
-    'vs_max': "Highest vertical speed in m/s throughout the flight",
-    'az_min': "Lowest z-axis acceleration in g throughout the flight",
-    'az_max': "Highest z-axis acceleration in g throughout the flight",
-}.iteritems():
+_summary_properties = [
+    ('length', "Length of flight in seconds"),
+    ('master_ontime', "Total amount of time in seconds that power was on"),
+    ('engine_ontime', "Total amount of time in seconds that the engine was on"),
+    ('airtime', "Total amount of time in seconds that aircraft was in the air"),
+    ('alt_min', "Lowest MSL altitude in metres achieved throughout the flight"),
+    ('alt_max', "Highest MSL altitude in metres achieved throughout the flight"),
+    ('agl_min', "Lowest AGL altitude in metres achieved throughout the flight"),
+    ('agl_max', "Highest AGL altitude in metres achieved throughout the flight"),
+    ('groundlevel_min', "Lowest height of ground in metres throughout the flight"),
+    ('groundlevel_max', "Highest height of ground in metres throughout the flight"),
+    ('gs_max', "Highest ground speed in m/s throughout the flight"),
+    ('vs_min', "Lowest vertical speed in m/s throughout the flight"),
+    ('vs_max', "Highest vertical speed in m/s throughout the flight"),
+    ('az_min', "Lowest z-axis acceleration in g throughout the flight"),
+    ('az_max', "Highest z-axis acceleration in g throughout the flight"),
+]
+for k, v in _summary_properties:
     APIFlight._add_simple_float_property(k, v)
 APIFlight._add_simple_text_property('headline', 'Short text string that describes the flight')
 del k, v
 
+def flight_keywords(flight):
+    """Words of an APIFlight which keyword searches can match
+
+    These are the words of the headline, the aircraft tail number, and
+    the type, airport, airspace designation and name of the events,
+    approximating what the server's keyword search looks at. Punctuation
+    separates words, so that "C-FFSK" gives "C" and "FFSK".
+
+    Returns a unicode string of words separated by spaces.
+    """
+    words = []
+    headline = flight.headline
+    if headline:
+        words.append(headline)
+    tail = flight.body.findtext('aircraft/tail')
+    if tail:
+        words.append(tail)
+    for event in flight.events:
+        words.append(event.type or '')
+        for k in ('airport', 'designation', 'name'):
+            v = event.details.get(k)
+            if v:
+                words.append(v.strip())
+    return u' '.join(re.findall(r'\w+', u' '.join(unicode(w) for w in words), re.UNICODE))
+
 class APIFlightSearch(APIListObject):
     """Represents a Wi-Flight flight search.
 
@@ -136,10 +284,41 @@ class APIFlightSearch(APIListObject):
         pass
 
     This type of object can only be loaded, not saved or deleted.
+
+    When f lists many flight IDs, load splits them into several
+    requests whose URLs stay below max_url_length. Those requests can
+    be run concurrently on several sessions:
+
+    search = wiflight.APIFlightSearch(f=flight_ids)
+    search.load(session1, clients=[session1, session2, session3])
+    for flight in search:
+        pass
+    not_found = search.missing
+
+    For reports over many flights, records returns compact read-only
+    summaries instead of full APIFlight objects:
+
+    for r in search.records(client):
+        print r.id, r.start, r.aircraft_tail, r.engine_ontime
+
+    After load, to_columns and to_dataframe return the same fields as
+    numpy arrays or a pandas DataFrame:
+
+    df = search.to_dataframe(index='id')
     """
-    __slots__ = ()
+    __slots__ = ('_params', '_ids', 'missing')
     _toptag = 'list'
     _list_contents_map = { 'flight': APIFlight }
+    _columns = ('flight', [
+        ('id', 'int', '@id'),
+        ('start', 'datetime', 'start'),
+        ('headline', 'text', 'headline'),
+        # May be missing, so float64 with NaN as in pandas
+        ('aircraft_id', 'float', 'aircraft/@id'),
+        ('aircraft_tail', 'text', 'aircraft/tail'),
+    ] + [(k, 'float', k) for k, v in _summary_properties])
+    # Longest URL (path and query string) sent in a single request
+    max_url_length = 2000
 
     def __init__(
         self, kw=None, start=None, end=None, events=None,
@@ -188,8 +367,19 @@ class APIFlightSearch(APIListObject):
             p.append(('missingaircraft', '1'))
         for g in group:
             p.append(('group', g))
+        ids = []
+        seen = set()
         for f1 in f:
-            p.append(('f', int(f1)))
+            f1 = int(f1)
+            if f1 not in seen:
+                seen.add(f1)
+                ids.append(f1)
+        # Batches of f are substituted at this position
+        self._params = p, len(p)
+        self._ids = ids
+        self.missing = None
+        for f1 in ids:
+            p.append(('f', f1))
         if events is True:
             p.append(('events', 'true'))
         elif events is not False and events is not None:
@@ -199,6 +389,124 @@ class APIFlightSearch(APIListObject):
         else:
             APIObject.__init__(self, 'a', 'flight', '')
 
+    def _batches(self):
+        """Split the requested flight IDs into URL-length-safe batches
+
+        Returns a list of query strings, one per request.
+        """
+        p, pos = self._params
+        head = p[:pos]
+        tail = p[pos + len(self._ids):]
+        # Length available for "&f=<id>" parameters
+        room = self.max_url_length - len(
+            self.url.split('?', 1)[0] + '?' + urllib.urlencode(head + tail)
+        )
+        out = []
+        batch = []
+        used = 0
+        for f1 in self._ids:
+            need = len('&f=%d' % (f1,))
+            if batch and used + need > room:
+                out.append(batch)
+                batch = []
+                used = 0
+            batch.append(('f', f1))
+            used += need
+        if batch:
+            out.append(batch)
+        return [urllib.urlencode(head + b + tail) for b in out]
+
+    def _load_batch(self, client, query_string):
+        url = self.url.split('?', 1)[0] + '?' + query_string
+        return client.request(url, "GET")
+
+    def load(self, client, clients=None):
+        """Load the search results from the server.
+
+        :param client: session used for the search
+        :param clients: optional sequence of sessions on which the
+        requests are run concurrently (see wiflight.parallel.client_map)
+        when f is too long to fit in a single request. Defaults to
+        [client].
+
+        If f was given, the flights are returned in the requested order
+        and the IDs which were not found are listed in the missing
+        attribute afterwards.
+        """
+        if len(self.url) <= self.max_url_length or not self._ids:
+            APIObject.load(self, client)
+            return
+        if clients is None:
+            clients = [client]
+        body = lxml.etree.Element(self._toptag)
+        for content_type, etag, part in client_map(
+            clients, self._load_batch, self._batches()
+        ):
+            body.extend(lxml.etree.fromstring(part))
+        # A merged result has no single version
+        self.etag = None
+        self.content_type = 'text/xml'
+        self.body = body
+        self._sort_requested()
+
+    def records(self, client, clients=None):
+        """Load the search results as read-only summary records.
+
+        :param client: session used for the search
+        :param clients: optional sequence of sessions, as for load
+
+        Returns a list of wiflight.FlightSummary, in the requested order
+        if f was given (the IDs not found are then listed in the missing
+        attribute). Each <flight> is decoded as it is parsed and freed
+        straight away, so no document is kept: a record takes under 1 kB
+        whereas each APIFlight from load keeps its whole document. The
+        search object itself is left unloaded.
+        """
+        # Imported here because wiflight.bulk depends on this module
+        from wiflight.bulk import decode_flight_search
+        if len(self.url) <= self.max_url_length or not self._ids:
+            content_type, etag, body = client.request(self.url, "GET")
+            out = decode_flight_search(body)
+        else:
+            if clients is None:
+                clients = [client]
+            out = []
+            for content_type, etag, body in client_map(
+                clients, self._load_batch, self._batches()
+            ):
+                out.extend(decode_flight_search(body))
+        if not self._ids:
+            self.missing = None
+            return out
+        found = {}
+        for r in out:
+            found.setdefault(r.id, r)
+        self.missing = [f1 for f1 in self._ids if f1 not in found]
+        return [found[f1] for f1 in self._ids if f1 in found]
+
+    def _set_response(self, content_type, etag, body):
+        APIObject._set_response(self, content_type, etag, body)
+        self._sort_requested()
+
+    def _sort_requested(self):
+        """Put flights in the order of f and record the missing IDs"""
+        if not self._ids or self.content_type != 'text/xml':
+            self.missing = None
+            return
+        found = {}
+        for sub in list(self.body):
+            if sub.tag != 'flight':
+                continue
+            try:
+                flight_id = int(sub.get('id'))
+            except (ValueError, TypeError):
+                # Left alone, like APIFlight.from_xml does
+                continue
+            self.body.remove(sub)
+            found.setdefault(flight_id, sub)
+        self.body.extend(found[f1] for f1 in self._ids if f1 in found)
+        self.missing = [f1 for f1 in self._ids if f1 not in found]
+
 def APIFlightTrackPoint():
     attributes = [
         ('t', 'Timestamp in seconds since beginning of flight'),
@@ -264,3 +572,11 @@ class APIFlightTrack(APIListObject):
             APIObject.__init__(self, *urlparts, query_string=urllib.urlencode(p))
         else:
             APIObject.__init__(self, *urlparts)
+
+    @property
+    def length(self):
+        """Length of the whole flight in seconds, as reported with the track"""
+        v = self.body.get('length')
+        if v is None:
+            return None
+        return decimal.Decimal(v)
@@ -0,0 +1,251 @@
+#!/usr/bin/python
+
+"""Local cache of aircraft images
+
+Aircraft images rarely change but are large compared to the rest of the
+API's documents. AircraftImageCache keeps them in a directory, stored
+by the SHA-1 of their contents so that aircraft sharing the same image
+share a single file, and revalidates them with the server using their
+ETag instead of downloading them again. Cached images are returned as
+file names so that they can be served, opened or memory-mapped without
+reading them into memory.
+"""
+
+from wiflight.client import HTTPError
+from wiflight.aircraft import APIAircraft, APIAircraftImage
+import contextlib
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import time
+
+class CachedImage(object):
+    """An image file in an AircraftImageCache"""
+    __slots__ = ('path', 'content_type', 'digest', 'size')
+
+    def __init__(self, path, content_type, digest, size):
+        self.path = path
+        self.content_type = content_type
+        self.digest = digest
+        self.size = size
+
+    def open(self):
+        """Open the image file for reading"""
+        return open(self.path, 'rb')
+
+    @contextlib.contextmanager
+    def mmap(self):
+        """Context manager mapping the image file read-only in memory
+
+        Example:
+
+        with image.mmap() as m:
+            response.write(m)
+        """
+        with self.open() as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield m
+            finally:
+                m.close()
+
+    def __repr__(self):
+        return '<CachedImage %s %s %d bytes>' % (
+            self.digest, self.content_type, self.size
+        )
+
+class AircraftImageCache(object):
+    """Content-addressed cache of aircraft images
+
+    Example:
+
+    cache = wiflight.AircraftImageCache("/var/cache/wiflight-images")
+    image = cache.fetch(client, 5)
+    if image is not None:
+        serve_file(image.path, image.content_type)
+
+    Each fetch checks with the server whether the image changed (a
+    conditional request which does not transfer the image if it did
+    not), unless it was checked less than max_age seconds ago. When the
+    files take more than budget bytes, the least recently used ones are
+    removed.
+
+    Several processes may share the same directory.
+    """
+
+    def __init__(self, directory, budget=100 * 1024 * 1024, max_age=0):
+        """:param directory: directory holding the cache (created if needed)
+        :param budget: maximum total size of the image files, in bytes
+        :param max_age: number of seconds during which a cached image is
+        used without checking with the server
+        """
+        self.directory = directory
+        self.budget = budget
+        self.max_age = max_age
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'))
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "url TEXT PRIMARY KEY, etag, digest TEXT, content_type TEXT, "
+                "checked REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS images_digest ON images (digest)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "digest TEXT PRIMARY KEY, size INTEGER, used REAL)"
+            )
+
+    def close(self):
+        self.db.close()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    @staticmethod
+    def _url(aircraft):
+        if not isinstance(aircraft, APIAircraft):
+            aircraft = APIAircraft(aircraft)
+        return APIAircraftImage(aircraft).url
+
+    def _image(self, digest, content_type, now):
+        path = self._path(digest)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        self.db.execute("UPDATE files SET used = ? WHERE digest = ?", (now, digest))
+        return CachedImage(path, content_type, digest, size)
+
+    def _store(self, body):
+        """Write image data to its content-addressed file"""
+        digest = hashlib.sha1(body).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            d = os.path.dirname(path)
+            if not os.path.isdir(d):
+                try:
+                    os.makedirs(d)
+                except OSError:
+                    # Created by another process in the meantime
+                    if not os.path.isdir(d):
+                        raise
+            fd, tmp = tempfile.mkstemp(dir=d)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                os.rename(tmp, path)
+            except:
+                os.unlink(tmp)
+                raise
+        return digest
+
+    def get(self, aircraft):
+        """Return the cached image of an aircraft without contacting
+        the server, or None if it is not cached
+
+        :param aircraft: APIAircraft, or aircraft ID or tail number
+        """
+        row = self.db.execute(
+            "SELECT digest, content_type FROM images WHERE url = ?",
+            (self._url(aircraft),)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            return self._image(row[0], row[1], time.time())
+
+    def fetch(self, client, aircraft):
+        """Return the image of an aircraft, downloading it if needed
+
+        :param aircraft: APIAircraft, or aircraft ID or tail number
+
+        Returns a CachedImage, or None if the aircraft has no image.
+        """
+        url = self._url(aircraft)
+        now = time.time()
+        row = self.db.execute(
+            "SELECT etag, digest, content_type, checked FROM images WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if row is not None:
+            etag, digest, content_type, checked = row
+            if os.path.exists(self._path(digest)):
+                if checked is not None and checked + self.max_age > now:
+                    with self.db:
+                        return self._image(digest, content_type, now)
+            else:
+                # The file was evicted by another process
+                etag = None
+        else:
+            etag = None
+        try:
+            content_type, new_etag, body = client.request(
+                url, "GET", if_none_match=etag
+            )
+        except HTTPError, e:
+            if e.code == 304:
+                with self.db:
+                    self.db.execute(
+                        "UPDATE images SET checked = ? WHERE url = ?", (now, url)
+                    )
+                    image = self._image(digest, content_type, now)
+                if image is not None:
+                    return image
+                # Removed while we were checking; download it again
+                content_type, new_etag, body = client.request(url, "GET")
+            elif e.code == 404:
+                with self.db:
+                    self.db.execute("DELETE FROM images WHERE url = ?", (url,))
+                return None
+            else:
+                raise
+        digest = self._store(body)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO images (url, etag, digest, content_type, checked) "
+                "VALUES (?, ?, ?, ?, ?)", (url, new_etag, digest, content_type, now)
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO files (digest, size, used) VALUES (?, ?, ?)",
+                (digest, len(body), now)
+            )
+        image = CachedImage(self._path(digest), content_type, digest, len(body))
+        self._evict(keep=digest)
+        return image
+
+    @property
+    def size(self):
+        """Total size of the cached image files, in bytes"""
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def _evict(self, keep=None):
+        with self.db:
+            total = self.size
+            if total <= self.budget:
+                return
+            for digest, size in self.db.execute(
+                "SELECT digest, size FROM files ORDER BY used"
+            ).fetchall():
+                if total <= self.budget:
+                    break
+                if digest == keep:
+                    continue
+                self.db.execute("DELETE FROM files WHERE digest = ?", (digest,))
+                self.db.execute("DELETE FROM images WHERE digest = ?", (digest,))
+                try:
+                    os.unlink(self._path(digest))
+                except OSError:
+                    pass
+                total -= size
+
+    def invalidate(self, aircraft):
+        """Forget the image of an aircraft, for example after saving a
+        new one. The file stays until evicted if other aircraft use it."""
+        with self.db:
+            self.db.execute("DELETE FROM images WHERE url = ?", (self._url(aircraft),))
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+
+"""Per-aircraft maintenance time rollups
+
+Maintenance systems add up engine_ontime, master_ontime and airtime
+per aircraft. MaintenanceRollup keeps, in a small SQLite database, the
+contribution of every flight it has seen and the totals per aircraft
+and day, so that totals since any date are sums over days rather than
+over flights, and so that a flight which is seen again (for example
+because it was assigned to an aircraft after the fact) only moves its
+own contribution.
+"""
+
+from wiflight.flight import APIFlightSearch
+import datetime
+import sqlite3
+
+# Summed properties of APIFlight, in the order of the columns
+_COLUMNS = ('engine_ontime', 'master_ontime', 'airtime')
+
+class MaintenanceRollup(object):
+    """Per-aircraft, per-day totals of engine, master and air time
+
+    Example:
+
+    rollup = wiflight.MaintenanceRollup("maintenance.sqlite")
+    sync = wiflight.FlightSync("sync.sqlite")
+    sync.poll(client, rollup.add)
+    rollup.refresh_unassigned(client)
+    print rollup.hours_since("C-FFSK", datetime.date(2014,1,1))
+
+    Flights are attributed to the UTC day on which they start. Flights
+    without an aircraft are kept aside until they are seen again with
+    one; refresh_unassigned looks them all up again.
+    """
+
+    def __init__(self, path=':memory:'):
+        """:param path: SQLite database file (created if needed)"""
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "id INTEGER PRIMARY KEY, aircraft_id INTEGER, tail TEXT, day TEXT, "
+                "engine_ontime REAL, master_ontime REAL, airtime REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS flights_aircraft ON flights (aircraft_id)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS daily ("
+                "aircraft_id INTEGER, day TEXT, flights INTEGER, "
+                "engine_ontime REAL, master_ontime REAL, airtime REAL, "
+                "PRIMARY KEY (aircraft_id, day))"
+            )
+
+    def close(self):
+        self.db.close()
+
+    def _apply(self, aircraft_id, day, sign, values):
+        if aircraft_id is None or day is None:
+            return
+        self.db.execute(
+            "INSERT OR IGNORE INTO daily VALUES (?, ?, 0, 0, 0, 0)",
+            (aircraft_id, day)
+        )
+        self.db.execute(
+            "UPDATE daily SET flights = flights + ?, engine_ontime = engine_ontime + ?, "
+            "master_ontime = master_ontime + ?, airtime = airtime + ? "
+            "WHERE aircraft_id = ? AND day = ?",
+            [sign] + [sign * v for v in values] + [aircraft_id, day]
+        )
+        self.db.execute(
+            "DELETE FROM daily WHERE aircraft_id = ? AND day = ? AND flights = 0",
+            (aircraft_id, day)
+        )
+
+    def _replace(self, flight_id, row):
+        old = self.db.execute(
+            "SELECT aircraft_id, tail, day, engine_ontime, master_ontime, airtime "
+            "FROM flights WHERE id = ?", (flight_id,)
+        ).fetchone()
+        if old == row:
+            return False
+        if old is not None:
+            self._apply(old[0], old[2], -1, old[3:])
+            self.db.execute("DELETE FROM flights WHERE id = ?", (flight_id,))
+        if row is not None:
+            self._apply(row[0], row[2], 1, row[3:])
+            self.db.execute(
+                "INSERT INTO flights VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (flight_id,) + tuple(row)
+            )
+        return True
+
+    def add(self, flight, is_new=None):
+        """Record or update the contribution of a flight (an APIFlight)
+
+        If the flight was already recorded with another aircraft, day
+        or times, its old contribution is replaced. The signature
+        allows this method to be used directly as the callback of
+        FlightSync.poll.
+
+        Returns True if anything changed.
+        """
+        aircraft = flight.body.find('aircraft')
+        aircraft_id = tail = None
+        if aircraft is not None:
+            if aircraft.get('id') is not None:
+                aircraft_id = int(aircraft.get('id'))
+            tail = aircraft.findtext('tail')
+        start = flight.start
+        row = (
+            aircraft_id, tail, None if start is None else start.date().isoformat()
+        ) + tuple(
+            float(getattr(flight, c) or 0) for c in _COLUMNS
+        )
+        with self.db:
+            return self._replace(flight.id, row)
+
+    def remove(self, flight_id):
+        """Remove the contribution of a flight, for example a deleted one"""
+        with self.db:
+            return self._replace(flight_id, None)
+
+    def unassigned(self):
+        """IDs of the recorded flights which have no aircraft"""
+        return [
+            row[0] for row in self.db.execute(
+                "SELECT id FROM flights WHERE aircraft_id IS NULL ORDER BY id"
+            )
+        ]
+
+    def refresh_unassigned(self, client, clients=None):
+        """Look up the flights without an aircraft again, and move the
+        ones which have been assigned since to their aircraft
+
+        :param clients: optional sequence of sessions used concurrently
+        (see APIFlightSearch.load)
+
+        Returns the number of flights which changed.
+        """
+        ids = self.unassigned()
+        if not ids:
+            return 0
+        search = APIFlightSearch(f=ids)
+        search.load(client, clients=clients)
+        changed = 0
+        for flight in search:
+            if flight is not None and self.add(flight):
+                changed += 1
+        return changed
+
+    def aircraft_id(self, tail):
+        """ID of the aircraft with this tail number in recorded flights,
+        or None"""
+        row = self.db.execute(
+            "SELECT aircraft_id FROM flights WHERE tail = ? AND aircraft_id IS NOT NULL "
+            "LIMIT 1", (tail,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _aircraft(self, aircraft):
+        if isinstance(aircraft, basestring):
+            aircraft_id = self.aircraft_id(aircraft)
+            if aircraft_id is None:
+                raise KeyError(aircraft)
+            return aircraft_id
+        return int(aircraft)
+
+    @staticmethod
+    def _bounds(since, until):
+        where = ""
+        args = []
+        if since is not None:
+            where += " AND day >= ?"
+            args.append(since.isoformat())
+        if until is not None:
+            where += " AND day < ?"
+            args.append(until.isoformat())
+        return where, args
+
+    def totals(self, aircraft, since=None, until=None):
+        """Totals for an aircraft over the days in [since, until)
+
+        :param aircraft: aircraft ID or tail number
+        :param since: first day (datetime.date), or None
+        :param until: day after the last day (datetime.date), or None
+
+        Returns a dictionary with the number of flights ('flights') and
+        the totals in seconds of engine_ontime, master_ontime and
+        airtime.
+        """
+        where, args = self._bounds(since, until)
+        row = self.db.execute(
+            "SELECT COALESCE(SUM(flights), 0), COALESCE(SUM(engine_ontime), 0), "
+            "COALESCE(SUM(master_ontime), 0), COALESCE(SUM(airtime), 0) "
+            "FROM daily WHERE aircraft_id = ?" + where,
+            [self._aircraft(aircraft)] + args
+        ).fetchone()
+        return dict(zip(('flights',) + _COLUMNS, row))
+
+    def hours_since(self, aircraft, since, column='engine_ontime'):
+        """Hours of engine_ontime (or another column) of an aircraft
+        since the beginning of the day since (a datetime.date)"""
+        if column not in _COLUMNS:
+            raise ValueError("Unknown column %r" % (column,))
+        return self.totals(aircraft, since)[column] / 3600.0
+
+    def daily(self, aircraft, since=None, until=None):
+        """Per-day totals of an aircraft over the days in [since, until)
+
+        Returns a list of (date, flights, engine_ontime, master_ontime,
+        airtime) tuples, in order of date, for days with flights.
+        """
+        where, args = self._bounds(since, until)
+        return [
+            (datetime.datetime.strptime(row[0], '%Y-%m-%d').date(),) + tuple(row[1:])
+            for row in self.db.execute(
+                "SELECT day, flights, engine_ontime, master_ontime, airtime "
+                "FROM daily WHERE aircraft_id = ?" + where + " ORDER BY day",
+                [self._aircraft(aircraft)] + args
+            )
+        ]
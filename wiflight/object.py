@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+from wiflight.columns import to_columns, to_dataframe
 import lxml.etree
 import datetime
 import decimal
@@ -10,30 +11,105 @@ def _decode_iso8601(d):
 def _encode_iso8601(d):
     return "%d%02d%02dT%02d%02d%02dZ" % (d.year, d.month, d.day, d.hour, d.minute, d.second)
 
-class _GroupMembershipSet(object):
-    __slots__ = ('doc', 'xpath')
+class _IndexedMemberSet(object):
+    """Set of attribute values of the child tags of container tags
+
+    :param doc: etree holding the members
+    :param xpath: locates the containers in doc. Members of every
+    matching container are included; new members go to the first one,
+    which is created as a child of doc if there is none.
+
+    Subclasses give the tag and attribute names. The values are indexed
+    the first time they are needed, after which membership tests and
+    len take constant time and add and remove do not scan the document.
+    The index follows changes made through this object and the sets in
+    its related list (sets of other attributes of the same tags), which
+    are reindexed when this one changes the document. Owning objects
+    keep the same sets until their body is replaced (see
+    APIObject._member_set), and code changing the member tags
+    directly must call APIObject._reindex_member_sets.
+    """
+    __slots__ = ('doc', 'xpath', 'related', '_index')
 
     def __init__(self, doc, xpath):
         self.doc = doc
         self.xpath = xpath
+        self.related = []
+        self._index = None
+
+    def _container(self):
+        """Return the first tag containing the members, creating it if
+        needed"""
+        containers = self.doc.xpath(self.xpath)
+        if containers:
+            return containers[0]
+        container = lxml.etree.Element(self.xpath.rsplit('/', 1)[1])
+        self.doc.append(container)
+        return container
+
+    def _members(self):
+        index = self._index
+        if index is None:
+            index = self._index = {}
+            for tag in self.doc.xpath(self.xpath + "/" + self._tag):
+                value = tag.get(self._attrname)
+                if value is not None:
+                    index.setdefault(value, []).append(tag)
+        return index
 
     def __iter__(self):
-        return iter(self.doc.xpath(self.xpath + "/member_of/@group_name"))
+        return iter(self.doc.xpath(
+            self.xpath + "/" + self._tag + "/@" + self._attrname
+        ))
+
+    def __contains__(self, value):
+        return value in self._members()
+
+    def __len__(self):
+        return len(self._members())
 
     def __repr__(self):
         return repr(set(self))
 
-    def add(self, groupname):
-        if groupname not in self:
-            toptag = self.doc.xpath(self.xpath)[0]
-            tag = lxml.etree.Element('member_of')
-            tag.set('group_name', groupname)
-            toptag.append(tag)
-
-    def remove(self, groupname):
-        for tag in self.doc.xpath(self.xpath + "/member_of"):
-            if tag.get('group_name') == groupname:
-                tag.getparent().remove(tag)
+    def add(self, value):
+        self.update((value,))
+
+    def _changed(self):
+        for other in self.related:
+            other._index = None
+
+    def remove(self, value):
+        tags = self._members().pop(value, ())
+        for tag in tags:
+            tag.getparent().remove(tag)
+        if tags:
+            self._changed()
+
+    def update(self, values):
+        """Add all of the values"""
+        index = self._members()
+        container = None
+        for value in values:
+            if value in index:
+                continue
+            if container is None:
+                container = self._container()
+            tag = lxml.etree.Element(self._tag)
+            tag.set(self._attrname, value)
+            container.append(tag)
+            index[value] = [tag]
+        if container is not None:
+            self._changed()
+
+    def difference_update(self, values):
+        """Remove all of the values"""
+        for value in values:
+            self.remove(value)
+
+class _GroupMembershipSet(_IndexedMemberSet):
+    __slots__ = ()
+    _tag = 'member_of'
+    _attrname = 'group_name'
 
 class APIObject(object):
     """Represents an arbitrary Wi-Flight API object
@@ -47,7 +123,7 @@ class APIObject(object):
     should be set and then the object saved to the server using the
     save method.
     """
-    __slots__ = ('url', 'urlparts', 'query_string', 'etag', 'body', 'content_type')
+    __slots__ = ('url', 'urlparts', 'query_string', 'etag', 'body', 'content_type', '_member_sets')
 
     def __init__(self, *urlparts, **kwargs):
         """Construct a generic empty object with a given URL
@@ -73,6 +149,7 @@ class APIObject(object):
         self.query_string = query_string
         self.url = url
         self.etag = None
+        self._member_sets = {}
         if hasattr(self, '_toptag'):
             self.body = lxml.etree.Element(self._toptag)
             self.content_type = 'text/xml'
@@ -80,12 +157,49 @@ class APIObject(object):
             self.body = None
             self.content_type = None
 
+    # Slots holding values derived from body, rebuilt after unpickling
+    _derived_slots = ('_member_sets',)
+
+    def _slot_names(self):
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                yield name
+
+    def __getstate__(self):
+        state = {}
+        for name in self._slot_names():
+            if name not in self._derived_slots and hasattr(self, name):
+                state[name] = getattr(self, name)
+        if lxml.etree.iselement(self.body):
+            # Elements cannot be pickled, their text can
+            state['body'] = None
+            state['xml_body'] = lxml.etree.tostring(self.body)
+        return state
+
+    def __setstate__(self, state):
+        # Bypass __setattr__, which some subclasses restrict
+        for name in self._derived_slots:
+            object.__setattr__(self, name, None)
+        object.__setattr__(self, '_member_sets', {})
+        for name, value in state.iteritems():
+            if name == 'xml_body':
+                name = 'body'
+                value = lxml.etree.fromstring(value)
+            object.__setattr__(self, name, value)
+
     def load(self, client):
         """Load the contents of the object from the server.
 
         This replaces the old contents of the local copy of the object.
         """
         content_type, etag, body = client.request(self.url, "GET")
+        self._set_response(content_type, etag, body)
+
+    def _set_response(self, content_type, etag, body):
+        """Replace the contents of the object with a server response
+
+        The arguments are as returned by APISession.request.
+        """
         self.etag = etag
         ct_parts = content_type.split(';')
         content_type = ct_parts[0].strip()
@@ -161,7 +275,33 @@ class APIObject(object):
 
         These group memberships influence permissions for the object and
         only superusers can modify the list."""
-        return _GroupMembershipSet(self.body, "/" + self._toptag)
+        return self._member_set(_GroupMembershipSet, "/" + self._toptag)
+
+    def _reindex_member_sets(self):
+        """Forget the indexes of the member sets of this object
+
+        Call this after changing the member tags of body by other means
+        than the sets themselves.
+        """
+        for body, members in self._member_sets.itervalues():
+            members._index = None
+
+    def _member_set(self, cls, xpath):
+        """Return the cls(body, xpath) member set of this object
+
+        The same set, with its index, is returned until body is
+        replaced, for instance by load.
+        """
+        cached = self._member_sets.get(cls)
+        if cached is None or cached[0] is not self.body:
+            members = cls(self.body, xpath)
+            for body, other in self._member_sets.itervalues():
+                if body is self.body and other.xpath == xpath:
+                    other.related.append(members)
+                    members.related.append(other)
+            cached = (self.body, members)
+            self._member_sets[cls] = cached
+        return cached[1]
 
     def __get_attr(self, name, decoder):
         taglist = self.body.xpath("/" + self._toptag + "/" + name + "/text()")
@@ -232,6 +372,29 @@ class APIObject(object):
 
 class APIListObject(APIObject):
     __slots__ = ()
+    # (item tag, [(column name, kind, path), ...]) for to_columns, in
+    # subclasses which support it (see wiflight.columns.to_columns)
+    _columns = None
+
+    def to_columns(self):
+        """Decode the loaded items into numpy arrays, one per field
+
+        Returns an OrderedDict of arrays by column name. Requires numpy.
+        """
+        if self._columns is None:
+            raise TypeError("%s has no columnar export" % (type(self).__name__,))
+        tag, columns = self._columns
+        return to_columns(self.body, tag, columns)
+
+    def to_dataframe(self, index=None):
+        """Same as to_columns, but return a pandas DataFrame
+
+        :param index: if not None, name of the column to use as index
+        """
+        if self._columns is None:
+            raise TypeError("%s has no columnar export" % (type(self).__name__,))
+        tag, columns = self._columns
+        return to_dataframe(self.body, tag, columns, index)
 
     def __iter__(self):
         for sub in self.body:
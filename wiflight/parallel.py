@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""Running API requests concurrently
+
+An APISession wraps a single cURL handle and can only perform one
+request at a time. Concurrency is therefore obtained by giving several
+sessions (for example, one login per worker) to client_map, which runs
+one worker thread per session.
+"""
+
+import sys
+import threading
+import Queue
+# The first call to datetime.strptime imports _strptime, which is not
+# thread safe; make sure it is imported before any worker starts.
+import _strptime
+
+def client_map(clients, func, items, lookahead=2):
+    """Apply func(client, item) to every item concurrently
+
+    :param clients: sequence of sessions. One worker thread is started
+    for each and only ever uses that session.
+    :param func: function called as func(client, item) in a worker
+    :param items: iterable of work items. It is consumed lazily.
+    :param lookahead: number of items per worker that may be in
+    progress or waiting to be returned at any time
+
+    Returns an iterator over the results in the same order as the
+    items. If func raises an exception, it is raised from the iterator
+    at the position of the failed item and remaining work is abandoned.
+    """
+    clients = list(clients)
+    if not clients:
+        raise ValueError("At least one client is required")
+    return _client_map(clients, func, iter(items), max(lookahead, 1) * len(clients))
+
+def _worker(client, func, inq, outq):
+    while True:
+        work = inq.get()
+        if work is None:
+            return
+        idx, item = work
+        try:
+            outq.put((idx, True, func(client, item)))
+        except Exception:
+            outq.put((idx, False, sys.exc_info()))
+
+def _client_map(clients, func, items, limit):
+    inq = Queue.Queue()
+    outq = Queue.Queue()
+    threads = []
+    for client in clients:
+        thread = threading.Thread(target=_worker, args=(client, func, inq, outq))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    submitted = 0
+    done = {}
+    next_idx = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and submitted - next_idx < limit:
+                try:
+                    item = items.next()
+                except StopIteration:
+                    exhausted = True
+                    break
+                inq.put((submitted, item))
+                submitted += 1
+            if next_idx == submitted:
+                return
+            while next_idx not in done:
+                idx, ok, result = outq.get()
+                done[idx] = ok, result
+            ok, result = done.pop(next_idx)
+            next_idx += 1
+            if not ok:
+                raise result[0], result[1], result[2]
+            yield result
+    finally:
+        # Abandon work that has not started yet and stop the workers
+        while True:
+            try:
+                inq.get_nowait()
+            except Queue.Empty:
+                break
+        for thread in threads:
+            inq.put(None)
@@ -0,0 +1,419 @@
+#!/usr/bin/python
+
+"""Flight queries combining server-side and local filtering
+
+A query is written as a predicate built from the functions of this
+module and combined with & (and), | (or) and ~ (not):
+
+from wiflight.query import during, aircraft, field, has_event
+query = wiflight.FlightQuery(
+    during(datetime.datetime(2014,6,1), datetime.datetime(2014,7,1)) &
+    aircraft("C-FFSK") & (field('gs_max') > 60) & has_event("airspace")
+)
+for flight in query.run([client]):
+    pass
+
+FlightQuery translates what the server can evaluate (time bounds,
+groups, flight IDs, keywords, missing aircraft, event severities) into
+APIFlightSearch parameters, and evaluates everything else on the
+returned flights as they are streamed.
+"""
+
+from wiflight.flight import APIFlightSearch, flight_keywords
+from wiflight.search import FlightSearchExecutor
+import datetime
+import operator
+import re
+
+def _severity_range(min_severity, max_severity):
+    return '%s..%s' % (
+        '' if min_severity is None else int(min_severity),
+        '' if max_severity is None else int(max_severity),
+    )
+
+class Predicate(object):
+    """A condition on flights
+
+    Subclasses implement match(flight, query), which returns True if
+    the flight (an APIFlight) satisfies the condition; query is the
+    FlightQuery which fetched the flight, which tells what information
+    was requested from the server. Conditions that can be given to the
+    server also implement _push.
+    """
+    __slots__ = ()
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def _push(self, query):
+        """Add the condition to the search parameters of query
+
+        Returns True if the server then evaluates the condition exactly,
+        so that it does not need to be checked locally. Only called on
+        conditions which all flights must satisfy.
+        """
+        return False
+
+    def _require(self, query):
+        """Request the information needed to evaluate match locally"""
+        pass
+
+class And(Predicate):
+    __slots__ = ('terms',)
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def conjuncts(self):
+        for t in self.terms:
+            if isinstance(t, And):
+                for c in t.conjuncts():
+                    yield c
+            else:
+                yield t
+
+    def match(self, flight, query):
+        return all(t.match(flight, query) for t in self.terms)
+
+    def _require(self, query):
+        for t in self.terms:
+            t._require(query)
+
+class Or(Predicate):
+    __slots__ = ('terms',)
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def match(self, flight, query):
+        return any(t.match(flight, query) for t in self.terms)
+
+    def _require(self, query):
+        for t in self.terms:
+            t._require(query)
+
+class Not(Predicate):
+    __slots__ = ('term',)
+
+    def __init__(self, term):
+        self.term = term
+
+    def match(self, flight, query):
+        return not self.term.match(flight, query)
+
+    def _require(self, query):
+        self.term._require(query)
+
+class _During(Predicate):
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def match(self, flight, query):
+        flight_start = flight.start
+        if flight_start is None:
+            return False
+        flight_end = flight_start
+        length = flight.length
+        if length is not None:
+            flight_end += datetime.timedelta(seconds=float(length))
+        return (self.start is None or flight_end >= self.start) and \
+            (self.end is None or flight_start <= self.end)
+
+    def _push(self, query):
+        if self.start is not None:
+            query._start = max(query._start or self.start, self.start)
+        if self.end is not None:
+            query._end = min(query._end or self.end, self.end)
+        # Still checked locally, in case the server's notion of a
+        # flight's extent differs from start and length
+        return False
+
+def during(start=None, end=None):
+    """Flights overlapping the interval [start, end] (UTC datetimes)"""
+    return _During(start, end)
+
+class _InGroup(Predicate):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def match(self, flight, query):
+        return self.name in flight.groups
+
+    def _push(self, query):
+        if self.name not in query._groups:
+            query._groups.append(self.name)
+        return True
+
+def in_group(name):
+    """Flights which are members of the named group"""
+    return _InGroup(name)
+
+class _FlightIds(Predicate):
+    __slots__ = ('ids',)
+
+    def __init__(self, ids):
+        self.ids = frozenset(int(f) for f in ids)
+
+    def match(self, flight, query):
+        return flight.id in self.ids
+
+    def _push(self, query):
+        if query._ids is None:
+            query._ids = self.ids
+        else:
+            query._ids = query._ids & self.ids
+        return True
+
+def flight_ids(ids):
+    """Flights whose identifier is in the sequence ids"""
+    return _FlightIds(ids)
+
+class _Keywords(Predicate):
+    __slots__ = ('words',)
+
+    def __init__(self, words):
+        self.words = tuple(words.split())
+
+    def match(self, flight, query):
+        # Approximation of the server's keyword search, used only when
+        # the keywords cannot be sent to the server (under | or ~)
+        keywords = flight_keywords(flight).lower().split()
+        return all(
+            any(k.startswith(w) for k in keywords)
+            for w in re.findall(r'\w+', u' '.join(self.words).lower(), re.UNICODE)
+        )
+
+    def _push(self, query):
+        query._kw.extend(self.words)
+        return True
+
+    def _require(self, query):
+        query._full_events = True
+
+def keywords(words):
+    """Flights matching the keyword search string words, as interpreted
+    by the server (see the kw parameter of APIFlightSearch)"""
+    return _Keywords(words)
+
+class _MissingAircraft(Predicate):
+    __slots__ = ()
+
+    def match(self, flight, query):
+        return flight.body.find('aircraft') is None
+
+    def _push(self, query):
+        query._missingaircraft = True
+        return True
+
+def missing_aircraft():
+    """Flights which are not registered to any aircraft"""
+    return _MissingAircraft()
+
+class _Aircraft(Predicate):
+    __slots__ = ('tail',)
+
+    def __init__(self, tail):
+        self.tail = tail
+
+    def match(self, flight, query):
+        tail = flight.body.findtext('aircraft/tail')
+        return tail is not None and tail.upper() == self.tail.upper()
+
+    def _push(self, query):
+        # The tail number is also a keyword, which narrows the search
+        query._hints.append(self.tail)
+        return False
+
+def aircraft(tail):
+    """Flights of the aircraft with the given tail number"""
+    return _Aircraft(tail)
+
+class _HasEvent(Predicate):
+    __slots__ = ('type', 'min_severity', 'max_severity')
+
+    def __init__(self, type, min_severity, max_severity):
+        self.type = type
+        self.min_severity = min_severity
+        self.max_severity = max_severity
+
+    def match(self, flight, query):
+        if not query._full_events:
+            # Only the number of events in the range was requested
+            counts = flight.event_counts or []
+            idx = query._ranges.index(
+                _severity_range(self.min_severity, self.max_severity)
+            )
+            return idx < len(counts) and counts[idx] > 0
+        events = flight.events
+        if self.min_severity is None and self.max_severity is None:
+            if self.type is None:
+                return bool(events)
+            return bool(events.by_type(self.type))
+        return bool(events.with_severity(
+            self.min_severity, self.max_severity, self.type
+        ))
+
+    def _push(self, query):
+        if self.type is not None:
+            # Event types are also keywords, which narrows the search
+            query._hints.append(self.type)
+        return False
+
+    def _require(self, query):
+        if self.type is None:
+            r = _severity_range(self.min_severity, self.max_severity)
+            if r not in query._ranges:
+                query._ranges.append(r)
+        else:
+            query._full_events = True
+
+def has_event(type=None, min_severity=None, max_severity=None):
+    """Flights with at least one event of the given type (if not None)
+    and severity between min_severity and max_severity inclusive"""
+    return _HasEvent(type, min_severity, max_severity)
+
+class _Compare(Predicate):
+    __slots__ = ('name', 'op', 'value')
+
+    def __init__(self, name, op, value):
+        self.name = name
+        self.op = op
+        self.value = value
+
+    def match(self, flight, query):
+        v = getattr(flight, self.name)
+        if v is None:
+            return False
+        return self.op(v, self.value)
+
+class field(object):
+    """A property of APIFlight (such as 'gs_max' or 'engine_ontime'),
+    compared with the usual operators to form a predicate
+
+    Flights whose property is missing never match.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __lt__(self, value):
+        return _Compare(self.name, operator.lt, value)
+
+    def __le__(self, value):
+        return _Compare(self.name, operator.le, value)
+
+    def __gt__(self, value):
+        return _Compare(self.name, operator.gt, value)
+
+    def __ge__(self, value):
+        return _Compare(self.name, operator.ge, value)
+
+    def __eq__(self, value):
+        return _Compare(self.name, operator.eq, value)
+
+    def __ne__(self, value):
+        return _Compare(self.name, operator.ne, value)
+
+class FlightQuery(object):
+    """Plan and run a flight query
+
+    After construction, search_args holds the APIFlightSearch
+    parameters that will be used and local the list of predicates
+    evaluated on the returned flights.
+
+    Keywords given with keywords() are only evaluated by the server.
+    Time bounds are given to the server and checked again locally.
+    Tail numbers and event types are checked locally, but are also
+    sent as keywords to reduce the number of flights returned, unless
+    flight IDs already restrict the search further. Events are only
+    requested if a local predicate needs them, and when only event
+    severities matter, only counts of events are requested.
+    """
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self._start = self._end = self._ids = None
+        self._groups = []
+        self._kw = []
+        self._hints = []
+        self._missingaircraft = False
+        self._full_events = False
+        self._ranges = []
+        if isinstance(predicate, And):
+            conjuncts = list(predicate.conjuncts())
+        else:
+            conjuncts = [predicate]
+        self.local = [c for c in conjuncts if not c._push(self)]
+        for c in self.local:
+            c._require(self)
+        if self._full_events:
+            events = True
+        elif self._ranges:
+            events = ','.join(self._ranges)
+        else:
+            events = None
+        kw = list(self._kw)
+        if self._ids is None:
+            kw.extend(self._hints)
+        self.search_args = {
+            'kw': ' '.join(kw) or None,
+            'start': self._start,
+            'end': self._end,
+            'group': list(self._groups),
+            'f': None if self._ids is None else sorted(self._ids),
+            'missingaircraft': self._missingaircraft,
+            'events': events,
+        }
+        self.empty = self._ids is not None and not self._ids or (
+            self._start is not None and self._end is not None and
+            self._start > self._end
+        )
+
+    def matches(self, flight):
+        """True if a flight returned by the search satisfies the query"""
+        return all(p.match(flight, self) for p in self.local)
+
+    def run(self, clients, **executor_args):
+        """Run the query and return an iterator over matching APIFlight
+
+        :param clients: sequence of sessions. Several sessions are used
+        concurrently for searches with many flight IDs or with both
+        time bounds (see FlightSearchExecutor).
+        :param executor_args: other parameters of FlightSearchExecutor,
+        used when both time bounds are given
+        """
+        clients = list(clients)
+        if self.empty:
+            return iter(())
+        args = dict(self.search_args)
+        if args['f'] is None and args['start'] is not None and args['end'] is not None:
+            start = args.pop('start')
+            end = args.pop('end')
+            del args['f']
+            args.update(executor_args)
+            flights = FlightSearchExecutor(clients, **args).run(start, end)
+        else:
+            if args['f'] is None:
+                args['f'] = []
+            search = APIFlightSearch(**args)
+            search.load(clients[0], clients=clients)
+            flights = (f for f in search if f is not None)
+        return (f for f in flights if self.matches(f))
+
+    def __repr__(self):
+        return '<FlightQuery search=%r local=%d>' % (
+            dict((k, v) for k, v in self.search_args.iteritems() if v),
+            len(self.local)
+        )
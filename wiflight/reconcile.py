@@ -0,0 +1,241 @@
+#!/usr/bin/python
+
+"""Mirroring reservations from an external system
+
+A dispatch system that mirrors its bookings as reservations would
+otherwise load and save each reservation in turn. ReservationReconciler
+loads the current version of every reservation concerned concurrently,
+works out which ones actually need to be created, updated or deleted,
+and applies only those changes, concurrently and with ETag guards so
+that concurrent modifications are never overwritten blindly.
+"""
+
+from wiflight.client import HTTPError
+from wiflight.reservation import APIReservation
+from wiflight.parallel import client_map
+import time
+
+def _aircraft_matches(desired, existing):
+    d = desired.body.find('aircraft')
+    e = existing.body.find('aircraft')
+    if d is None or e is None:
+        return d is None and e is None
+    if d.get('id') is not None:
+        return d.get('id') == e.get('id')
+    tail = d.get('tail') or d.findtext('tail')
+    existing_tail = e.get('tail') or e.findtext('tail')
+    if tail is None or existing_tail is None:
+        return tail is None and existing_tail is None
+    return tail.upper() == existing_tail.upper()
+
+def _crew(resv):
+    return [
+        (user.get('name'), user.get('uuid'))
+        for user in resv.body.xpath("/reservation/crew/user")
+    ]
+
+def _crew_matches(desired, existing):
+    remaining = _crew(existing)
+    wanted = _crew(desired)
+    if len(wanted) != len(remaining):
+        return False
+    for name, uuid in wanted:
+        # The server fills in whichever of name and UUID was not given
+        for i, (n, u) in enumerate(remaining):
+            if (name is None or name == n) and (uuid is None or uuid == u):
+                del remaining[i]
+                break
+        else:
+            return False
+    return True
+
+def reservation_matches(desired, existing):
+    """True if saving desired would not change the existing reservation
+
+    Only what desired specifies is compared: the aircraft is compared
+    by ID or tail number depending on which one desired has, crew
+    members by name and/or UUID, and groups only if desired has any.
+    """
+    for attr in ('domain', 'start', 'end', 'notify_profile'):
+        if getattr(desired, attr) != getattr(existing, attr):
+            return False
+    desired_groups = set(desired.groups)
+    if desired_groups and desired_groups != set(existing.groups):
+        return False
+    return _aircraft_matches(desired, existing) and _crew_matches(desired, existing)
+
+class ReconcileReport(object):
+    """Outcome of ReservationReconciler.run
+
+    The attributes created, updated, deleted and unchanged are lists of
+    reservation names. conflicts counts the changes which were
+    refused because the reservation changed on the server in the
+    meantime (and were retried). failed is a list of (name, exception)
+    for the reservations which could not be reconciled.
+    """
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        self.unchanged = []
+        self.failed = []
+        self.conflicts = 0
+        self.requests = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """Requests per second"""
+        if not self.elapsed:
+            return 0.0
+        return self.requests / self.elapsed
+
+    def __repr__(self):
+        return (
+            '<ReconcileReport created=%d updated=%d deleted=%d unchanged=%d '
+            'failed=%d conflicts=%d requests=%d %.1f/s>' % (
+                len(self.created), len(self.updated), len(self.deleted),
+                len(self.unchanged), len(self.failed), self.conflicts,
+                self.requests, self.throughput
+            )
+        )
+
+class ReservationReconciler(object):
+    """Make the reservations of a domain match a desired set
+
+    Example:
+
+    desired = []
+    for booking in dispatch_bookings():
+        resv = wiflight.APIReservation(booking.reference)
+        resv.domain = "dispatch"
+        resv.start = booking.start
+        resv.end = booking.end
+        resv.aircraft = wiflight.APIAircraft(booking.tail)
+        resv.crew.add(booking.pilot)
+        desired.append(resv)
+    reconciler = wiflight.ReservationReconciler([session1, session2], "dispatch")
+    report = reconciler.run(desired, existing_names=names_mirrored_last_time)
+
+    The API cannot list reservations, so the reservations to delete
+    must be named: every reservation in existing_names which is not
+    desired is deleted, provided it belongs to the domain. A desired
+    reservation whose name is taken by a reservation of another domain
+    is reported as failed rather than overwritten.
+    """
+
+    def __init__(self, clients, domain, retries=3):
+        """:param clients: sequence of sessions, used concurrently (see
+        wiflight.parallel.client_map)
+        :param domain: domain of the mirrored reservations
+        :param retries: number of times a change refused because of a
+        concurrent modification (HTTP 412) is retried after reloading
+        """
+        self.clients = list(clients)
+        self.domain = domain
+        self.retries = retries
+
+    def _load(self, client, name):
+        """Return the current reservation named name, or None"""
+        resv = APIReservation(name)
+        try:
+            resv.load(client)
+        except HTTPError, e:
+            if e.code == 404:
+                return None
+            raise
+        return resv
+
+    def _apply(self, client, desired, existing, counts):
+        """Return the action taken
+
+        counts is a list [requests, conflicts] to which the numbers of
+        requests made and of conflicts are added, even if an exception
+        is raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                if desired is None:
+                    if existing is None or existing.domain != self.domain:
+                        return 'unchanged'
+                    counts[0] += 1
+                    existing.delete(client)
+                    return 'deleted'
+                if existing is None:
+                    desired.etag = None
+                    counts[0] += 1
+                    desired.save(client)
+                    return 'created'
+                if existing.domain != self.domain:
+                    raise ValueError(
+                        "Reservation %s exists in domain %s, not %s" % (
+                            existing.name, existing.domain, self.domain
+                        )
+                    )
+                if reservation_matches(desired, existing):
+                    return 'unchanged'
+                desired.etag = existing.etag
+                counts[0] += 1
+                desired.save(client)
+                return 'updated'
+            except HTTPError, e:
+                if e.code != 412 or attempt >= self.retries:
+                    raise
+            counts[1] += 1
+            attempt += 1
+            name = (desired or existing).name
+            counts[0] += 1
+            existing = self._load(client, name)
+
+    def _reconcile(self, client, item):
+        name, desired = item
+        counts = [1, 0]
+        try:
+            existing = self._load(client, name)
+            action = self._apply(client, desired, existing, counts)
+        except Exception, e:
+            return name, None, e, counts[0], counts[1]
+        return name, action, None, counts[0], counts[1]
+
+    def run(self, desired, existing_names=()):
+        """Reconcile and return a ReconcileReport
+
+        :param desired: iterable of APIReservation, as they should be.
+        Their domain is set to the reconciler's domain if it is not set.
+        :param existing_names: names of other reservations which may
+        exist in the domain and should be deleted
+        """
+        items = {}
+        order = []
+        for resv in desired:
+            if resv.domain is None:
+                resv.domain = self.domain
+            elif resv.domain != self.domain:
+                raise ValueError(
+                    "Reservation %s is in domain %s, not %s" % (
+                        resv.name, resv.domain, self.domain
+                    )
+                )
+            if resv.name in items:
+                raise ValueError("Reservation %s is given twice" % (resv.name,))
+            items[resv.name] = resv
+            order.append(resv.name)
+        for name in existing_names:
+            if name not in items:
+                items[name] = None
+                order.append(name)
+        report = ReconcileReport()
+        t0 = time.time()
+        for name, action, error, requests, conflicts in client_map(
+            self.clients, self._reconcile, ((name, items[name]) for name in order)
+        ):
+            report.requests += requests
+            report.conflicts += conflicts
+            if error is not None:
+                report.failed.append((name, error))
+            else:
+                getattr(report, action).append(name)
+        report.elapsed = time.time() - t0
+        return report
@@ -1,50 +1,21 @@
 #!/usr/bin/python
 
-from wiflight.object import APIObject
+from wiflight.object import APIObject, _IndexedMemberSet
 from wiflight.aircraft import WithAircraftMixIn
 import lxml.etree
 
-class _ResvCrewSetBase(object):
-    __slots__ = ('doc',)
-
-    def __init__(self, doc):
-        self.doc = doc
-
-    def __len__(self):
-        return len(self.doc.xpath("/reservation/crew/user"))
-
-    def __repr__(self):
-        return repr(set(self))
-
-    def add(self, username):
-        if username not in self:
-            toptag = self.doc.xpath("/reservation/crew")
-            if toptag:
-                toptag = toptag[0]
-            else:
-                toptag = lxml.etree.Element('crew')
-                self.doc.append(toptag)
-            tag = lxml.etree.Element('user')
-            tag.set(self._attrname, username)
-            toptag.append(tag)
-
-    def remove(self, username):
-        for tag in self.doc.xpath("/reservation/crew/user"):
-            if tag.get(self._attrname) == username:
-                tag.getparent().remove(tag)
+class _ResvCrewSetBase(_IndexedMemberSet):
+    __slots__ = ()
+    _tag = 'user'
 
 class _ResvCrewByNameSet(_ResvCrewSetBase):
+    __slots__ = ()
     _attrname = 'name'
 
-    def __iter__(self):
-        return iter(self.doc.xpath("/reservation/crew/user/@name"))
-
 class _ResvCrewByUUIDSet(_ResvCrewSetBase):
+    __slots__ = ()
     _attrname = 'uuid'
 
-    def __iter__(self):
-        return iter(self.doc.xpath("/reservation/crew/user/@uuid"))
-
 class APIReservation(APIObject, WithAircraftMixIn):
     """Represents a Wi-Flight reservation.
 
@@ -70,7 +41,7 @@ class APIReservation(APIObject, WithAircraftMixIn):
     training and certification (future functionality).
     """
 
-    __slots__ = ()
+    __slots__ = ('_registry',)
     _toptag = 'reservation'
 
     def __init__(self, reservation_name):
@@ -107,12 +78,12 @@ class APIReservation(APIObject, WithAircraftMixIn):
     @property
     def crew(self):
         """Set of usernames of crew members associated with this reservation"""
-        return _ResvCrewByNameSet(self.body)
+        return self._member_set(_ResvCrewByNameSet, "/reservation/crew")
 
     @property
     def crew_by_uuid(self):
         """Set of UUIDs of crew members associated with this reservation"""
-        return _ResvCrewByUUIDSet(self.body)
+        return self._member_set(_ResvCrewByUUIDSet, "/reservation/crew")
 
 APIReservation._add_simple_date_property('start', 'Start bound of reservation in UTC')
 APIReservation._add_simple_date_property('end', 'End bound of reservation in UTC')
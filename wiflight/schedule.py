@@ -0,0 +1,249 @@
+#!/usr/bin/python
+
+"""Local index of reservations by aircraft and time
+
+The server matches each flight with the best reservation of each
+domain for the same aircraft and time. ReservationIndex keeps
+reservations in one interval tree per aircraft so that the candidates
+for a flight, overlapping reservations, and the candidates for a whole
+batch of flights can be found locally, for example to check a batch of
+reservations before saving them or to understand why a flight matched
+a reservation.
+"""
+
+import datetime
+
+def _aircraft_key(obj):
+    """Tail number (upper case) of the aircraft of a flight or
+    reservation, or its ID if the tail number is not known"""
+    xml = obj.body.find('aircraft')
+    if xml is None:
+        return None
+    tail = xml.get('tail') or xml.findtext('tail')
+    if tail:
+        return tail.upper()
+    if xml.get('id') is not None:
+        return '#' + xml.get('id')
+    return None
+
+def _bounds(resv):
+    start = resv.start
+    end = resv.end
+    if start is None:
+        start = datetime.datetime.min
+    if end is None:
+        end = datetime.datetime.max
+    return start, end
+
+class _Node(object):
+    """Node of a centered interval tree over (start, end, item) tuples"""
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, intervals):
+        endpoints = sorted(
+            [i[0] for i in intervals] + [i[1] for i in intervals]
+        )
+        self.center = center = endpoints[len(endpoints) // 2]
+        here = []
+        left = []
+        right = []
+        for i in intervals:
+            if i[1] < center:
+                left.append(i)
+            elif i[0] > center:
+                right.append(i)
+            else:
+                here.append(i)
+        self.by_start = sorted(here, key=lambda i: i[0])
+        self.by_end = sorted(here, key=lambda i: i[1], reverse=True)
+        self.left = _Node(left) if left else None
+        self.right = _Node(right) if right else None
+
+    def query(self, start, end, out):
+        node = self
+        while node is not None:
+            if end < node.center:
+                for i in node.by_start:
+                    if i[0] > end:
+                        break
+                    out.append(i)
+                node = node.left
+            elif start > node.center:
+                for i in node.by_end:
+                    if i[1] < start:
+                        break
+                    out.append(i)
+                node = node.right
+            else:
+                out.extend(node.by_start)
+                if node.left is not None:
+                    node.left.query(start, end, out)
+                node = node.right
+
+class ReservationIndex(object):
+    """Reservations indexed by aircraft and time
+
+    Example:
+
+    index = wiflight.ReservationIndex(reservations)
+    for a, b in index.conflicts():
+        print "%s overlaps %s" % (a.name, b.name)
+    for flight, candidates in index.join(search, domain="dispatch"):
+        print flight.id, [r.name for r in candidates]
+
+    Aircraft are identified by tail number, so reservations should
+    give the tail number of their aircraft (as those returned by the
+    server and those created with APIAircraft("C-ABCD") do). Missing
+    start or end times are treated as unbounded.
+
+    Queries take O(log n + k) time for n reservations of the aircraft
+    and k results. The tree of an aircraft is rebuilt on the first
+    query after its reservations change.
+
+    The aircraft and time window of a reservation are recorded when it
+    is added; add it again after changing them.
+    """
+
+    def __init__(self, reservations=()):
+        self._by_name = {}
+        # Aircraft key of each reservation, by name, as when added
+        self._keys = {}
+        # (start, end, reservation) by name, by aircraft key
+        self._by_aircraft = {}
+        self._trees = {}
+        for resv in reservations:
+            self.add(resv)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self):
+        return self._by_name.itervalues()
+
+    def get(self, name):
+        """Return the reservation with this name, or None"""
+        return self._by_name.get(name)
+
+    def add(self, resv):
+        """Add a reservation, replacing one with the same name"""
+        self.remove(resv.name)
+        key = _aircraft_key(resv)
+        self._by_name[resv.name] = resv
+        self._keys[resv.name] = key
+        self._by_aircraft.setdefault(key, {})[resv.name] = _bounds(resv) + (resv,)
+        self._trees.pop(key, None)
+
+    def remove(self, name):
+        """Remove the reservation with this name, if any"""
+        resv = self._by_name.pop(name, None)
+        if resv is None:
+            return
+        key = self._keys.pop(name)
+        reservations = self._by_aircraft[key]
+        del reservations[name]
+        if not reservations:
+            del self._by_aircraft[key]
+        self._trees.pop(key, None)
+
+    def _tree(self, key):
+        tree = self._trees.get(key)
+        if tree is None:
+            reservations = self._by_aircraft.get(key)
+            if not reservations:
+                return None
+            tree = self._trees[key] = _Node(reservations.values())
+        return tree
+
+    def overlapping(self, start, end, aircraft=None, domain=None):
+        """Reservations whose time window overlaps [start, end]
+
+        :param aircraft: tail number of the aircraft, or None for all
+        aircraft
+        :param domain: if not None, only reservations in this domain
+
+        Returns a list of reservations in order of start time.
+        """
+        if aircraft is None:
+            keys = self._by_aircraft.keys()
+        else:
+            keys = [aircraft.upper()]
+        found = []
+        for key in keys:
+            tree = self._tree(key)
+            if tree is not None:
+                tree.query(start, end, found)
+        found.sort(key=lambda i: (i[0], i[2].name))
+        return [
+            i[2] for i in found if domain is None or i[2].domain == domain
+        ]
+
+    def at(self, t, aircraft=None, domain=None):
+        """Reservations whose time window contains the time t"""
+        return self.overlapping(t, t, aircraft, domain)
+
+    def for_flight(self, flight, domain=None):
+        """Reservations of the flight's aircraft overlapping the flight
+
+        Returns a list of reservations, those overlapping the flight the
+        longest first.
+        """
+        key = _aircraft_key(flight)
+        start = flight.start
+        if key is None or start is None:
+            return []
+        end = start
+        length = flight.length
+        if length is not None:
+            end = start + datetime.timedelta(seconds=float(length))
+        def overlap(i):
+            return min(i[1], end) - max(i[0], start)
+        out = []
+        tree = self._tree(key)
+        if tree is not None:
+            tree.query(start, end, out)
+        return [i[2] for i in sorted(
+            (i for i in out if domain is None or i[2].domain == domain),
+            key=lambda i: (-overlap(i).total_seconds(), i[0], i[2].name)
+        )]
+
+    def join(self, flights, domain=None):
+        """Candidate reservations for each of a batch of flights
+
+        Returns a list of (flight, reservations) as returned by
+        for_flight, in the order of flights.
+        """
+        return [
+            (flight, self.for_flight(flight, domain))
+            for flight in flights if flight is not None
+        ]
+
+    def check(self, resv):
+        """Reservations of the same domain and aircraft whose time
+        window overlaps that of resv (other than resv itself)"""
+        start, end = _bounds(resv)
+        key = _aircraft_key(resv)
+        out = []
+        tree = self._tree(key)
+        if tree is not None:
+            tree.query(start, end, out)
+        return [i[2] for i in sorted(
+            (i for i in out if i[2].name != resv.name and i[2].domain == resv.domain),
+            key=lambda i: (i[0], i[2].name)
+        )]
+
+    def conflicts(self):
+        """Pairs of reservations of the same domain and aircraft whose
+        time windows overlap, in order of start time"""
+        out = []
+        for key, reservations in self._by_aircraft.iteritems():
+            if key is None:
+                continue
+            active = []
+            for i in sorted(reservations.itervalues(), key=lambda i: (i[0], i[2].name)):
+                active = [a for a in active if a[1] >= i[0]]
+                for a in active:
+                    if a[2].domain == i[2].domain:
+                        out.append((a, i))
+                active.append(i)
+        out.sort(key=lambda p: (p[0][0], p[0][2].name, p[1][0], p[1][2].name))
+        return [(a[2], b[2]) for a, b in out]
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+"""Flight searches over long periods
+
+A single APIFlightSearch spanning months or years produces an enormous
+response or is refused by the server. FlightSearchExecutor cuts the
+period into time slices, searches them concurrently on several
+sessions, and streams the merged results in time order. The length of
+the slices adapts to the density of flights: slices that return too
+many results are split and subsequent slices are made shorter, and
+slices that return few results make subsequent slices longer.
+"""
+
+from wiflight.client import HTTPError
+from wiflight.flight import APIFlightSearch
+from wiflight.parallel import client_map
+import datetime
+import threading
+
+# Server response meaning that the query was too expensive
+_TOO_LARGE_CODE = 413
+# Server responses which may succeed if the same query is retried
+_RETRY_CODES = frozenset((500, 502, 503, 504))
+
+class FlightSearchExecutor(object):
+    """Run a flight search over a long period in adaptive time slices
+
+    Example:
+
+    executor = wiflight.FlightSearchExecutor(
+        [session1, session2, session3], group=['Training']
+    )
+    for flight in executor.run(
+        datetime.datetime(2013,1,1), datetime.datetime(2014,1,1)
+    ):
+        pass
+
+    Flights are yielded in order of start time and each flight is
+    yielded only once even if it is returned by several slices.
+    """
+
+    def __init__(
+        self, clients, slice_length=datetime.timedelta(days=1),
+        min_slice=datetime.timedelta(minutes=15),
+        max_slice=datetime.timedelta(days=31),
+        max_results=500, target_results=None, retries=2, **search_args
+    ):
+        """:param clients: sequence of sessions, used concurrently (see
+        wiflight.parallel.client_map)
+        :param slice_length: length of the first slices
+        :param min_slice: slices are never split below this length
+        :param max_slice: slices never grow beyond this length
+        :param max_results: a slice returning at least this many flights
+        is assumed to be truncated or too expensive, and is split
+        :param target_results: desired number of flights per slice;
+        defaults to a quarter of max_results
+        :param retries: number of times a slice is searched again,
+        without being split, after a server error (HTTP 5xx). A slice
+        is only split when the server refuses it with 413 (Request
+        Entity Too Large) or when it returns max_results flights.
+        :param search_args: other parameters for APIFlightSearch (kw,
+        events, group, missingaircraft)
+        """
+        self.clients = list(clients)
+        self.slice_length = slice_length
+        self.min_slice = min_slice
+        self.max_slice = max_slice
+        self.max_results = max_results
+        if target_results is None:
+            target_results = max(max_results // 4, 1)
+        self.target_results = target_results
+        self.retries = retries
+        for k in ('start', 'end', 'f'):
+            if k in search_args:
+                raise TypeError("%r cannot be used with FlightSearchExecutor" % (k,))
+        self.search_args = search_args
+        self.searches = 0
+        self.splits = 0
+        self._lock = threading.Lock()
+
+    def _slices(self, start, end):
+        s = start
+        while s < end:
+            e = min(s + self.slice_length, end)
+            yield s, e
+            s = e
+
+    def _search(self, client, bounds):
+        """Search one slice, splitting it as long as it is too large
+
+        Returns (flights, shortest slice length that was used).
+        """
+        start, end = bounds
+        with self._lock:
+            self.searches += 1
+        search = APIFlightSearch(start=start, end=end, **self.search_args)
+        splittable = end - start >= 2 * self.min_slice
+        attempt = 0
+        while True:
+            try:
+                search.load(client)
+            except HTTPError, e:
+                if e.code in _RETRY_CODES and attempt < self.retries:
+                    attempt += 1
+                    with self._lock:
+                        self.searches += 1
+                    continue
+                if not splittable or e.code != _TOO_LARGE_CODE:
+                    raise
+                too_large = True
+            else:
+                flights = [f for f in search if f is not None]
+                too_large = splittable and len(flights) >= self.max_results
+            break
+        if not too_large:
+            return flights, end - start
+        with self._lock:
+            self.splits += 1
+        middle = start + (end - start) // 2
+        first, first_len = self._search(client, (start, middle))
+        second, second_len = self._search(client, (middle, end))
+        return first + second, min(first_len, second_len)
+
+    def _adapt(self, count, used, requested):
+        if used < requested:
+            # The slice had to be split; use what worked from now on
+            self.slice_length = max(used, self.min_slice)
+        elif count < self.target_results // 2:
+            self.slice_length = min(self.slice_length * 2, self.max_slice)
+        elif count > self.target_results * 2:
+            self.slice_length = max(self.slice_length // 2, self.min_slice)
+
+    def run(self, start, end):
+        """Search for flights between start and end (UTC datetimes)
+
+        Returns an iterator over APIFlight objects.
+        """
+        seen = set()
+        slices = self._slices(start, end)
+        for bounds, (flights, used) in client_map(
+            self.clients, lambda client, b: (b, self._search(client, b)), slices
+        ):
+            self._adapt(len(flights), used, bounds[1] - bounds[0])
+            flights.sort(key=lambda f: (f.start is None, f.start, f.id))
+            for flight in flights:
+                if flight.id in seen:
+                    continue
+                seen.add(flight.id)
+                yield flight
@@ -0,0 +1,332 @@
+#!/usr/bin/python
+
+"""Local geographic index over the tracks of many flights
+
+The index does not keep the track points themselves. Each track is cut
+into short windows and only the bounding box, time span and lowest AGL
+altitude of each window are recorded, in a grid of cells of fixed size
+in degrees. Queries are answered from those summaries, so a result
+means that the flight was possibly (and, with small windows, very
+probably) inside the area during the returned time range.
+
+Indexes can be pickled to keep them between runs.
+"""
+
+import datetime
+import math
+
+class _Window(object):
+    __slots__ = (
+        'flight_id', 'start', 'end',
+        'lat_min', 'lat_max', 'lon_min', 'lon_max', 'agl_min'
+    )
+
+    def __init__(self, flight_id, start, end, lat_min, lat_max, lon_min, lon_max, agl_min):
+        self.flight_id = flight_id
+        self.start = start
+        self.end = end
+        self.lat_min = lat_min
+        self.lat_max = lat_max
+        self.lon_min = lon_min
+        self.lon_max = lon_max
+        self.agl_min = agl_min
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+    def lon_parts(self):
+        """Longitude ranges of the box within [-180, 180]
+
+        Longitudes along a track are kept continuous, so the box of a
+        window which crosses the antimeridian extends beyond 180 or
+        -180; it is split into two ranges here.
+        """
+        lon_min = self.lon_min
+        lon_max = self.lon_max
+        if lon_max - lon_min >= 360.0:
+            return [(-180.0, 180.0)]
+        shift = 360.0 * math.floor((lon_min + 180.0) / 360.0)
+        lon_min -= shift
+        lon_max -= shift
+        if lon_max > 180.0:
+            return [(lon_min, 180.0), (-180.0, lon_max - 360.0)]
+        return [(lon_min, lon_max)]
+
+def _point_in_polygon(lat, lon, polygon):
+    inside = False
+    n = len(polygon)
+    for i in xrange(n):
+        lat1, lon1 = polygon[i - 1]
+        lat2, lon2 = polygon[i]
+        if (lat1 > lat) != (lat2 > lat):
+            x = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+            if lon < x:
+                inside = not inside
+    return inside
+
+def _segments_cross(a, b, c, d):
+    def orient(p, q, r):
+        v = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+        return (v > 0) - (v < 0)
+    o1 = orient(a, b, c)
+    o2 = orient(a, b, d)
+    o3 = orient(c, d, a)
+    o4 = orient(c, d, b)
+    return o1 != o2 and o3 != o4
+
+def _box_meets_polygon(lat_min, lat_max, lon_min, lon_max, polygon):
+    corners = [
+        (lat_min, lon_min), (lat_min, lon_max),
+        (lat_max, lon_max), (lat_max, lon_min)
+    ]
+    for lat, lon in corners:
+        if _point_in_polygon(lat, lon, polygon):
+            return True
+    for lat, lon in polygon:
+        if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max:
+            return True
+    for i in xrange(len(polygon)):
+        for j in xrange(4):
+            if _segments_cross(polygon[i - 1], polygon[i], corners[j - 1], corners[j]):
+                return True
+    return False
+
+class TrackSpatialIndex(object):
+    """Index of where and when flights went
+
+    Example:
+
+    index = wiflight.TrackSpatialIndex()
+    for flight in search:
+        index.add_track(
+            flight.id, flight.start, flight.iter_track(client)
+        )
+    # Flights below 500 ft AGL inside a box during June 2014
+    hits = index.query_box(
+        41.0, -74.5, 41.5, -73.5,
+        start=datetime.datetime(2014,6,1), end=datetime.datetime(2014,7,1),
+        max_agl=152.4
+    )
+    for flight_id, ranges in hits.iteritems():
+        pass
+    """
+
+    def __init__(self, cell_size=0.1, window=30):
+        """:param cell_size: size of grid cells in degrees
+        :param window: maximum length in seconds of track covered
+        by each indexed bounding box. Smaller windows make results
+        more precise and the index larger.
+        """
+        self.cell_size = float(cell_size)
+        self.window = window
+        self.windows = []
+        self.cells = {}
+        # Range of occupied cells: [lat_lo, lat_hi, lon_lo, lon_hi]
+        self.occupied = None
+
+    def __len__(self):
+        """Number of indexed track windows"""
+        return len(self.windows)
+
+    def _cell_range(self, lat_min, lat_max, lon_min, lon_max):
+        size = self.cell_size
+        return (
+            int(math.floor(lat_min / size)), int(math.floor(lat_max / size)),
+            int(math.floor(lon_min / size)), int(math.floor(lon_max / size)),
+        )
+
+    def _insert(self, w):
+        idx = len(self.windows)
+        self.windows.append(w)
+        for lon_min, lon_max in w.lon_parts():
+            i0, i1, j0, j1 = self._cell_range(w.lat_min, w.lat_max, lon_min, lon_max)
+            for i in xrange(i0, i1 + 1):
+                for j in xrange(j0, j1 + 1):
+                    self.cells.setdefault((i, j), []).append(idx)
+            occupied = self.occupied
+            if occupied is None:
+                self.occupied = [i0, i1, j0, j1]
+            else:
+                occupied[0] = min(occupied[0], i0)
+                occupied[1] = max(occupied[1], i1)
+                occupied[2] = min(occupied[2], j0)
+                occupied[3] = max(occupied[3], j1)
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        """Indices of the windows in the cells meeting a box (with
+        repeats), or of all windows if that is fewer to check"""
+        if self.occupied is None:
+            return ()
+        i0, i1, j0, j1 = self._cell_range(lat_min, lat_max, lon_min, lon_max)
+        # Only look at occupied cells
+        lat_lo, lat_hi, lon_lo, lon_hi = self.occupied
+        i0 = max(i0, lat_lo)
+        i1 = min(i1, lat_hi)
+        j0 = max(j0, lon_lo)
+        j1 = min(j1, lon_hi)
+        if i1 < i0 or j1 < j0:
+            return ()
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.windows):
+            return xrange(len(self.windows))
+        cells = self.cells
+        return (
+            idx
+            for i in xrange(i0, i1 + 1)
+            for j in xrange(j0, j1 + 1)
+            for idx in cells.get((i, j), ())
+        )
+
+    def add_track(self, flight_id, start, points):
+        """Index the track of a flight
+
+        :param flight_id: identifier returned by queries (normally
+        APIFlight.id)
+        :param start: start of the flight in UTC (APIFlight.start)
+        :param points: iterable of APIFlightTrackPoint in time order,
+        such as APIFlight.iter_track(client). Points without a position
+        are ignored.
+
+        Any windows previously indexed for the same flight are kept,
+        so each flight should be added only once (see remove_flight).
+        """
+        current = None
+        last = None
+        for p in points:
+            t, agl, lat, lon = p[0], p[1], p[6], p[7]
+            if t is None or lat is None or lon is None:
+                continue
+            t = float(t)
+            lat = float(lat)
+            lon = float(lon)
+            agl = float(agl) if agl is not None else None
+            if last is not None:
+                # Keep longitude continuous across the antimeridian
+                lon += 360.0 * round((last[2] - lon) / 360.0)
+            if current is not None and t - current[0] > self.window:
+                self._close_window(flight_id, start, current)
+                # Consecutive windows share a point so there is no gap
+                lt, llat, llon, lagl = last
+                current = [lt, lt, llat, llat, llon, llon, lagl]
+            if current is None:
+                current = [t, t, lat, lat, lon, lon, agl]
+            else:
+                current[1] = t
+                current[2] = min(current[2], lat)
+                current[3] = max(current[3], lat)
+                current[4] = min(current[4], lon)
+                current[5] = max(current[5], lon)
+                if agl is not None and (current[6] is None or agl < current[6]):
+                    current[6] = agl
+            last = (t, lat, lon, agl)
+        if current is not None:
+            self._close_window(flight_id, start, current)
+
+    def _close_window(self, flight_id, start, current):
+        t0, t1, lat_min, lat_max, lon_min, lon_max, agl_min = current
+        self._insert(_Window(
+            flight_id,
+            start + datetime.timedelta(seconds=t0),
+            start + datetime.timedelta(seconds=t1),
+            lat_min, lat_max, lon_min, lon_max, agl_min
+        ))
+
+    def remove_flight(self, flight_id):
+        """Remove all indexed windows of a flight"""
+        windows = self.windows
+        self.windows = []
+        self.cells = {}
+        self.occupied = None
+        for w in windows:
+            if w.flight_id != flight_id:
+                self._insert(w)
+
+    @property
+    def flight_ids(self):
+        """Set of identifiers of indexed flights"""
+        return set(w.flight_id for w in self.windows)
+
+    def _query(self, boxes, start, end, max_agl, accept):
+        """Find the windows meeting any of boxes, a list of (lat_min,
+        lat_max, lon_min, lon_max), for which accept(w, lon_min,
+        lon_max) is true for a part of the window's box"""
+        seen = set()
+        hits = {}
+        for lat_min, lat_max, lon_min, lon_max in boxes:
+            for idx in self._candidates(lat_min, lat_max, lon_min, lon_max):
+                if idx in seen:
+                    continue
+                w = self.windows[idx]
+                if w.lat_max < lat_min or w.lat_min > lat_max:
+                    continue
+                if start is not None and w.end < start:
+                    continue
+                if end is not None and w.start > end:
+                    continue
+                if max_agl is not None and (w.agl_min is None or w.agl_min > max_agl):
+                    continue
+                for lo, hi in w.lon_parts():
+                    if hi >= lon_min and lo <= lon_max and accept(w, lo, hi):
+                        break
+                else:
+                    continue
+                seen.add(idx)
+                hits.setdefault(w.flight_id, []).append((w.start, w.end))
+        for flight_id, ranges in hits.iteritems():
+            ranges.sort()
+            merged = [ranges[0]]
+            for r in ranges[1:]:
+                if r[0] <= merged[-1][1]:
+                    if r[1] > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], r[1])
+                else:
+                    merged.append(r)
+            hits[flight_id] = merged
+        return hits
+
+    def query_box(self, lat_min, lon_min, lat_max, lon_max, start=None, end=None, max_agl=None):
+        """Find flights that went through a box
+
+        :param start: if given, only consider track after this UTC time
+        :param end: if given, only consider track before this UTC time
+        :param max_agl: if given, only consider track at or below
+        this height above ground in metres
+
+        Returns a dictionary mapping flight identifiers to sorted lists
+        of (start, end) UTC time ranges during which the flight may
+        have been inside the box.
+
+        If lon_min is greater than lon_max, the box crosses the
+        antimeridian.
+        """
+        if lon_min > lon_max:
+            boxes = [
+                (lat_min, lat_max, lon_min, 180.0),
+                (lat_min, lat_max, -180.0, lon_max),
+            ]
+        else:
+            boxes = [(lat_min, lat_max, lon_min, lon_max)]
+        return self._query(boxes, start, end, max_agl, lambda w, lo, hi: True)
+
+    def query_polygon(self, polygon, start=None, end=None, max_agl=None):
+        """Find flights that went through a polygon
+
+        :param polygon: sequence of (lat, lon) vertices. The polygon
+        is closed implicitly.
+
+        Other parameters and return value are as for query_box.
+        """
+        polygon = [(float(lat), float(lon)) for lat, lon in polygon]
+        if len(polygon) < 3:
+            raise ValueError("A polygon needs at least 3 vertices")
+        lats = [v[0] for v in polygon]
+        lons = [v[1] for v in polygon]
+        return self._query(
+            [(min(lats), max(lats), min(lons), max(lons))], start, end, max_agl,
+            lambda w, lo, hi: _box_meets_polygon(
+                w.lat_min, w.lat_max, lo, hi, polygon
+            )
+        )
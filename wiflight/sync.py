@@ -0,0 +1,196 @@
+#!/usr/bin/python
+
+"""Incremental synchronization of new and changed flights
+
+Systems that need to see every flight (for example a maintenance
+system adding up engine time) would otherwise have to search a wide
+trailing window over and over. FlightSync remembers, in a small SQLite
+database, the latest flight start time it has seen (the watermark) and
+a fingerprint of each recent flight, so that each poll only searches
+from shortly before the watermark and reports only what is new or has
+changed.
+"""
+
+from wiflight.client import HTTPError
+from wiflight.object import _encode_iso8601, _decode_iso8601
+from wiflight.flight import APIFlight, APIFlightSearch
+import lxml.etree
+import datetime
+import hashlib
+import sqlite3
+
+class FlightSync(object):
+    """Report new and changed flights since the previous poll
+
+    Example:
+
+    def handle(flight, is_new):
+        record_flight_times(flight.id, flight.engine_ontime)
+    sync = wiflight.FlightSync("flights.sqlite")
+    while True:
+        sync.poll(client, handle)
+        time.sleep(300)
+
+    Flights are uploaded by the recorders some time after they start,
+    so each search starts overlap before the watermark. Flights in
+    that overlap which have already been reported are recognized by
+    their identifier and fingerprint and are not reported again unless
+    they changed (for example because a reservation matched them).
+    As long as the watermark does not move, each poll repeats the same
+    search conditionally on the ETag of the previous result, so a poll
+    in a quiet period only costs a 304 (Not Modified) response.
+
+    The callback may raise an exception, in which case nothing from
+    that poll is recorded and the same flights are reported again by
+    the next poll.
+    """
+
+    def __init__(
+        self, path, overlap=datetime.timedelta(hours=6), initial_start=None,
+        kw=None, group=[], missingaircraft=False, events=None, load_flights=False
+    ):
+        """:param path: SQLite database file (created if needed)
+        :param overlap: how far before the watermark each search starts
+        :param initial_start: start of the first search, when there is
+        no watermark yet. Defaults to overlap before the first poll.
+        :param kw, group, missingaircraft, events: passed on to
+        APIFlightSearch to restrict which flights are synchronized
+        :param load_flights: if True, each new or changed flight is
+        loaded individually before being passed to the callback, so
+        that it has its complete contents and its ETag
+        """
+        self.db = sqlite3.connect(path)
+        self.overlap = overlap
+        self.initial_start = initial_start
+        self.search_args = {
+            'kw': kw, 'group': group, 'missingaircraft': missingaircraft,
+            'events': events
+        }
+        self.load_flights = load_flights
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "id INTEGER PRIMARY KEY, start TEXT, digest TEXT, etag TEXT)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS flights_start ON flights (start)"
+            )
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _set_meta(self, key, value):
+        if value is None:
+            self.db.execute("DELETE FROM meta WHERE key = ?", (key,))
+        else:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, value)
+            )
+
+    @property
+    def watermark(self):
+        """Latest start time of any flight seen, or None"""
+        value = self._meta('watermark')
+        if value is None:
+            return None
+        return _decode_iso8601(value)
+
+    def known(self, flight_id):
+        """Return (digest, etag) recorded for a flight, or None"""
+        row = self.db.execute(
+            "SELECT digest, etag FROM flights WHERE id = ?", (flight_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return tuple(row)
+
+    @staticmethod
+    def digest(flight):
+        """Fingerprint of the contents of a flight as returned by a search"""
+        return hashlib.sha1(
+            lxml.etree.tostring(flight.body, method='c14n')
+        ).hexdigest()
+
+    def poll(self, client, callback, now=None):
+        """Search for new and changed flights and report them
+
+        :param callback: called as callback(flight, is_new) for each
+        new or changed APIFlight, in order of start time
+
+        Returns the number of flights reported.
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        watermark = self.watermark
+        if watermark is not None:
+            start = watermark - self.overlap
+        elif self.initial_start is not None:
+            start = self.initial_start
+        else:
+            start = now - self.overlap
+        search = APIFlightSearch(start=start, **self.search_args)
+        previous = None
+        if self._meta('search_url') == search.url:
+            previous = self._meta('search_etag')
+        if previous is None:
+            content_type, search_etag, body = client.request(search.url, "GET")
+        else:
+            try:
+                content_type, search_etag, body = client.request(
+                    search.url, "GET", if_none_match=previous
+                )
+            except HTTPError, e:
+                if e.code == 304:
+                    return 0
+                raise
+        search._set_response(content_type, search_etag, body)
+        flights = [f for f in search if f is not None]
+        flights.sort(key=lambda f: (f.start is None, f.start, f.id))
+        reported = 0
+        with self.db:
+            for flight in flights:
+                digest = self.digest(flight)
+                known = self.known(flight.id)
+                if known is not None and known[0] == digest:
+                    continue
+                etag = None
+                if self.load_flights:
+                    full = APIFlight(flight.id)
+                    full.load(client)
+                    etag = full.etag
+                    flight = full
+                callback(flight, known is None)
+                reported += 1
+                flight_start = flight.start
+                self.db.execute(
+                    "INSERT OR REPLACE INTO flights (id, start, digest, etag) "
+                    "VALUES (?, ?, ?, ?)", (
+                        flight.id,
+                        None if flight_start is None else _encode_iso8601(flight_start),
+                        digest, etag
+                    )
+                )
+                if flight_start is not None and (watermark is None or flight_start > watermark):
+                    watermark = flight_start
+            self._set_meta('search_url', search.url)
+            self._set_meta('search_etag', search_etag)
+            if watermark is not None:
+                self._set_meta('watermark', _encode_iso8601(watermark))
+                # Flights well before the next search cannot show up again
+                self.db.execute(
+                    "DELETE FROM flights WHERE start < ?",
+                    (_encode_iso8601(watermark - 2 * self.overlap),)
+                )
+        return reported
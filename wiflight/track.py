@@ -0,0 +1,468 @@
+#!/usr/bin/python
+
+"""Tools for working with downloaded flight track data
+
+The server returns track data as a list of APIFlightTrackPoint tuples
+whose fields are decimal.Decimal. That is convenient for exact
+reproduction of what the server sent but slow for numerical work.
+The tools in this module keep tracks as columns of floats instead.
+"""
+
+from wiflight.flight import APIFlightTrackPoint
+import array
+import bisect
+import heapq
+import math
+
+# Same order as the fields of APIFlightTrackPoint
+CHANNELS = ('t', 'agl', 'alt', 'az', 'gs', 'head', 'lat', 'lon', 'rpm', 'vs')
+
+_NAN = float('nan')
+_TWO_PI = 2.0 * math.pi
+
+def _to_float(v):
+    if v is None:
+        return _NAN
+    return float(v)
+
+def _from_float(v):
+    if v != v:
+        return None
+    return v
+
+def _numpy():
+    """Return the numpy module, or None if it is not installed"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _interpolate(xs, ys, times, circular):
+    """TrackIndex.interpolate in pure Python"""
+    n = len(xs)
+    out = array.array('d')
+    if n == 0:
+        out.extend(_NAN for t in times)
+        return out
+    first = xs[0]
+    last = xs[-1]
+    lo = 0
+    prev = None
+    for t in times:
+        t = float(t)
+        if not first <= t <= last:
+            out.append(_NAN)
+            continue
+        # Requests are usually sorted so the previous position
+        # is a good lower bound for the search.
+        if prev is None or t < prev:
+            lo = 0
+        prev = t
+        idx = bisect.bisect_left(xs, t, lo)
+        lo = idx
+        if xs[idx] == t:
+            out.append(ys[idx])
+            continue
+        x0 = xs[idx - 1]
+        x1 = xs[idx]
+        y0 = ys[idx - 1]
+        y1 = ys[idx]
+        frac = (t - x0) / (x1 - x0)
+        if circular:
+            delta = (y1 - y0 + math.pi) % _TWO_PI - math.pi
+            out.append((y0 + frac * delta) % _TWO_PI)
+        else:
+            out.append(y0 + frac * (y1 - y0))
+    return out
+
+def _interpolate_numpy(numpy, xs, ys, times, circular):
+    """TrackIndex.interpolate on whole arrays at once"""
+    t = numpy.array(times, dtype=numpy.float64).reshape(-1)
+    out = numpy.empty(len(t))
+    out.fill(_NAN)
+    if len(xs):
+        x = numpy.frombuffer(xs, dtype=numpy.float64)
+        y = numpy.frombuffer(ys, dtype=numpy.float64)
+        with numpy.errstate(invalid='ignore'):
+            inside = (t >= x[0]) & (t <= x[-1])
+        t = t[inside]
+        idx = numpy.searchsorted(x, t)
+        exact = x[idx] == t
+        # For exact hits, any interval will do: the result is y[idx]
+        i1 = numpy.where(exact, numpy.maximum(idx, 1), idx)
+        i1 = numpy.minimum(i1, len(x) - 1)
+        i0 = numpy.maximum(i1 - 1, 0)
+        x0 = x[i0]
+        y0 = y[i0]
+        span = x[i1] - x0
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            frac = (t - x0) / span
+            if circular:
+                delta = numpy.mod(y[i1] - y0 + math.pi, _TWO_PI) - math.pi
+                r = numpy.mod(y0 + frac * delta, _TWO_PI)
+            else:
+                r = y0 + frac * (y[i1] - y0)
+        out[inside] = numpy.where(exact, y[idx], r)
+    result = array.array('d')
+    result.fromstring(out.tostring())
+    return result
+
+class TrackIndex(object):
+    """Time-indexed, column-oriented flight track
+
+    Example:
+
+    track = wiflight.APIFlight(12345).track(0, 600)
+    track.load(client)
+    index = wiflight.track.TrackIndex(track)
+    point = index.at(42.5)
+    one_hz = index.resample(1.0)
+
+    Each channel (see CHANNELS) is stored as an array of floats sorted
+    by time. Missing values are stored as NaN and are returned as None
+    in points. Points can be added in chunks (for example one chunk
+    per downloaded track window) with extend.
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, points=()):
+        """Build a new index
+
+        :param points: iterable of APIFlightTrackPoint (an APIFlightTrack
+        after it has been loaded is suitable)
+        """
+        self.columns = dict((c, array.array('d')) for c in CHANNELS)
+        self.extend(points)
+
+    @classmethod
+    def load(cls, client, flight, window=600):
+        """Download the whole track of a flight into a new index
+
+        :param flight: an APIFlight
+        :param window: length in seconds of each track query
+
+        See APIFlight.iter_track.
+        """
+        index = cls()
+        for chunk in flight.iter_track(client, window=window, chunks=True):
+            index.extend(chunk)
+        return index
+
+    def extend(self, points):
+        """Add more points to the index
+
+        Points are normally added in time order, in which case this is
+        a simple append. Otherwise the whole index is re-sorted.
+        """
+        columns = [self.columns[c] for c in CHANNELS]
+        times = columns[0]
+        in_order = True
+        for point in points:
+            t = _to_float(point[0])
+            if t != t:
+                # A point without a timestamp cannot be indexed
+                continue
+            if times and t < times[-1]:
+                in_order = False
+            for col, v in zip(columns, point):
+                col.append(_to_float(v))
+        if not in_order:
+            self._sort()
+
+    def __getstate__(self):
+        return self.columns
+
+    def __setstate__(self, state):
+        self.columns = state
+
+    def _sort(self):
+        times = self.columns['t']
+        order = sorted(xrange(len(times)), key=times.__getitem__)
+        for c in CHANNELS:
+            col = self.columns[c]
+            self.columns[c] = array.array('d', (col[i] for i in order))
+
+    def __len__(self):
+        return len(self.columns['t'])
+
+    @property
+    def times(self):
+        """Array of timestamps in seconds since beginning of flight"""
+        return self.columns['t']
+
+    def point(self, idx):
+        """Return the idx'th point as an APIFlightTrackPoint of floats"""
+        return APIFlightTrackPoint(
+            _from_float(self.columns[c][idx]) for c in CHANNELS
+        )
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self.point(idx)
+
+    def nearest_index(self, t):
+        """Index of the point whose timestamp is closest to t
+
+        Returns None if the index is empty. Runs in O(log n).
+        """
+        times = self.columns['t']
+        n = len(times)
+        if n == 0:
+            return None
+        idx = bisect.bisect_left(times, t)
+        if idx == 0:
+            return 0
+        if idx == n:
+            return n - 1
+        if t - times[idx - 1] <= times[idx] - t:
+            return idx - 1
+        return idx
+
+    def nearest(self, t):
+        """Point whose timestamp is closest to t, or None if empty"""
+        idx = self.nearest_index(t)
+        if idx is None:
+            return None
+        return self.point(idx)
+
+    def interpolate(self, channel, times):
+        """Linearly interpolate a channel at arbitrary timestamps
+
+        :param channel: name of a channel (see CHANNELS)
+        :param times: sequence of timestamps in seconds since beginning
+        of flight. They need not be sorted but sorted input is faster.
+
+        Returns an array of floats, one per requested timestamp. The
+        result is NaN outside of the time span of the track or where
+        a neighbouring value is missing. The 'head' channel is
+        interpolated along the shortest arc so that it wraps around
+        correctly between 2*pi and 0.
+
+        The interpolation is done on whole arrays with numpy if it is
+        installed, and point by point otherwise.
+        """
+        if channel not in self.columns:
+            raise KeyError(channel)
+        numpy = _numpy()
+        if numpy is None:
+            return _interpolate(
+                self.columns['t'], self.columns[channel], times, channel == 'head'
+            )
+        return _interpolate_numpy(
+            numpy, self.columns['t'], self.columns[channel], times, channel == 'head'
+        )
+
+    def at(self, t):
+        """Interpolated state of the aircraft at time t
+
+        Returns an APIFlightTrackPoint of floats, or None if t is
+        outside of the time span of the track.
+        """
+        times = self.columns['t']
+        if not times or t < times[0] or t > times[-1]:
+            return None
+        return APIFlightTrackPoint(
+            _from_float(self.interpolate(c, (t,))[0]) for c in CHANNELS
+        )
+
+    def resample(self, rate=1.0, start=None, end=None):
+        """Resample the whole track at a fixed rate
+
+        :param rate: number of samples per second
+        :param start: first timestamp; defaults to the first whole
+        multiple of the sampling period inside the track
+        :param end: last timestamp (inclusive); defaults to the end
+        of the track
+
+        Returns a new TrackIndex.
+        """
+        result = TrackIndex()
+        times = self.columns['t']
+        if not times:
+            return result
+        period = 1.0 / rate
+        if start is None:
+            start = math.ceil(times[0] / period) * period
+        if end is None:
+            end = times[-1]
+        count = int(math.floor((end - start) / period + 1e-9)) + 1
+        grid = array.array('d', (start + i * period for i in xrange(max(count, 0))))
+        for c in CHANNELS:
+            if c == 't':
+                result.columns[c] = grid
+            else:
+                result.columns[c] = self.interpolate(c, grid)
+        return result
+
+_EARTH_RADIUS = 6371008.8
+
+def _project(points):
+    """Project points onto a local flat x/y/z frame in metres
+
+    An equirectangular projection around the first point is precise
+    enough for the extent of a single flight. A missing altitude is
+    taken to be the last known one (the first known one before that)
+    so that gaps do not look like climbs and descents.
+    """
+    lat0 = math.radians(float(points[0][6]))
+    kx = _EARTH_RADIUS * math.cos(lat0) * math.pi / 180.0
+    ky = _EARTH_RADIUS * math.pi / 180.0
+    alt = next((p[2] for p in points if p[2] is not None), 0)
+    xyz = []
+    for p in points:
+        if p[2] is not None:
+            alt = p[2]
+        xyz.append((float(p[7]) * kx, float(p[6]) * ky, float(alt)))
+    return xyz
+
+def _farthest(xyz, first, last):
+    """Find the point farthest from the segment between first and last
+
+    Returns a tuple (distance, index).
+    """
+    ax, ay, az = xyz[first]
+    bx, by, bz = xyz[last]
+    dx = bx - ax
+    dy = by - ay
+    dz = bz - az
+    seglen2 = dx * dx + dy * dy + dz * dz
+    best = -1.0
+    best_idx = None
+    for idx in xrange(first + 1, last):
+        px, py, pz = xyz[idx]
+        if seglen2 > 0.0:
+            u = ((px - ax) * dx + (py - ay) * dy + (pz - az) * dz) / seglen2
+            if u < 0.0:
+                u = 0.0
+            elif u > 1.0:
+                u = 1.0
+        else:
+            u = 0.0
+        ex = px - ax - u * dx
+        ey = py - ay - u * dy
+        ez = pz - az - u * dz
+        d2 = ex * ex + ey * ey + ez * ez
+        if d2 > best:
+            best = d2
+            best_idx = idx
+    return math.sqrt(best), best_idx
+
+def _simplify_indices(xyz, tolerance, max_points):
+    n = len(xyz)
+    if n <= 2:
+        return range(n)
+    keep = set((0, n - 1))
+    # Splitting the segment with the largest error first gives the
+    # same result as classic recursive Douglas-Peucker when only a
+    # tolerance is given, and the best greedy result under a budget.
+    heap = []
+    dist, idx = _farthest(xyz, 0, n - 1)
+    if idx is not None:
+        heap.append((-dist, 0, n - 1, idx))
+    while heap:
+        if max_points is not None and len(keep) >= max_points:
+            break
+        negdist, first, last, idx = heapq.heappop(heap)
+        if tolerance is not None and -negdist <= tolerance:
+            break
+        keep.add(idx)
+        for a, b in ((first, idx), (idx, last)):
+            if b - a > 1:
+                dist, sub = _farthest(xyz, a, b)
+                heapq.heappush(heap, (-dist, a, b, sub))
+    return sorted(keep)
+
+def _positioned(points):
+    return [p for p in points if p[6] is not None and p[7] is not None]
+
+def simplify(points, tolerance=None, max_points=None):
+    """Simplify a track with the Douglas-Peucker algorithm in 3D
+
+    :param points: sequence of APIFlightTrackPoint (for example a loaded
+    APIFlightTrack or a TrackIndex)
+    :param tolerance: maximum distance in metres (taking latitude,
+    longitude and altitude into account) between the original track
+    and the simplified track
+    :param max_points: maximum number of points to return. The points
+    that reduce the error the most are retained.
+
+    At least one of tolerance and max_points must be given. If both
+    are given, simplification stops as soon as either limit is reached.
+
+    Returns a list of the retained points in their original order.
+    Points without a position are dropped. The first and last points
+    are always retained.
+    """
+    if tolerance is None and max_points is None:
+        raise ValueError("tolerance or max_points is required")
+    if max_points is not None and max_points < 2:
+        raise ValueError("max_points must be at least 2")
+    points = _positioned(points)
+    if not points:
+        return []
+    indices = _simplify_indices(_project(points), tolerance, max_points)
+    return [points[i] for i in indices]
+
+class TrackSimplifier(object):
+    """Douglas-Peucker simplification of a track arriving in chunks
+
+    Example:
+
+    simplifier = wiflight.track.TrackSimplifier(tolerance=10.0)
+    for chunk in chunks:
+        for point in simplifier.feed(chunk):
+            output(point)
+    for point in simplifier.flush():
+        output(point)
+
+    Points are retained under the same criterion as simplify with a
+    tolerance, applied to the points seen so far, so the result is
+    close to but not always the same as simplifying the whole track at
+    once: a point retained when a chunk is processed stays retained
+    even if the rest of the track would have made it unnecessary.
+    The end of each chunk is not retained unconditionally:
+    the tail of the track after the last certain point is carried over
+    into the next chunk, up to max_pending points. That tail is only
+    simplified again once it has doubled in length, so that a long leg
+    without any retained point is not reprocessed for every chunk.
+    """
+    __slots__ = ('tolerance', 'max_pending', 'pending', '_checked')
+
+    def __init__(self, tolerance, max_pending=10000):
+        self.tolerance = tolerance
+        self.max_pending = max_pending
+        self.pending = []
+        # Number of pending points already simplified without result
+        self._checked = 0
+
+    def feed(self, points):
+        """Add a chunk of points and return the points now known to be retained"""
+        self.pending.extend(_positioned(points))
+        pending = self.pending
+        if len(pending) < 3:
+            return []
+        if len(pending) < 2 * self._checked and len(pending) <= self.max_pending:
+            return []
+        indices = _simplify_indices(_project(pending), self.tolerance, None)
+        # Everything up to the second last retained point is final.
+        # The last segment can still change when more points arrive,
+        # unless it has grown too long to keep in memory.
+        if len(pending) - indices[-2] > self.max_pending:
+            cut = indices[-1]
+        else:
+            cut = indices[-2]
+        out = [pending[i] for i in indices if i < cut]
+        self.pending = pending[cut:]
+        self._checked = len(self.pending)
+        return out
+
+    def flush(self):
+        """Return the remaining retained points at the end of the track"""
+        pending = self.pending
+        self.pending = []
+        self._checked = 0
+        if not pending:
+            return []
+        indices = _simplify_indices(_project(pending), self.tolerance, None)
+        return [pending[i] for i in indices]
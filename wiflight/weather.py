@@ -0,0 +1,177 @@
+#!/usr/bin/python
+
+"""Weather reported along a flight
+
+Flight documents contain a series of <weather> elements, each giving
+the time (in seconds since the beginning of the flight) from which it
+applies, the wind at that time, and the METAR it was derived from. The
+same few METARs usually repeat many times as the aircraft moves between
+stations, so WeatherTimeline stores each distinct METAR text only once.
+"""
+
+import array
+import bisect
+
+def APIWeatherObservation():
+    attributes = [
+        ('t', 'Time in seconds since beginning of flight from which this applies'),
+        ('windeast', 'Eastward component of the wind in m/s'),
+        ('windnorth', 'Northward component of the wind in m/s'),
+        ('metar', 'Text of the METAR report this observation is based on'),
+    ]
+    d = { '__slots__': () }
+    def _tuple_accessor(idx, doc):
+        return property(lambda self: self[idx], doc=doc)
+    for n, tpa in enumerate(attributes):
+        d[tpa[0]] = _tuple_accessor(n, tpa[1])
+    d['_fields'] = tuple(x[0] for x in attributes)
+    return type('APIWeatherObservation', (tuple,), d)
+APIWeatherObservation = APIWeatherObservation()
+
+_NAN = float('nan')
+
+def _to_float(v):
+    if v is None:
+        return _NAN
+    return float(v)
+
+def _from_float(v):
+    if v != v:
+        return None
+    return v
+
+class WeatherTimeline(object):
+    """Time-sorted weather observations of a flight
+
+    Observations are stored in arrays. An observation without wind or
+    METAR (the server sends these when no nearby report is available)
+    has None for those fields.
+
+    Example:
+
+    flight.load(client)
+    obs = flight.weather.at(1800.0)
+    east, north = flight.weather.interpolate_wind(index.times)
+    """
+    __slots__ = ('times', 'windeast', 'windnorth', 'metar_ids', 'metars')
+
+    def __init__(self, observations=()):
+        """:param observations: iterable of APIWeatherObservation"""
+        self.times = array.array('d')
+        self.windeast = array.array('d')
+        self.windnorth = array.array('d')
+        self.metar_ids = array.array('i')
+        self.metars = []
+        metar_ids = {}
+        for obs in sorted(observations, key=lambda o: o.t):
+            self.times.append(float(obs.t))
+            self.windeast.append(_to_float(obs.windeast))
+            self.windnorth.append(_to_float(obs.windnorth))
+            metar = obs.metar
+            if metar is None:
+                self.metar_ids.append(-1)
+            else:
+                mid = metar_ids.get(metar)
+                if mid is None:
+                    mid = metar_ids[metar] = len(self.metars)
+                    self.metars.append(metar)
+                self.metar_ids.append(mid)
+
+    @classmethod
+    def from_xml(cls, xml):
+        """Build the timeline from the <weather> children of a <flight>"""
+        def observations():
+            for w in xml.iterchildren('weather'):
+                t = w.get('t')
+                if t is None:
+                    continue
+                windeast = w.get('windeast')
+                windnorth = w.get('windnorth')
+                yield APIWeatherObservation((
+                    float(t),
+                    None if windeast is None else float(windeast),
+                    None if windnorth is None else float(windnorth),
+                    w.text or None,
+                ))
+        return cls(observations())
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, idx):
+        mid = self.metar_ids[idx]
+        return APIWeatherObservation((
+            self.times[idx],
+            _from_float(self.windeast[idx]),
+            _from_float(self.windnorth[idx]),
+            None if mid < 0 else self.metars[mid],
+        ))
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    def index_at(self, t):
+        """Index of the observation in effect at time t, or None
+
+        The observation in effect is the last one at or before t.
+        """
+        idx = bisect.bisect_right(self.times, t) - 1
+        if idx < 0:
+            return None
+        return idx
+
+    def at(self, t):
+        """Observation in effect at time t, or None before the first one"""
+        idx = self.index_at(t)
+        if idx is None:
+            return None
+        return self[idx]
+
+    def wind_at(self, t):
+        """Wind (east, north) in m/s in effect at time t
+
+        Either component is None if no wind is known at that time.
+        """
+        idx = self.index_at(t)
+        if idx is None:
+            return None, None
+        return _from_float(self.windeast[idx]), _from_float(self.windnorth[idx])
+
+    def interpolate_wind(self, times):
+        """Linearly interpolate the wind at many timestamps
+
+        :param times: sequence of timestamps in seconds since beginning
+        of flight, for example TrackIndex.times. Sorted input is faster.
+
+        Returns a tuple of two arrays of floats (east, north). Values are
+        NaN before the first observation, and on either side of an
+        observation without wind. After the last observation its wind
+        is held.
+        """
+        xs = self.times
+        east = array.array('d')
+        north = array.array('d')
+        n = len(xs)
+        lo = 0
+        prev = None
+        for t in times:
+            t = float(t)
+            if prev is None or t < prev:
+                lo = 0
+            prev = t
+            idx = bisect.bisect_right(xs, t, lo) - 1
+            lo = max(idx, 0)
+            if idx < 0:
+                east.append(_NAN)
+                north.append(_NAN)
+            elif idx == n - 1 or xs[idx] == t:
+                east.append(self.windeast[idx])
+                north.append(self.windnorth[idx])
+            else:
+                frac = (t - xs[idx]) / (xs[idx + 1] - xs[idx])
+                e0 = self.windeast[idx]
+                n0 = self.windnorth[idx]
+                east.append(e0 + frac * (self.windeast[idx + 1] - e0))
+                north.append(n0 + frac * (self.windnorth[idx + 1] - n0))
+        return east, north